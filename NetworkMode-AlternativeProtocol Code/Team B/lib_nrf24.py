@@ -26,6 +26,7 @@
 
 import sys
 import time
+from collections import deque
 
 if __name__ == '__main__':
     print (sys.argv[0], 'is an importable module:')
@@ -38,6 +39,233 @@ def _BV(x):
     return 1 << x
 
 
+# Payload types that can be copied into an SPI frame without per-byte conversion
+_BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+# Finest clock available, for the profiler
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class SpiProfiler(object):
+    # Stands in for the spidev object of a driver while profiling is enabled.
+    # Every xfer2() is accounted to the outermost profiled driver method it was
+    # issued from ("other" outside of them), and the SPI traffic is decoded to
+    # count frames and TX/RX outcomes. The driver only swaps it in on request,
+    # so with profiling disabled the hot path is untouched.
+    #
+    # Latency histograms use log2 buckets in microseconds: bucket 0 is < 1 us,
+    # bucket n is [2^(n-1), 2^n) us, the last one takes everything above.
+
+    HISTOGRAM_BUCKETS = 24
+
+    # frames_tx      payloads uploaded to the TX FIFO
+    # frames_rx      payloads read from the RX FIFO
+    # tx_ds, max_rt  TX_DS / MAX_RT flags cleared by the driver
+    # tx_fifo_full   payloads uploaded while the TX FIFO was full (lost)
+    # rx_fifo_full   RX FIFO drains that found 3 frames queued (later ones may be lost)
+    COUNTERS = ('frames_tx', 'frames_rx', 'tx_ds', 'max_rt', 'tx_fifo_full', 'rx_fifo_full')
+
+    # Datasheet values, so that the decoding works for both drivers
+    _W_REGISTER_STATUS = 0x27
+    _W_TX_PAYLOAD = (0xA0, 0xB0)
+    _R_RX_PAYLOAD = 0x61
+    _TX_DS = 0x20
+    _MAX_RT = 0x10
+    _TX_FULL = 0x01
+    _RX_P_NO = 0x0E
+
+    def __init__(self, spidev=None):
+        self.spidev = spidev
+        self.scope = None
+        self.reset()
+
+    def __getattr__(self, name):
+        # open(), close() and the rest of the spidev API go straight through
+        return getattr(self.spidev, name)
+
+    def reset(self):
+        self.methods = {}
+        self.counters = dict((name, 0) for name in SpiProfiler.COUNTERS)
+        self.rx_run = 0
+        self.since = time.time()
+
+    def attach(self, radio, methods):
+        # Put the profiler between the radio and its spidev and wrap the named methods
+        self.spidev = radio.spidev
+        radio.spidev = self
+        for name in methods:
+            setattr(radio, name, self.wrap(name, getattr(radio, name)))
+
+    def detach(self, radio, methods):
+        if radio.spidev is self:
+            radio.spidev = self.spidev
+        for name in methods:
+            radio.__dict__.pop(name, None)
+
+    def wrap(self, name, method):
+        def profiled(*args, **kwargs):
+            if self.scope is not None:
+                return method(*args, **kwargs)
+            self.scope = name
+            start = _clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = _clock() - start
+                self.scope = None
+                stats = self._method(name)
+                stats['calls'] += 1
+                stats['call_time'] += elapsed
+                stats['call_histogram'][self._bucket(elapsed)] += 1
+        return profiled
+
+    def xfer2(self, buf, *args):
+        start = _clock()
+        resp = self.spidev.xfer2(buf, *args)
+        elapsed = _clock() - start
+
+        stats = self._method(self.scope or 'other')
+        stats['xfers'] += 1
+        stats['bytes'] += len(buf)
+        stats['spi_time'] += elapsed
+        stats['xfer_histogram'][self._bucket(elapsed)] += 1
+        self._decode(buf, resp[0])
+        return resp
+
+    xfer = xfer2
+
+    def _method(self, name):
+        stats = self.methods.get(name)
+        if stats is None:
+            stats = self.methods[name] = {'calls': 0, 'call_time': 0.0, 'xfers': 0, 'bytes': 0, 'spi_time': 0.0,
+                                          'call_histogram': [0] * SpiProfiler.HISTOGRAM_BUCKETS,
+                                          'xfer_histogram': [0] * SpiProfiler.HISTOGRAM_BUCKETS}
+        return stats
+
+    @staticmethod
+    def _bucket(seconds):
+        return min(int(seconds * 1000000).bit_length(), SpiProfiler.HISTOGRAM_BUCKETS - 1)
+
+    def _decode(self, buf, status):
+        cmd = buf[0]
+        counters = self.counters
+        if status & SpiProfiler._RX_P_NO == SpiProfiler._RX_P_NO:
+            self.rx_run = 0     # RX FIFO seen empty
+
+        if cmd == SpiProfiler._R_RX_PAYLOAD:
+            counters['frames_rx'] += 1
+            self.rx_run += 1
+            if self.rx_run == 3:
+                counters['rx_fifo_full'] += 1
+        elif cmd in SpiProfiler._W_TX_PAYLOAD:
+            counters['frames_tx'] += 1
+            if status & SpiProfiler._TX_FULL:
+                counters['tx_fifo_full'] += 1
+        elif cmd == SpiProfiler._W_REGISTER_STATUS and len(buf) > 1:
+            cleared = buf[1] & status
+            if cleared & SpiProfiler._TX_DS:
+                counters['tx_ds'] += 1
+            if cleared & SpiProfiler._MAX_RT:
+                counters['max_rt'] += 1
+
+    def snapshot(self, reset=False):
+        # Copy of everything counted since the last reset, as plain dicts and lists
+        methods = {}
+        for name, stats in self.methods.items():
+            stats = dict(stats)
+            stats['call_histogram'] = list(stats['call_histogram'])
+            stats['xfer_histogram'] = list(stats['xfer_histogram'])
+            methods[name] = stats
+        snap = {'elapsed': time.time() - self.since, 'counters': dict(self.counters), 'methods': methods}
+        if reset:
+            self.reset()
+        return snap
+
+    @staticmethod
+    def format(snap):
+        lines = ["SPI profile over %.3f s: %s" % (snap['elapsed'], ", ".join(
+            "%s=%d" % (name, snap['counters'][name]) for name in SpiProfiler.COUNTERS))]
+        for name, stats in sorted(snap['methods'].items(), key=lambda item: -item[1]['spi_time']):
+            lines.append("  %-18s calls %6d  xfers %7d  bytes %8d  spi %8.2f ms  total %8.2f ms" % (
+                name, stats['calls'], stats['xfers'], stats['bytes'], stats['spi_time'] * 1000,
+                stats['call_time'] * 1000))
+        return "\n".join(lines)
+
+
+
+class TxWaitStats(object):
+    # Completion jitter of the airtime TX wait: how long after the computed
+    # airtime the TX_DS / MAX_RT outcome was actually seen, and how many
+    # STATUS polls it took.
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.timeouts = 0
+        self.polls = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, jitter, polls):
+        self.count += 1
+        self.polls += polls
+        self.total += jitter
+        self.total_sq += jitter * jitter
+        self.min = jitter if self.min is None else min(self.min, jitter)
+        self.max = jitter if self.max is None else max(self.max, jitter)
+
+    def report(self):
+        # Jitter figures in seconds
+        frames = self.count + self.timeouts
+        mean = self.total / self.count if self.count else 0.0
+        stdev = (max(0.0, self.total_sq / self.count - mean * mean) ** 0.5) if self.count else 0.0
+        return {'frames': frames, 'timeouts': self.timeouts, 'mean': mean, 'stdev': stdev,
+                'min': self.min, 'max': self.max, 'polls_per_frame': self.polls / float(frames) if frames else 0.0}
+
+
+class RadioProfile(object):
+    # Declarative radio configuration for NRF24.apply() and NRF24.begin().
+    # Settings left as None are not touched. Addresses are MSB first, as for
+    # openWritingPipe() / openReadingPipe(). rx_pipes maps pipe numbers to
+    # addresses and opens those pipes (None closes one), the others keep their
+    # state.
+    # retries is a (delay, count) pair as for setRetries(). dynamic_ack lets
+    # write(..., no_ack=True) send single frames that are not auto-acked.
+
+    FIELDS = ('channel', 'data_rate', 'pa_level', 'crc_length', 'payload_size', 'auto_ack', 'dynamic_payloads',
+              'ack_payloads', 'dynamic_ack', 'retries', 'tx_address', 'rx_pipes')
+
+    def __init__(self, channel=None, data_rate=None, pa_level=None, crc_length=None, payload_size=None,
+                 auto_ack=None, dynamic_payloads=None, ack_payloads=None, dynamic_ack=None, retries=None,
+                 tx_address=None, rx_pipes=None):
+        self.channel = channel
+        self.data_rate = data_rate
+        self.pa_level = pa_level
+        self.crc_length = crc_length
+        self.payload_size = payload_size
+        self.auto_ack = auto_ack
+        self.dynamic_payloads = dynamic_payloads
+        self.ack_payloads = ack_payloads
+        self.dynamic_ack = dynamic_ack
+        self.retries = retries
+        self.tx_address = tx_address
+        self.rx_pipes = rx_pipes
+
+    def settings(self):
+        return dict((name, getattr(self, name)) for name in RadioProfile.FIELDS if getattr(self, name) is not None)
+
+    def merged(self, other):
+        # Copy of this profile with the settings of other (may be None) on top
+        settings = self.settings()
+        if other is not None:
+            settings.update(other.settings())
+        return RadioProfile(**settings)
+
+
 class NRF24:
     MAX_CHANNEL = 127
     MAX_PAYLOAD_SIZE = 32
@@ -145,6 +373,7 @@ class NRF24:
     R_RX_PL_WID = 0x60
     R_RX_PAYLOAD = 0x61
     W_TX_PAYLOAD = 0xA0
+    W_TX_PAYLOAD_NO_ACK = 0xB0
     W_ACK_PAYLOAD = 0xA8
     FLUSH_TX = 0xE1
     FLUSH_RX = 0xE2
@@ -177,6 +406,31 @@ class NRF24:
     child_payload_size = [RX_PW_P0, RX_PW_P1, RX_PW_P2, RX_PW_P3, RX_PW_P4, RX_PW_P5]
     child_pipe_enable = [ERX_P0, ERX_P1, ERX_P2, ERX_P3, ERX_P4, ERX_P5]
 
+    # Single byte configuration registers mirrored by the shadow copy. STATUS,
+    # OBSERVE_TX, RPD and FIFO_STATUS change on their own and are never cached.
+    shadow_registers = frozenset([CONFIG, EN_AA, EN_RXADDR, SETUP_AW, SETUP_RETR, RF_CH, RF_SETUP,
+                                  RX_PW_P0, RX_PW_P1, RX_PW_P2, RX_PW_P3, RX_PW_P4, RX_PW_P5, DYNPD, FEATURE])
+
+    # TX completion wait strategies, see setTxWait()
+    TX_WAIT_POLL = 'poll'
+    TX_WAIT_AIRTIME = 'airtime'
+    TX_SETTLE = 130 / 1000000.0         # standby -> TX (and TX -> RX for the ACK)
+    RX_SETTLE = 130 / 1000000.0         # standby -> RX, PLL lock on a new channel
+    RPD_SETTLE = 170 / 1000000.0        # standby -> RX plus the 40 us RPD filter delay
+    PD2STBY = 1500 / 1000000.0          # power down -> standby, crystal oscillator start-up
+    TX_WAIT_GUARD = 100 / 1000000.0     # wake up this early to absorb sleep overshoot
+    TX_WAIT_SPIN = 500 / 1000000.0      # then spin on STATUS at most this long past the airtime
+
+    # Multi-byte address registers (and the LSB registers of pipes 2-5), cached
+    # apart from the shadow copy so that apply() can skip unchanged addresses
+    address_registers = frozenset([RX_ADDR_P0, RX_ADDR_P1, RX_ADDR_P2, RX_ADDR_P3, RX_ADDR_P4, RX_ADDR_P5, TX_ADDR])
+
+    # Driver methods that get their own entry in the SPI profile
+    profiled_methods = ('write', 'startWrite', 'write_burst', 'write_payload', 'available', 'irqWait', 'read',
+                        'read_payload', 'read_payload_into', 'read_all', 'startListening', 'stopListening',
+                        'powerUp', 'powerDown', 'hop', 'senseCarrier', 'get_status', 'whatHappened', 'flush_rx',
+                        'flush_tx', 'sync_registers')
+
     GPIO = None
     spidev = None
 
@@ -195,6 +449,29 @@ class NRF24:
         self.dynamic_payloads_enabled = False #*< Whether dynamic payloads are enabled.
         self.ack_payload_length = 5 #*< Dynamic size of pending ack payload.
         self.pipe0_reading_address = None #*< Last address set on pipe 0 for reading.
+        self.irq_pin = None #*< GPIO wired to the (active low) IRQ output, if any.
+        self.listening = False #*< Between startListening() and stopListening().
+
+        # Preallocated SPI frames, indexed by payload length, so that the per-frame
+        # payload path never builds a new list.
+        self._tx_frames = [bytearray(n + 1) for n in range(NRF24.MAX_PAYLOAD_SIZE + 1)]
+        self._rx_frames = [[NRF24.R_RX_PAYLOAD] + [NRF24.NOP] * n for n in range(NRF24.MAX_PAYLOAD_SIZE + 1)]
+        self._padding = memoryview(bytearray(NRF24.MAX_PAYLOAD_SIZE))
+
+        # Shadow copy of the configuration registers. Read-modify-write sequences
+        # take the current value from here instead of reading it over SPI.
+        # With verify_registers set every cached read goes back to the chip.
+        self._shadow = {}
+        self._addresses = {}
+        self.verify_registers = False
+
+        # SpiProfiler while profiling is enabled, see enable_profiling()
+        self.profiler = None
+
+        # How write() waits for the frame to go out, see setTxWait()
+        self.tx_wait = NRF24.TX_WAIT_POLL
+        self.tx_wait_stats = TxWaitStats()
+        self.tx_started_at = 0.0    # when startWrite() raised CE
 
     def ce(self, level):
         if self.ce_pin == 0:
@@ -217,6 +494,8 @@ class NRF24:
 
         resp = self.spidev.xfer2(buf)
         if blen == 1:
+            if reg in NRF24.shadow_registers:
+                self._shadow[reg] = resp[1]
             return resp[1]
 
         return resp[1:blen + 1]
@@ -242,32 +521,85 @@ class NRF24:
         else:
             raise Exception("Value must be int or list")
         
-        return self.spidev.xfer2(buf)[0]
+        if len(buf) == 2 and reg in NRF24.shadow_registers:
+            self._shadow[reg] = buf[1]
+        elif reg in NRF24.address_registers:
+            self._addresses[reg] = buf[1:]
 
+        return self.spidev.xfer2(buf)[0]
 
-    def write_payload(self, buf):
+    def read_register_cached(self, reg):
+        # Serve configuration registers from the shadow copy when possible
+        if not self.verify_registers:
+            value = self._shadow.get(reg)
+            if value is not None:
+                return value
+        return self.read_register(reg)
+
+    def update_register(self, reg, value):
+        # Only issue the SPI write when the register actually changes.
+        # Returns the status byte, or None if nothing was written.
+        if not self.verify_registers and self._shadow.get(reg) == value:
+            return None
+        return self.write_register(reg, value)
+
+    def sync_registers(self):
+        # Re-read every shadowed register from the chip, e.g. after a brown-out
+        # or to check that the copy is still coherent.
+        # Returns the list of registers whose cached value was stale.
+        stale = []
+        for reg in sorted(NRF24.shadow_registers):
+            cached = self._shadow.get(reg)
+            if self.read_register(reg) != cached and cached is not None:
+                stale.append(reg)
+        return stale
+
+    def enable_profiling(self):
+        # Route SPI traffic through a SpiProfiler and return it.
+        # Call profiler.snapshot(reset=True) to collect and restart the counts.
+        if self.profiler is None:
+            self.profiler = SpiProfiler()
+            self.profiler.attach(self, NRF24.profiled_methods)
+        return self.profiler
+
+    def disable_profiling(self):
+        # Back to the bare spidev object. Returns the profiler with its final counts.
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.detach(self, NRF24.profiled_methods)
+            self.profiler = None
+        return profiler
+
+    def write_payload(self, buf, no_ack=False):
+        # bytes, bytearray and memoryview payloads are copied straight into the
+        # preallocated frame. Lists of ints / chars still go byte by byte.
+        # no_ack marks the frame as not to be acknowledged (needs dynamic_ack).
         data_len = min(self.payload_size, len(buf))
         blank_len = 0
         if not self.dynamic_payloads_enabled:
             blank_len = self.payload_size - data_len
 
-        txbuffer = [NRF24.W_TX_PAYLOAD]
-        for n in buf:
-            t = type(n)
-            if t is str:
-                txbuffer.append(ord(n))
-            elif t is int:
-                txbuffer.append(n)
-            else:
-                raise Exception("Only ints and chars are supported: Found " + str(t))
+        txbuffer = self._tx_frames[data_len + blank_len]
+        txbuffer[0] = NRF24.W_TX_PAYLOAD_NO_ACK if no_ack else NRF24.W_TX_PAYLOAD
+        if isinstance(buf, _BUFFER_TYPES):
+            txbuffer[1:data_len + 1] = buf[:data_len]
+        else:
+            for i in range(data_len):
+                n = buf[i]
+                t = type(n)
+                if t is str:
+                    txbuffer[i + 1] = ord(n)
+                elif t is int:
+                    txbuffer[i + 1] = n
+                else:
+                    raise Exception("Only ints and chars are supported: Found " + str(t))
 
         if blank_len != 0:
-            blank = [0x00 for i in range(blank_len)]
-            txbuffer.extend(blank)
+            txbuffer[data_len + 1:] = self._padding[:blank_len]
 
         return self.spidev.xfer2(txbuffer)
 
-    def read_payload(self, buf, buf_len=-1):
+    def _read_payload_frame(self, buf_len):
         if buf_len < 0:
             buf_len = self.payload_size
         data_len = min(self.payload_size, buf_len)
@@ -275,14 +607,21 @@ class NRF24:
         if not self.dynamic_payloads_enabled:
             blank_len = self.payload_size - data_len
 
-        txbuffer = [NRF24.NOP for i in range(0, blank_len + data_len + 1)]
-        txbuffer[0] = NRF24.R_RX_PAYLOAD
+        return data_len, self.spidev.xfer2(self._rx_frames[blank_len + data_len])
 
-        payload = self.spidev.xfer2(txbuffer)
+    def read_payload(self, buf, buf_len=-1):
+        data_len, payload = self._read_payload_frame(buf_len)
         del buf[:]
         buf.extend(payload[1:data_len + 1])
         return data_len
 
+    def read_payload_into(self, buf, buf_len=-1):
+        # Fills the start of a caller-owned bytearray and returns how many bytes
+        # were written. buf is never resized, so it can be reused for every frame.
+        data_len, payload = self._read_payload_frame(buf_len)
+        buf[:data_len] = payload[1:data_len + 1]
+        return data_len
+
     def flush_rx(self):
         return self.spidev.xfer2([NRF24.FLUSH_RX])[0]
 
@@ -334,10 +673,20 @@ class NRF24:
 
     def setChannel(self, channel):
         self.channel = min(max(0, channel), NRF24.MAX_CHANNEL)
-        self.write_register(NRF24.RF_CH, self.channel)
+        self.update_register(NRF24.RF_CH, self.channel)
+
+    def hop(self, channel):
+        # Retune a listening radio: CE low, one RF_CH write, CE high, then wait
+        # for the PLL to lock. Unlike stopListening() / startListening() nothing
+        # is flushed, so frames already in the RX FIFO survive the hop.
+        self.channel = min(max(0, channel), NRF24.MAX_CHANNEL)
+        self.ce(NRF24.LOW)
+        self.update_register(NRF24.RF_CH, self.channel)
+        self.ce(NRF24.HIGH)
+        time.sleep(NRF24.RX_SETTLE)
 
     def getChannel(self):
-        return self.read_register(NRF24.RF_CH)
+        return self.read_register_cached(NRF24.RF_CH)
 
     def setPayloadSize(self, size):
         self.payload_size = min(max(size, 1), NRF24.MAX_PAYLOAD_SIZE)
@@ -365,56 +714,180 @@ class NRF24:
         print ("CRC Length\t = %s" % NRF24.crclength_e_str_P[self.getCRCLength()])
         print ("PA Power\t = %s" % NRF24.pa_dbm_e_str_P[self.getPALevel()])
 
-    def begin(self, csn_pin, ce_pin=0):   # csn & ce are RF24 terminology. csn = SPI's CE!
+    def begin(self, csn_pin, ce_pin=0, irq_pin=None, profile=None):   # csn & ce are RF24 terminology. csn = SPI's CE!
         # Initialize SPI bus..
         # ce_pin is for the rx=listen or tx=trigger pin on RF24 (they call that ce !!!)
         # CE optional (at least in some circumstances, eg fixed PTX PRX roles, no powerdown)
         # CE seems to hold itself as (sufficiently) HIGH, but tie HIGH is safer!
+        # irq_pin is optional too. Without it available() can only poll STATUS.
+        # profile (a RadioProfile) replaces the usual string of setters after begin().
+        # Returns False, with the radio left unconfigured, if the chip does not answer.
         self.spidev.open(0, csn_pin)
         self.ce_pin = ce_pin
+        self.irq_pin = irq_pin
+        self._shadow = {}
+        self._addresses = {}
 
         if ce_pin:
             self.GPIO.setup(self.ce_pin, self.GPIO.OUT)
 
-        time.sleep(5 / 1000000.0)
-
-        # Set 1500uS (minimum for 32B payload in ESB@250KBPS) timeouts, to make testing a little easier
-        # WARNING: If this is ever lowered, either 250KBS mode with AA is broken or maximum packet
-        # sizes must never be used. See documentation for a more complete explanation.
-        self.write_register(NRF24.SETUP_RETR, (0b0100 << NRF24.ARD) | 0b1111)
+        if irq_pin is not None:
+            self.GPIO.setup(self.irq_pin, self.GPIO.IN, pull_up_down=self.GPIO.PUD_UP)
 
-        # Restore our default PA level
-        self.setPALevel(NRF24.PA_MAX)
+        # The chip ignores SPI for a while after power on. If it never answers
+        # (not wired, no power) there is nothing to configure
+        if not self.waitReady():
+            return False
 
-        # Determine if this is a p or non-p RF24 module and then
-        # reset our data rate back to default value. This works
+        # Determine if this is a p or non-p RF24 module. This works
         # because a non-P variant won't allow the data rate to
         # be set to 250Kbps.
         if self.setDataRate(NRF24.BR_250KBPS):
             self.p_variant = True
 
-        # Then set the data rate to the slowest (and most reliable) speed supported by all
-        # hardware.
-        self.setDataRate(NRF24.BR_1MBPS)
-
-        # Initialize CRC and request 2-byte (16bit) CRC
-        self.setCRCLength(NRF24.CRC_16)
-
-        # Disable dynamic payloads, to match dynamic_payloads_enabled setting
-        self.write_register(NRF24.DYNPD, 0)
+        # Our defaults, with the caller's profile on top, written in one pass.
+        # Set 1500uS (minimum for 32B payload in ESB@250KBPS) timeouts, to make testing a little easier
+        # WARNING: If this is ever lowered, either 250KBS mode with AA is broken or maximum packet
+        # sizes must never be used. See documentation for a more complete explanation.
+        # The data rate defaults to the slowest (and most reliable) speed supported by all hardware,
+        # with a 2-byte (16bit) CRC and dynamic payloads off.
+        defaults = RadioProfile(retries=(0b0100, 0b1111), pa_level=NRF24.PA_MAX, data_rate=NRF24.BR_1MBPS,
+                                crc_length=NRF24.CRC_16, dynamic_payloads=False, channel=self.channel)
+        self.apply(defaults.merged(profile))
 
         # Reset current status
         # Notice reset and flush is the last thing we do
         self.write_register(NRF24.STATUS, _BV(NRF24.RX_DR) | _BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT))
 
-        # Set up default configuration.  Callers can always change it later.
-        # This channel should be universally safe and not bleed over into adjacent
-        # spectrum.
-        self.setChannel(self.channel)
-
         # Flush buffers
         self.flush_rx()
         self.flush_tx()
+        return True
+
+    def waitReady(self, timeout=1.0):
+        # Poll until the chip answers sensibly (STATUS bit 7 is always 0 and
+        # SETUP_AW is never 0), instead of sleeping through its power on reset.
+        # Returns False if it did not within timeout seconds.
+        deadline = time.time() + timeout
+        while True:
+            status, aw = self.spidev.xfer2([NRF24.R_REGISTER | NRF24.SETUP_AW, NRF24.NOP])
+            if not status & 0x80 and 1 <= aw <= 3:
+                return True
+            if time.time() > deadline:
+                return False
+            time.sleep(1 / 1000.0)
+
+    def apply(self, profile):
+        # Bring the radio to the configuration in profile (a RadioProfile) in as
+        # few SPI transactions as possible: the target register values are
+        # computed against the shadow copy and only registers that change are
+        # written. Returns the number of registers written.
+        regs = {}
+
+        def current(reg):
+            if reg not in regs:
+                regs[reg] = self.read_register_cached(reg)
+            return regs[reg]
+
+        if profile.payload_size is not None:
+            self.setPayloadSize(profile.payload_size)
+
+        if profile.channel is not None:
+            self.channel = min(max(0, profile.channel), NRF24.MAX_CHANNEL)
+            regs[NRF24.RF_CH] = self.channel
+
+        if profile.crc_length is not None:
+            config = current(NRF24.CONFIG) & ~(_BV(NRF24.EN_CRC) | _BV(NRF24.CRCO))
+            if profile.crc_length == NRF24.CRC_8:
+                config |= _BV(NRF24.EN_CRC)
+            elif profile.crc_length == NRF24.CRC_16:
+                config |= _BV(NRF24.EN_CRC) | _BV(NRF24.CRCO)
+            regs[NRF24.CONFIG] = config
+
+        if profile.data_rate is not None:
+            setup = current(NRF24.RF_SETUP) & ~(_BV(NRF24.RF_DR_LOW) | _BV(NRF24.RF_DR_HIGH))
+            if profile.data_rate == NRF24.BR_250KBPS:
+                setup |= _BV(NRF24.RF_DR_LOW)
+            elif profile.data_rate == NRF24.BR_2MBPS:
+                setup |= _BV(NRF24.RF_DR_HIGH)
+            self.wide_band = profile.data_rate == NRF24.BR_2MBPS
+            regs[NRF24.RF_SETUP] = setup
+
+        if profile.pa_level is not None:
+            setup = current(NRF24.RF_SETUP) & ~(_BV(NRF24.RF_PWR_LOW) | _BV(NRF24.RF_PWR_HIGH))
+            if profile.pa_level in (NRF24.PA_MAX, NRF24.PA_ERROR):
+                setup |= _BV(NRF24.RF_PWR_LOW) | _BV(NRF24.RF_PWR_HIGH)
+            elif profile.pa_level == NRF24.PA_HIGH:
+                setup |= _BV(NRF24.RF_PWR_HIGH)
+            elif profile.pa_level == NRF24.PA_LOW:
+                setup |= _BV(NRF24.RF_PWR_LOW)
+            regs[NRF24.RF_SETUP] = setup
+
+        if profile.auto_ack is not None:
+            regs[NRF24.EN_AA] = 0b111111 if profile.auto_ack else 0
+
+        if profile.retries is not None:
+            delay, count = profile.retries
+            regs[NRF24.SETUP_RETR] = (delay & 0xf) << NRF24.ARD | (count & 0xf)
+
+        if profile.dynamic_payloads is not None:
+            if profile.dynamic_payloads:
+                regs[NRF24.FEATURE] = current(NRF24.FEATURE) | _BV(NRF24.EN_DPL)
+                regs[NRF24.DYNPD] = 0b111111
+            else:
+                # ACK payloads are dynamic payloads as well
+                regs[NRF24.FEATURE] = current(NRF24.FEATURE) & ~(_BV(NRF24.EN_DPL) | _BV(NRF24.EN_ACK_PAY))
+                regs[NRF24.DYNPD] = 0
+            self.dynamic_payloads_enabled = bool(profile.dynamic_payloads)
+
+        if profile.ack_payloads is not None:
+            if profile.ack_payloads:
+                regs[NRF24.FEATURE] = current(NRF24.FEATURE) | _BV(NRF24.EN_ACK_PAY) | _BV(NRF24.EN_DPL)
+                regs[NRF24.DYNPD] = current(NRF24.DYNPD) | _BV(NRF24.DPL_P1) | _BV(NRF24.DPL_P0)
+            else:
+                regs[NRF24.FEATURE] = current(NRF24.FEATURE) & ~_BV(NRF24.EN_ACK_PAY)
+
+        if profile.dynamic_ack is not None:
+            if profile.dynamic_ack:
+                regs[NRF24.FEATURE] = current(NRF24.FEATURE) | _BV(NRF24.EN_DYN_ACK)
+            else:
+                regs[NRF24.FEATURE] = current(NRF24.FEATURE) & ~_BV(NRF24.EN_DYN_ACK)
+
+        # Addresses, as openWritingPipe() / openReadingPipe() would write them
+        addresses = []
+        if profile.tx_address is not None:
+            addresses.append((NRF24.RX_ADDR_P0, profile.tx_address, 5))
+            addresses.append((NRF24.TX_ADDR, profile.tx_address, 5))
+            regs[NRF24.RX_PW_P0] = self.payload_size
+        for child, address in sorted((profile.rx_pipes or {}).items()):
+            if child == 0:
+                self.pipe0_reading_address = address
+            if address is None:
+                regs[NRF24.EN_RXADDR] = current(NRF24.EN_RXADDR) & ~_BV(NRF24.child_pipe_enable[child])
+                continue
+            addresses.append((NRF24.child_pipe[child], address, 5 if child < 2 else 1))
+            regs[NRF24.child_payload_size[child]] = self.payload_size
+            regs[NRF24.EN_RXADDR] = current(NRF24.EN_RXADDR) | _BV(NRF24.child_pipe_enable[child])
+
+        written = 0
+        # FEATURE goes first: on chips that need ACTIVATE the dynamic payload
+        # registers (DYNPD) ignore writes until the features are on
+        for reg in sorted(regs, key=lambda reg: (reg != NRF24.FEATURE, reg)):
+            if self.update_register(reg, regs[reg]) is None:
+                continue
+            written += 1
+            if reg == NRF24.FEATURE and regs[reg] and self.read_register(reg) != regs[reg]:
+                # Features are not activated on this chip yet
+                self.toggle_features()
+                self.write_register(reg, regs[reg])
+
+        for reg, address, length in addresses:
+            wire = [int(address[len(address) - i - 1] & 0xff) for i in range(min(len(address), length))]
+            if self.verify_registers or self._addresses.get(reg) != wire:
+                self.write_register(reg, address, length)
+                written += 1
+
+        return written
 
     def end(self):
         if self.spidev:
@@ -422,7 +895,7 @@ class NRF24:
             self.spidev = None
 
     def startListening(self):
-        self.write_register(NRF24.CONFIG, self.read_register(NRF24.CONFIG) | _BV(NRF24.PWR_UP) | _BV(NRF24.PRIM_RX))
+        self.update_register(NRF24.CONFIG, self.read_register_cached(NRF24.CONFIG) | _BV(NRF24.PWR_UP) | _BV(NRF24.PRIM_RX))
         self.write_register(NRF24.STATUS, _BV(NRF24.RX_DR) | _BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT))
 
         # Restore the pipe0 address, if exists
@@ -431,35 +904,43 @@ class NRF24:
 
         # Go!
         self.ce(NRF24.HIGH)
+        self.listening = True
 
         # wait for the radio to come up (130us actually only needed)
         time.sleep(130 / 1000000.0)
 
     def stopListening(self):
         self.ce(NRF24.LOW)
+        self.listening = False
         self.flush_tx()
         self.flush_rx()
 
     def powerDown(self):
-        self.write_register(NRF24.CONFIG, self.read_register(NRF24.CONFIG) & ~_BV(NRF24.PWR_UP))
+        self.update_register(NRF24.CONFIG, self.read_register_cached(NRF24.CONFIG) & ~_BV(NRF24.PWR_UP))
 
     def powerUp(self):
-        self.write_register(NRF24.CONFIG, self.read_register(NRF24.CONFIG) | _BV(NRF24.PWR_UP))
-        time.sleep(150 / 1000000.0)
+        # Nothing to wait for if the radio is already powered up
+        if self.update_register(NRF24.CONFIG, self.read_register_cached(NRF24.CONFIG) | _BV(NRF24.PWR_UP)) is not None:
+            time.sleep(150 / 1000000.0)
 
-    def write(self, buf):
+    def write(self, buf, no_ack=False):
         # Begin the write
-        self.startWrite(buf)
+        self.startWrite(buf, no_ack)
 
         timeout = self.getMaxTimeout() #s to wait for timeout
-        sent_at = time.time()
 
-        while True:
-            #status = self.read_register(NRF24.OBSERVE_TX, 1)
-            status = self.get_status()
-            if (status & (_BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT))) or (time.time() - sent_at > timeout ):
-                break
-            time.sleep(10 / 1000000.0)
+        if self.tx_wait == NRF24.TX_WAIT_AIRTIME:
+            # Same length write_payload() put on air
+            length = min(len(buf), self.payload_size) if self.dynamic_payloads_enabled else self.payload_size
+            self.waitTxAirtime(self.getAirtime(length, no_ack), timeout)
+        else:
+            sent_at = time.time()
+            while True:
+                #status = self.read_register(NRF24.OBSERVE_TX, 1)
+                status = self.get_status()
+                if (status & (_BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT))) or (time.time() - sent_at > timeout ):
+                    break
+                time.sleep(10 / 1000000.0)
         #obs = self.read_register(NRF24.OBSERVE_TX)
         #self.print_observe_tx(obs)
         #self.print_status(status)
@@ -477,14 +958,74 @@ class NRF24:
 
         return result
 
-    def startWrite(self, buf):
+    def setTxWait(self, strategy):
+        # TX_WAIT_POLL: poll STATUS every 10 us until the frame is out (default)
+        # TX_WAIT_AIRTIME: sleep through the computed airtime, then spin on STATUS.
+        # Far fewer SPI transactions per frame, which matters when the RX radio
+        # shares the bus. Its jitter is collected in tx_wait_stats.
+        self.tx_wait = strategy
+        self.tx_wait_stats.reset()
+
+    def getAirtime(self, length, no_ack=False):
+        # Seconds from the CE pulse until TX_DS is expected for a payload of
+        # length bytes: TX settling, preamble, address, packet control field,
+        # payload and CRC, plus the ACK round trip if pipe 0 is auto-acked and
+        # the frame is not sent with no_ack.
+        setup = self.read_register_cached(NRF24.RF_SETUP)
+        if setup & _BV(NRF24.RF_DR_LOW):
+            rate, preamble = 250000.0, 1
+        elif setup & _BV(NRF24.RF_DR_HIGH):
+            rate, preamble = 2000000.0, 2
+        else:
+            rate, preamble = 1000000.0, 1
+
+        config = self.read_register_cached(NRF24.CONFIG)
+        crc = 0
+        if config & _BV(NRF24.EN_CRC):
+            crc = 2 if config & _BV(NRF24.CRCO) else 1
+        address = (self.read_register_cached(NRF24.SETUP_AW) & 0x03) + 2
+
+        overhead = 8 * (preamble + address + crc) + 9
+        airtime = NRF24.TX_SETTLE + (overhead + 8 * length) / rate
+        if not no_ack and self.read_register_cached(NRF24.EN_AA) & _BV(NRF24.ENAA_P0):
+            airtime += NRF24.TX_SETTLE + overhead / rate
+        return airtime
+
+    def waitTxAirtime(self, airtime, timeout):
+        # Wait for the frame startWrite() triggered to go out: sleep until
+        # shortly before its airtime is over, spin on STATUS for a bounded while,
+        # then fall back to 10 us polling (retransmits) until timeout.
+        # Returns the last STATUS.
+        sent_at = self.tx_started_at
+        expected = sent_at + airtime
+        delay = expected - NRF24.TX_WAIT_GUARD - _clock()
+        if delay > 0:
+            time.sleep(delay)
+
+        polls = 0
+        while True:
+            status = self.get_status()
+            polls += 1
+            now = _clock()
+            if status & (_BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT)):
+                self.tx_wait_stats.add(now - expected, polls)
+                return status
+            if now - sent_at > timeout:
+                self.tx_wait_stats.timeouts += 1
+                self.tx_wait_stats.polls += polls
+                return status
+            if now > expected + NRF24.TX_WAIT_SPIN:
+                time.sleep(10 / 1000000.0)
+
+    def startWrite(self, buf, no_ack=False):
         # Transmitter power-up
-        self.write_register(NRF24.CONFIG, (self.read_register(NRF24.CONFIG) | _BV(NRF24.PWR_UP) ) & ~_BV(NRF24.PRIM_RX))
+        self.update_register(NRF24.CONFIG, (self.read_register_cached(NRF24.CONFIG) | _BV(NRF24.PWR_UP) ) & ~_BV(NRF24.PRIM_RX))
 
         # Send the payload
-        self.write_payload(buf)
+        self.write_payload(buf, no_ack)
 
         # Allons!
+        self.tx_started_at = _clock()
         if self.ce_pin:
             if self.GPIO.RPI_REVISION > 0:
                 self.ce(self.GPIO.HIGH)
@@ -496,10 +1037,94 @@ class NRF24:
 
 
 
+    def write_burst(self, frames, no_ack=False):
+        # Stream frames back to back through the 3-deep TX FIFO, holding CE high
+        # for the whole burst instead of pulsing it and waiting once per frame.
+        # Returns one result per frame: True once it went out (TX_DS), False if
+        # it hit MAX_RT or nothing progressed within getMaxTimeout().
+        results = [False] * len(frames)
+        if not frames:
+            return results
+
+        # Transmitter power-up, with stale TX flags cleared
+        self.update_register(NRF24.CONFIG, (self.read_register_cached(NRF24.CONFIG) | _BV(NRF24.PWR_UP) ) & ~_BV(NRF24.PRIM_RX))
+        self.write_register(NRF24.STATUS, _BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT))
+
+        timeout = self.getMaxTimeout()
+        queue = deque(range(len(frames)))   # frames still to be uploaded
+        in_fifo = deque()                   # frames uploaded, oldest first
+
+        self.ce(NRF24.HIGH)
+        progress_at = time.time()
+        while queue or in_fifo:
+            # Keep the FIFO topped up
+            while queue and len(in_fifo) < 3:
+                frame = queue.popleft()
+                self.write_payload(frames[frame], no_ack)
+                in_fifo.append(frame)
+
+            # STATUS comes back with FIFO_STATUS in the same transaction
+            status, fifo = self.spidev.xfer2([NRF24.R_REGISTER | NRF24.FIFO_STATUS, NRF24.NOP])
+
+            if status & (_BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT)):
+                self.write_register(NRF24.STATUS, _BV(NRF24.TX_DS) | _BV(NRF24.MAX_RT))
+                progress_at = time.time()
+                if status & _BV(NRF24.TX_DS):
+                    results[in_fifo.popleft()] = True
+                if status & _BV(NRF24.MAX_RT) and in_fifo:
+                    # The frame at the head gave up and stays in the FIFO, blocking the
+                    # rest. Drop the whole FIFO and upload the frames behind it again.
+                    in_fifo.popleft()
+                    self.flush_tx()
+                    queue.extendleft(reversed(in_fifo))
+                    in_fifo.clear()
+            elif fifo & _BV(NRF24.TX_EMPTY):
+                # Everything uploaded has gone out, even if TX_DS flags were merged
+                for frame in in_fifo:
+                    results[frame] = True
+                in_fifo.clear()
+                progress_at = time.time()
+            elif len(in_fifo) == 3 and not fifo & _BV(NRF24.FIFO_FULL):
+                # A slot freed up before we saw its TX_DS
+                results[in_fifo.popleft()] = True
+                progress_at = time.time()
+            elif time.time() - progress_at > timeout:
+                break
+            elif self.tx_wait == NRF24.TX_WAIT_AIRTIME:
+                # Nothing to do before the head of the FIFO is out
+                head = self.payload_size
+                if self.dynamic_payloads_enabled:
+                    head = min(len(frames[in_fifo[0]]), head)
+                time.sleep(max(10 / 1000000.0, self.getAirtime(head, no_ack) - NRF24.TX_WAIT_GUARD))
+            else:
+                time.sleep(10 / 1000000.0)
+
+        self.ce(NRF24.LOW)
+        if in_fifo:
+            self.flush_tx()    # dont jam up the fifo
+
+        return results
+
     def getDynamicPayloadSize(self):
         return self.spidev.xfer2([NRF24.R_RX_PL_WID, NRF24.NOP])[1]
 
-    def available(self, pipe_num=None):
+    def irqWait(self, timeout=None):
+        # Block until the IRQ line is pulled low or timeout (seconds) expires.
+        # Returns True if the IRQ is asserted.
+        if self.GPIO.input(self.irq_pin) == 0:  # Already asserted, nothing to wait for
+            return True
+
+        if timeout is None:
+            self.GPIO.wait_for_edge(self.irq_pin, self.GPIO.FALLING)
+        else:
+            # wait_for_edge takes milliseconds and treats 0 as "no timeout"
+            self.GPIO.wait_for_edge(self.irq_pin, self.GPIO.FALLING, timeout=max(1, int(timeout * 1000)))
+
+        # Check the level rather than the return value, so an edge that slipped in
+        # between the first check and wait_for_edge() is not lost
+        return self.GPIO.input(self.irq_pin) == 0
+
+    def available(self, pipe_num=None, irq_wait=False, irq_timeout=None):
         if not pipe_num:
             pipe_num = []
 
@@ -510,6 +1135,12 @@ class NRF24:
         # doesn't set the RX flag...
         if status & _BV(NRF24.RX_DR) or (status & 0b00001110 != 0b00001110):
             result = True
+        elif irq_wait and self.irq_pin is not None:
+            # Sleep on the IRQ line and only go back to SPI once it fires
+            if self.irqWait(irq_timeout):
+                status = self.get_status()
+                if status & _BV(NRF24.RX_DR) or (status & 0b00001110 != 0b00001110):
+                    result = True
 
         if result:
             # If the caller wants the pipe number, include that
@@ -535,6 +1166,37 @@ class NRF24:
         # was this the last of the data available?
         return self.read_register(NRF24.FIFO_STATUS) & _BV(NRF24.RX_EMPTY)
 
+    def read_all(self):
+        # Drain the RX FIFO in one pass and return every queued frame as a
+        # (pipe, payload, status) tuple, oldest first.
+        # The STATUS byte clocked out at the start of each transaction already
+        # holds the pipe of the next frame (0b111 once the FIFO is empty), so the
+        # loop never needs a separate get_status() call with dynamic payloads.
+        frames = []
+        if self.dynamic_payloads_enabled:
+            status, width = self.spidev.xfer2([NRF24.R_RX_PL_WID, NRF24.NOP])
+        else:
+            status, width = self.get_status(), self.payload_size
+
+        while (status >> NRF24.RX_P_NO) & 0b111 != 0b111:
+            if width > NRF24.MAX_PAYLOAD_SIZE:
+                # Corrupted width: the datasheet says to flush the RX FIFO
+                self.flush_rx()
+                break
+
+            payload = self.spidev.xfer2(self._rx_frames[width])
+            frames.append(((status >> NRF24.RX_P_NO) & 0b111, payload[1:width + 1], status))
+
+            if self.dynamic_payloads_enabled:
+                status, width = self.spidev.xfer2([NRF24.R_RX_PL_WID, NRF24.NOP])
+            else:
+                status = self.get_status()
+
+        if status & _BV(NRF24.RX_DR):
+            self.write_register(NRF24.STATUS, _BV(NRF24.RX_DR))
+
+        return frames
+
     def whatHappened(self):
         # Read the status & reset the status in one easy call
         # Or is that such a good idea?
@@ -576,12 +1238,12 @@ class NRF24:
             # pipes at once.  However, I thought it would make the calling code
             # more simple to do it this way.
             self.write_register(NRF24.EN_RXADDR,
-                                self.read_register(NRF24.EN_RXADDR) | _BV(NRF24.child_pipe_enable[child]))
+                                self.read_register_cached(NRF24.EN_RXADDR) | _BV(NRF24.child_pipe_enable[child]))
 
 
     def closeReadingPipe(self, pipe):
         self.write_register(NRF24.EN_RXADDR,
-            self.read_register(EN_RXADDR) & ~_BV(NRF24.child_pipe_enable[pipe]))
+            self.read_register_cached(NRF24.EN_RXADDR) & ~_BV(NRF24.child_pipe_enable[pipe]))
 
 
     def toggle_features(self):
@@ -590,19 +1252,19 @@ class NRF24:
 
     def enableDynamicPayloads(self):
         # Enable dynamic payload throughout the system
-        self.write_register(NRF24.FEATURE, self.read_register(NRF24.FEATURE) | _BV(NRF24.EN_DPL))
+        self.write_register(NRF24.FEATURE, self.read_register_cached(NRF24.FEATURE) | _BV(NRF24.EN_DPL))
 
         # If it didn't work, the features are not enabled
         if not self.read_register(NRF24.FEATURE):
             # So enable them and try again
             self.toggle_features()
-            self.write_register(NRF24.FEATURE, self.read_register(NRF24.FEATURE) | _BV(NRF24.EN_DPL))
+            self.write_register(NRF24.FEATURE, self.read_register_cached(NRF24.FEATURE) | _BV(NRF24.EN_DPL))
 
         # Enable dynamic payload on all pipes
 
         # Not sure the use case of only having dynamic payload on certain
         # pipes, so the library does not support it.
-        self.write_register(NRF24.DYNPD, self.read_register(NRF24.DYNPD) | _BV(NRF24.DPL_P5) | _BV(NRF24.DPL_P4) | _BV(
+        self.write_register(NRF24.DYNPD, self.read_register_cached(NRF24.DYNPD) | _BV(NRF24.DPL_P5) | _BV(NRF24.DPL_P4) | _BV(
             NRF24.DPL_P3) | _BV(NRF24.DPL_P2) | _BV(NRF24.DPL_P1) | _BV(NRF24.DPL_P0))
 
         self.dynamic_payloads_enabled = True
@@ -611,17 +1273,17 @@ class NRF24:
     def enableAckPayload(self):
         # enable ack payload and dynamic payload features
         self.write_register(NRF24.FEATURE,
-                            self.read_register(NRF24.FEATURE) | _BV(NRF24.EN_ACK_PAY) | _BV(NRF24.EN_DPL))
+                            self.read_register_cached(NRF24.FEATURE) | _BV(NRF24.EN_ACK_PAY) | _BV(NRF24.EN_DPL))
 
         # If it didn't work, the features are not enabled
         if not self.read_register(NRF24.FEATURE):
             # So enable them and try again
             self.toggle_features()
             self.write_register(NRF24.FEATURE,
-                                self.read_register(NRF24.FEATURE) | _BV(NRF24.EN_ACK_PAY) | _BV(NRF24.EN_DPL))
+                                self.read_register_cached(NRF24.FEATURE) | _BV(NRF24.EN_ACK_PAY) | _BV(NRF24.EN_DPL))
 
         # Enable dynamic payload on pipes 0 & 1
-        self.write_register(NRF24.DYNPD, self.read_register(NRF24.DYNPD) | _BV(NRF24.DPL_P1) | _BV(NRF24.DPL_P0))
+        self.write_register(NRF24.DYNPD, self.read_register_cached(NRF24.DYNPD) | _BV(NRF24.DPL_P1) | _BV(NRF24.DPL_P0))
 
     def writeAckPayload(self, pipe, buf, buf_len):
         txbuffer = [NRF24.W_ACK_PAYLOAD | ( pipe & 0x7 )]
@@ -642,13 +1304,13 @@ class NRF24:
 
     def setAutoAck(self, enable):
         if enable:
-            self.write_register(NRF24.EN_AA, 0b111111)
+            self.update_register(NRF24.EN_AA, 0b111111)
         else:
-            self.write_register(NRF24.EN_AA, 0)
+            self.update_register(NRF24.EN_AA, 0)
 
     def setAutoAckPipe(self, pipe, enable):
         if pipe <= 6:
-            en_aa = self.read_register(NRF24.EN_AA)
+            en_aa = self.read_register_cached(NRF24.EN_AA)
             if enable:
                 en_aa |= _BV(pipe)
             else:
@@ -662,8 +1324,29 @@ class NRF24:
     def testRPD(self):
         return self.read_register(NRF24.RPD) & 1
 
+    def senseCarrier(self):
+        # Clear channel assessment: True if something above -64 dBm is on the
+        # channel right now. RPD keeps its value from the last received packet
+        # or CE low, so RX is restarted and given time to settle first. An idle
+        # radio goes back to standby afterwards (it stays powered up, so only the
+        # first call waits for the oscillator), a listening one keeps listening
+        # and keeps its FIFOs.
+        config = self.read_register_cached(NRF24.CONFIG)
+        if not self.listening:
+            self.update_register(NRF24.CONFIG, config | _BV(NRF24.PWR_UP) | _BV(NRF24.PRIM_RX))
+            if not config & _BV(NRF24.PWR_UP):
+                time.sleep(NRF24.PD2STBY)
+        self.ce(NRF24.LOW)
+        self.ce(NRF24.HIGH)
+        time.sleep(NRF24.RPD_SETTLE)
+        busy = self.read_register(NRF24.RPD) & 1
+        if not self.listening:
+            self.ce(NRF24.LOW)
+            self.update_register(NRF24.CONFIG, config | _BV(NRF24.PWR_UP))
+        return busy == 1
+
     def setPALevel(self, level):
-        setup = self.read_register(NRF24.RF_SETUP)
+        setup = self.read_register_cached(NRF24.RF_SETUP)
         setup &= ~( _BV(NRF24.RF_PWR_LOW) | _BV(NRF24.RF_PWR_HIGH))
         # switch uses RAM (evil!)
         if level == NRF24.PA_MAX:
@@ -682,7 +1365,7 @@ class NRF24:
 
 
     def getPALevel(self):
-        power = self.read_register(NRF24.RF_SETUP) & (_BV(NRF24.RF_PWR_LOW) | _BV(NRF24.RF_PWR_HIGH))
+        power = self.read_register_cached(NRF24.RF_SETUP) & (_BV(NRF24.RF_PWR_LOW) | _BV(NRF24.RF_PWR_HIGH))
 
         if power == (_BV(NRF24.RF_PWR_LOW) | _BV(NRF24.RF_PWR_HIGH)):
             return NRF24.PA_MAX
@@ -695,7 +1378,7 @@ class NRF24:
 
     def setDataRate(self, speed):
         result = False
-        setup = self.read_register(NRF24.RF_SETUP)
+        setup = self.read_register_cached(NRF24.RF_SETUP)
 
         # HIGH and LOW '00' is 1Mbs - our default
         self.wide_band = False
@@ -726,7 +1409,7 @@ class NRF24:
         return result
 
     def getDataRate(self):
-        dr = self.read_register(NRF24.RF_SETUP) & (_BV(NRF24.RF_DR_LOW) | _BV(NRF24.RF_DR_HIGH))
+        dr = self.read_register_cached(NRF24.RF_SETUP) & (_BV(NRF24.RF_DR_LOW) | _BV(NRF24.RF_DR_HIGH))
         # Order matters in our case below
         if dr == _BV(NRF24.RF_DR_LOW):
             # '10' = 250KBPS
@@ -740,7 +1423,7 @@ class NRF24:
 
 
     def setCRCLength(self, length):
-        config = self.read_register(NRF24.CONFIG) & ~( _BV(NRF24.CRC_16) | _BV(NRF24.CRC_ENABLED))
+        config = self.read_register_cached(NRF24.CONFIG) & ~( _BV(NRF24.CRC_16) | _BV(NRF24.CRC_ENABLED))
 
         if length == NRF24.CRC_DISABLED:
             # Do nothing, we turned it off above.
@@ -757,7 +1440,7 @@ class NRF24:
 
     def getCRCLength(self):
         result = NRF24.CRC_DISABLED
-        config = self.read_register(NRF24.CONFIG) & ( _BV(NRF24.CRCO) | _BV(NRF24.EN_CRC))
+        config = self.read_register_cached(NRF24.CONFIG) & ( _BV(NRF24.CRCO) | _BV(NRF24.EN_CRC))
 
         if config & _BV(NRF24.EN_CRC):
             if config & _BV(NRF24.CRCO):
@@ -768,7 +1451,7 @@ class NRF24:
         return result
 
     def disableCRC(self):
-        disable = self.read_register(NRF24.CONFIG) & ~_BV(NRF24.EN_CRC)
+        disable = self.read_register_cached(NRF24.CONFIG) & ~_BV(NRF24.EN_CRC)
         self.write_register(NRF24.CONFIG, disable)
 
     def setRetries(self, delay, count):
@@ -777,7 +1460,7 @@ class NRF24:
         self.write_register(NRF24.SETUP_RETR, (delay & 0xf) << NRF24.ARD | (count & 0xf))
 
     def getRetries(self):
-        return self.read_register(NRF24.SETUP_RETR)
+        return self.read_register_cached(NRF24.SETUP_RETR)
 
     def getMaxTimeout(self):        # seconds
         retries = self.getRetries()
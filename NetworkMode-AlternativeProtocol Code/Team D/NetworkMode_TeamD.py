@@ -1,5 +1,5 @@
 import RPi.GPIO as GPIO
-from lib_nrf24 import NRF24
+from lib_nrf24 import NRF24, RadioProfile
 import time
 import spidev
 import bz2
@@ -31,27 +31,16 @@ GPIO.output(26, False)
 
 pipes = [[0xe7, 0xe7, 0xe7, 0xe7, 0xe7], [0xc2, 0xc2, 0xc2, 0xc2, 0xc2]]
 
+profile = RadioProfile(payload_size=32, data_rate=NRF24.BR_250KBPS, pa_level=NRF24.PA_MIN, auto_ack=False,
+                       dynamic_payloads=True, ack_payloads=True)
+
 # Setup Transceiver 1: Transmitter
 radio = NRF24(GPIO, spidev.SpiDev())
-radio.begin(0, 17)
-radio.setPayloadSize(32)
-radio.setChannel(chtx)
-radio.setDataRate(NRF24.BR_250KBPS)
-radio.setPALevel(NRF24.PA_MIN)
-radio.setAutoAck(False)
-radio.enableDynamicPayloads()
-radio.enableAckPayload()
+radio.begin(0, 17, profile=profile.merged(RadioProfile(channel=chtx)))
 
 # Setup Transceiver 2: Receiver
 radio2 = NRF24(GPIO, spidev.SpiDev())
-radio2.begin(1, 27)
-radio2.setPayloadSize(32)
-radio2.setChannel(chrx)
-radio2.setDataRate(NRF24.BR_250KBPS)
-radio2.setPALevel(NRF24.PA_MIN)
-radio2.setAutoAck(False)
-radio2.enableDynamicPayloads()
-radio2.enableAckPayload()
+radio2.begin(1, 27, profile=profile.merged(RadioProfile(channel=chrx)))
 
 reception_completed = False
 compress_rate = 9
@@ -309,11 +298,8 @@ try:
             get_next_freq_to_receive()
             chrx = team_frequencies[current_receiving_team]
 
-            radio2.stopListening()
-            time.sleep(0.1)
-            radio2.setChannel(chrx)
-            radio2.startListening()
-            time.sleep(0.1)
+            # Retune in place, keeping whatever is already in the RX FIFO
+            radio2.hop(chrx)
             print('Cambio de frequencia realizado, frecuencia actual: ' + str(hex(chrx)))
             t = 0
             it_number = 0
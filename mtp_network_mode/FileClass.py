@@ -1,5 +1,12 @@
+import logging
+
+import log
+from packet import SACK_BITS
+
 PAYLOAD_SIZE = 31
 
+logger = log.getLogger("file")
+
 
 class FileClass(object):
     # This should be an abstract Object
@@ -17,54 +24,107 @@ class FileClass(object):
 
         self.finished = False
 
+        # Sender: packets after counter the receiver has already (selective ACKs)
+        # Receiver: packets that came in after a missing one, by counter
+        self.sacked = set()
+        self.pending = {}
+
         if reader:
-            print("Reading from file: {}".format(path))
+            logger.info("Reading from file: %s", path)
             with open(path, 'rb') as f:
-                byte = f.read(1)
-                while byte != '':
-                    self.bytes.append(byte)
-                    byte = f.read(1)
-
-                rest = len(self.bytes)
-
-                aux = []
-                for i in range(len(self.bytes)):
-                    aux.append(ord(self.bytes[i]))
-                    if len(aux) == PAYLOAD_SIZE or len(aux) == rest:
-                        rest -= len(aux)
-                        self.packets.append(aux)
-                        aux = []
+                # bytearray gives ints (0-255) on Python 2 and 3
+                self.bytes = bytearray(f.read())
+
+            for i in range(0, len(self.bytes), PAYLOAD_SIZE):
+                self.packets.append(list(self.bytes[i:i + PAYLOAD_SIZE]))
         else:
             pass
             with open(path, 'wb') as f:
-                print("Created file in path: {}".format(path))
+                logger.info("Created file in path: %s", path)
 
     # Sender methods
     def getNextPayload(self):
-        if self.counter == len(self.packets):
+        if self.counter >= len(self.packets):
             self.finished = True
-            print("Sending last packet!")
+            logger.debug("Sending last packet of %s", self.path)
             return [99], 0b11111
-        packet_str = [chr(item) for item in self.packets[self.counter]]
-        print("Getting packet in position {}: [{}]".format(self.counter, "".join(packet_str)))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Getting packet in position %d: %r", self.counter, bytes(bytearray(self.packets[self.counter])))
         return self.packets[self.counter], self.counter
 
+    # Up to window packets from counter on that the receiver does not have yet,
+    # as (payload, counter). Once every packet is through, the last packet as in
+    # getNextPayload()
+    def getWindow(self, window):
+        if self.counter == len(self.packets):
+            return [self.getNextPayload()]
+        end = min(len(self.packets), self.counter + window)
+        return [(self.packets[i], i) for i in range(self.counter, end) if i not in self.sacked]
+
     def receivedACK(self):
         self.counter += 1
-        print("Now counter is equal to: {}".format(self.counter))
+        logger.debug("Now counter is equal to: %d", self.counter)
+
+    # ESB mode: the receiver's radio acknowledged the packet with this counter.
+    # expected is the counter the receiver was waiting for when it came in (from
+    # the ACK payload). If it is behind, packets got lost after its radio took
+    # them, so go back to it
+    def receivedHardwareACK(self, counter, expected=None):
+        if counter == 0b11111:
+            return
+        if expected is None or expected == counter:
+            self.counter = counter + 1
+        else:
+            self.counter = expected
+        logger.debug("Now counter is equal to: %d", self.counter)
+
+    # Selective ACK from the receiver's control frame: it waits for packet
+    # counter and has the packets set in bitmap after it. Echoes of an older
+    # control frame carry older news, which is still true, so this can be
+    # applied any number of times
+    def receivedSACK(self, counter, bitmap):
+        if counter > self.counter:
+            self.counter = min(counter, len(self.packets))
+        self.sacked = set(i for i in self.sacked if i > self.counter)
+        for j in range(SACK_BITS):
+            if bitmap >> j & 1 and counter + 1 + j > self.counter:
+                self.sacked.add(counter + 1 + j)
+        logger.debug("Now counter is equal to: %d, selectively acked: %s", self.counter, sorted(self.sacked))
 
     # Receiver methods
     def writePayload(self, buf, packet_counter):
         if packet_counter == 0b11111:
-            print("No more packets to receive!")
+            logger.debug("No more packets to receive for %s", self.path)
             self.finished = True
             return
-        print("Writting to file: self counter: {}, received counter: {}".format(self.counter, packet_counter))
-        # If buf contains a list of ints (0-255), do char() and save to file one by one
+        logger.debug("Writing to file: self counter: %d, received counter: %d", self.counter, packet_counter)
+        # buf is a list of ints (0-255)
         if packet_counter == self.counter:
             with open(self.path, 'ab') as f:
-                for b in buf:
-                    f.write(chr(b))
-            self.counter += 1
-            print("Now writing counter is equal to: {}".format(self.counter))
+                f.write(bytearray(buf))
+                self.counter += 1
+                # Whatever came in after it is next in the file now
+                while self.counter in self.pending:
+                    f.write(bytearray(self.pending.pop(self.counter)))
+                    self.counter += 1
+            logger.debug("Now writing counter is equal to: %d", self.counter)
+        elif packet_counter > self.counter:
+            # Only selective ACKs tell the sender about it, the ACK bit would
+            # move it past the packet we are missing
+            if packet_counter <= self.counter + SACK_BITS:
+                self.pending[packet_counter] = buf
+            return
+        elif packet_counter != self.counter - 1:
+            return
+        # The ACK bit moves the sender on by one: only for the packet just
+        # written, or a copy of it when our ACK got lost
         self.send_ack = 1
+
+    # Selective ACK for the control frame: the next counter and a bitmap of the
+    # packets after it that came in already
+    def sackState(self):
+        bitmap = 0
+        for j in range(SACK_BITS):
+            if self.counter + 1 + j in self.pending:
+                bitmap |= 1 << j
+        return [self.counter & 0xff, bitmap]
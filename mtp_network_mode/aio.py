@@ -0,0 +1,291 @@
+from __future__ import print_function
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import log
+import packet
+import radio
+from team import DATA_GAP, Team
+
+# asyncio front end for radio.Radio and team.Team, Python 3 only (the rest of
+# the package still runs on Python 2). Waiting for a frame or a timer is an
+# await instead of a busy loop, so timers, file writes, metrics and several
+# emulated teams can share one event loop.
+
+
+def _wake(future):
+    # add_reader() keeps calling back while the socket is readable
+    if not future.done():
+        future.set_result(None)
+
+
+class AsyncRadio(object):
+    # Awaitable read() and write() for a radio.Radio, with the same results.
+    # In UDP mode the RX socket is watched with loop.add_reader(), so a waiting
+    # read costs nothing until a datagram comes in. The nRF24 has no file
+    # descriptor: its calls run on a thread of their own, where read() sleeps on
+    # the IRQ edge when the radio has an IRQ line
+
+    def __init__(self, radioObj):
+        self.radio = radioObj
+        self.executor = None
+        if not radioObj.UDP:
+            # One thread per radio, so its SPI transfers never overlap
+            self.executor = ThreadPoolExecutor(1)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    # (1, frame) or (0, None) after timeout seconds. As with Radio.read(), a
+    # frame lost to the emulated error rate ends the wait. With the receiver
+    # thread running the socket is its own, so this waits on its queue. The
+    # shared memory backend has no socket and waits on a thread too
+    async def read(self, timeout):
+        loop = asyncio.get_running_loop()
+        if self.executor is not None or self.radio.receiver is not None or self.radio.shm is not None:
+            return await loop.run_in_executor(self.executor, self.radio.read, timeout)
+
+        deadline = time.time() + timeout
+        lost = self.radio.udpLost
+        while True:
+            result, buf = self.radio.read(0)
+            if result == 1 or self.radio.udpLost != lost:
+                return result, buf
+            now = time.time()
+            if now >= deadline:
+                return 0, None
+            # Sleep until a datagram comes in, the channel model lets the next
+            # held frame through, or the time is up
+            wake = deadline
+            if self.radio.channelRX is not None:
+                due = self.radio.channelRX.due()
+                if due is not None and due < wake:
+                    wake = due
+            await self.readable(wake - now)
+
+    async def readable(self, timeout):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.radio.rx_socket.fileno()
+        loop.add_reader(fd, _wake, ready)
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(fd)
+
+    # Same as Radio.write(). With a channel model the airtime is awaited
+    # instead of slept
+    async def write(self, buf, dest=None):
+        if self.executor is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.radio.write, buf, dest)
+        remaining = self.radio.sendUDP(buf, dest)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        return None
+
+    # Same as Radio.writeBurst()
+    async def writeBurst(self, frames, dest=None):
+        if self.executor is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.radio.writeBurst, frames, dest)
+        for buf in frames:
+            await self.write(buf, dest)
+        return [True] * len(frames)
+
+
+class AsyncTeam(Team):
+    # team.Team with the protocol as coroutines: same arguments, same state and
+    # the same rounds as main.py, see run(). Every decision is made by the Team
+    # helpers, these only await where Team blocks. Received data is written to
+    # disk on the default executor. With duplex the engine's queues are waited on from
+    # the executor as well
+
+    def __init__(self, *args, **kwargs):
+        Team.__init__(self, *args, **kwargs)
+        self.asyncTX = AsyncRadio(self.radioTX)
+        self.asyncRX = AsyncRadio(self.radioRX)
+
+    def close(self):
+        Team.close(self)
+        self.asyncTX.close()
+        self.asyncRX.close()
+
+    async def read(self, timeout):
+        if self.engine is not None:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, self.engine.receive, timeout)
+        else:
+            result = await self.asyncRX.read(timeout)
+        self.framesReceived += result[0]
+        return result
+
+    async def write(self, buf, dest=None):
+        self.framesSent += 1
+        if self.engine is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.engine.send(buf, dest).wait)
+        return await self.asyncTX.write(buf, dest)
+
+    async def writeBurst(self, frames, dest=None):
+        if self.engine is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, Team.writeBurst, self, frames, dest)
+        self.framesSent += len(frames)
+        return await self.asyncTX.writeBurst(frames, dest)
+
+    async def waitControl(self, timeout=None):
+        startTime = time.time()
+        timePassed = 0
+        while timeout > timePassed:
+            result, packet_read = await self.read(timeout - timePassed)
+            if result == 0:
+                self.controlTimedOut()
+                return 0, None
+            if self.takeControl(packet_read):
+                return 1, packet_read
+            timePassed = time.time() - startTime
+        return 0, None
+
+    async def sendControl(self):
+        controlPacket = self.nextControl()
+        await self.write(controlPacket)
+        return controlPacket
+
+    async def sender(self, waitOthersData):
+        await asyncio.sleep(waitOthersData)
+        sentPacket = await self.sendControl()
+        startTime = time.time()
+        if await self.waitACKs(self.tACK, sentPacket) == 1:
+            self.logger.info("Received ACK, sending data")
+            await self.sendData()
+        await asyncio.sleep(max(0, startTime + self.tData - time.time()))
+
+    async def receiver(self, controlPacket):
+        startTime = time.time()
+        await asyncio.sleep(self.ackDelay)
+        await self.write(controlPacket)
+        sender = packet.getSender(controlPacket[0])
+        await self.receiveData(self.tListen - (time.time() - startTime) + self.tData, sender)
+
+    async def waitACKs(self, timeout, sentPacket):
+        startTime = time.time()
+        ackCounter = 0
+        timePassed = 0
+        while True:
+            result, packet_read = await self.read(timeout - timePassed)
+            if result == 0:
+                return self.acksReceived(ackCounter)
+            if self.isACK(packet_read, sentPacket):
+                ackCounter += 1
+            timePassed = time.time() - startTime
+
+    async def sendData(self):
+        for i in range(self.networkSize):
+            if i != self.teamID:
+                await asyncio.sleep(DATA_GAP*self.dilationFactor)
+                if self.sack:
+                    await self.writeBurst([data for data, _ in self.dataFrames(i)], dest=i)
+                    continue
+                for _ in range(self.window):
+                    frames = self.dataFrames(i)
+                    if not frames:
+                        break
+                    data, counter = frames[0]
+                    if not self.dataACK(i, counter, await self.write(data, dest=i)):
+                        break
+
+    async def receiveData(self, timeout, sender):
+        loop = asyncio.get_running_loop()
+        startTime = time.time()
+        timePassed = 0
+        myDataReceived = False
+        self.dataStarted()
+        while timeout > timePassed:
+            result, packet_received = await self.read(timeout - timePassed)
+            if result == 1:
+                if self.turnOver(sender, packet_received):
+                    break
+                payload, packet_counter = self.takeData(packet_received)
+                if payload is not None and packet_counter is not None:
+                    myDataReceived = True
+                    await loop.run_in_executor(None, self.storeData, sender, payload, packet_counter)
+            timePassed = time.time() - startTime
+        self.dataFinished(myDataReceived)
+
+    # The main.py loop. Returns the seconds it took, or more than maxTime if it
+    # timed out
+    async def run(self, maxTime=120):
+        transmission_init = True
+        timeout = self.firstTimeout()
+        startTime = time.time()
+        timePassed = 0
+        while not self.checkFinished() and timePassed < maxTime:
+            result, controlPacket = await self.waitControl(timeout)
+            if result == 1:
+                transmission_init = False
+                await self.receiver(controlPacket)
+                timeout = self.receiverTimeout()
+            if self.nextPlayer:
+                await self.sender(self.senderWait(transmission_init))
+                transmission_init = False
+                timeout = self.senderTimeout()
+            self.dumpProfile()
+            timePassed = time.time() - startTime
+        return timePassed
+
+
+# Writes out the log ring buffer (see log.setup()) every interval seconds. The
+# round of one team is the busy time of another, so this runs on the executor
+async def flushLogs(interval=1.0):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(None, log.flush)
+
+
+# Runs the teams in teamIDs in this process, all on UDP, and returns the time
+# each one took. kwargs go to every AsyncTeam
+async def runTeams(teamIDs, maxTime=120, **kwargs):
+    kwargs['UDP'] = True
+    teams = [AsyncTeam(teamID, **kwargs) for teamID in teamIDs]
+    flusher = asyncio.ensure_future(flushLogs())
+    try:
+        return await asyncio.gather(*[team.run(maxTime) for team in teams])
+    finally:
+        flusher.cancel()
+        for team in teams:
+            team.close()
+        log.flush()
+
+
+def main():
+    # Every team of the network in one process, for load tests of the UDP
+    # emulation
+    dilationFactor = 5
+    networkSize = 3
+    udpBackend = radio.UDP_UNICAST
+    channel = None
+    # log.DEFAULT_LEVEL (WARNING) formats nothing on the frame path. With
+    # logRing the records are kept in memory and written out once a second
+    logLevel = log.DEFAULT_LEVEL
+    logRing = False
+
+    log.setup(logLevel, ring=logRing)
+    times = asyncio.run(
+        runTeams(range(networkSize), dilationFactor=dilationFactor, networkSize=networkSize,
+                 udpBackend=udpBackend, channel=channel))
+    for teamID, timePassed in enumerate(times):
+        if timePassed > 120:
+            print("Team {}: Timeout!".format(teamID))
+        else:
+            print("Team {}: Transmission complete. Time elapsed: {}".format(teamID, timePassed))
+
+
+if __name__ == "__main__":
+    main()
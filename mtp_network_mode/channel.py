@@ -0,0 +1,160 @@
+import random
+
+# Channel model for the UDP emulation of the radios. The sender stamps every
+# frame with the time it went on air and stays busy for its airtime. The
+# receiver holds the frame until its airtime (plus delay) is over, drops it if
+# another frame overlapped it, and then applies the loss model of the link.
+# All teams in a run must use the same model, as it changes the UDP frames.
+
+
+class Bernoulli(object):
+    # Independent loss with probability p per frame
+
+    def __init__(self, p):
+        self.p = p
+
+    def lost(self, rng):
+        return rng.random() < self.p
+
+    # Model for a new link. Has no state, so it can be shared
+    def fresh(self):
+        return self
+
+
+class GilbertElliott(object):
+    # Two state burst loss: the link goes from good to bad with probability p
+    # and back with probability r, per frame. Frames are lost with lossGood /
+    # lossBad in each state, so bursts last 1 / r frames on average
+
+    def __init__(self, p, r, lossGood=0.0, lossBad=1.0):
+        self.p = p
+        self.r = r
+        self.lossGood = lossGood
+        self.lossBad = lossBad
+        self.bad = False
+
+    def lost(self, rng):
+        if self.bad:
+            if rng.random() < self.r:
+                self.bad = False
+        elif rng.random() < self.p:
+            self.bad = True
+        return rng.random() < (self.lossBad if self.bad else self.lossGood)
+
+    def fresh(self):
+        return GilbertElliott(self.p, self.r, self.lossGood, self.lossBad)
+
+
+class ChannelModel(object):
+    # rate in bit/s and the address and CRC lengths give the airtime, as for
+    # the radios in radio.Radio (250 kbps, 5 byte address, CRC_8).
+    # loss is the model of every link, Bernoulli(1/21) is the 1 in 21 frame
+    # loss of the plain UDP mode. lossMatrix[src][dst] overrides it per link,
+    # either with a probability or with a model, None keeps the default.
+    # Frames reach the receiver delay seconds after their airtime, plus up to
+    # jitter seconds. Overlapping frames are both lost unless collisions is False.
+
+    def __init__(self, rate=250000, addressBytes=5, crcBytes=1, loss=None, lossMatrix=None, delay=0.0,
+                 jitter=0.0, collisions=True, seed=None):
+        self.rate = float(rate)
+        self.addressBytes = addressBytes
+        self.crcBytes = crcBytes
+        self.loss = loss if loss is not None else Bernoulli(1 / 21.0)
+        self.lossMatrix = lossMatrix
+        self.delay = delay
+        self.jitter = jitter
+        self.collisions = collisions
+        self.seed = seed
+
+    # Seconds on air for a payload of length bytes: preamble, address, 9 bit
+    # packet control field, payload and CRC
+    def airtime(self, length):
+        return (8 * (1 + self.addressBytes + length + self.crcBytes) + 9) / self.rate
+
+    def linkLoss(self, src, dst):
+        loss = None
+        if self.lossMatrix is not None and src < len(self.lossMatrix) and dst < len(self.lossMatrix[src]):
+            loss = self.lossMatrix[src][dst]
+        if loss is None:
+            return self.loss.fresh()
+        if isinstance(loss, (int, float)):
+            return Bernoulli(loss)
+        return loss.fresh()
+
+    # Receiving end for team dst. Each receiving radio needs its own
+    def receiver(self, dst):
+        return ChannelReceiver(self, dst)
+
+
+class _Frame(object):
+    __slots__ = ('src', 'start', 'end', 'deliverAt', 'payload', 'accepted', 'collided')
+
+    def __init__(self, src, start, end, deliverAt, payload, accepted):
+        self.src = src
+        self.start = start
+        self.end = end
+        self.deliverAt = deliverAt
+        self.payload = payload
+        self.accepted = accepted
+        self.collided = False
+
+
+class ChannelReceiver(object):
+
+    def __init__(self, model, dst):
+        self.model = model
+        self.dst = dst
+        self.rng = random.Random(None if model.seed is None else model.seed + dst)
+        self.links = {}
+        self.air = []
+
+        self.received = 0
+        self.collided = 0
+        self.lost = 0
+
+    # A frame that came in over UDP. accepted is False for frames the radio
+    # would not take (other addresses), which still collide with the rest
+    def push(self, src, start, payload, accepted=True):
+        model = self.model
+        end = start + model.airtime(len(payload))
+        frame = _Frame(src, start, end, end + model.delay + self.rng.uniform(0, model.jitter), payload, accepted)
+        if model.collisions:
+            for other in self.air:
+                if other.start < end and start < other.end:
+                    other.collided = True
+                    frame.collided = True
+        self.air.append(frame)
+
+    # When the next held frame is due, or None
+    def due(self):
+        if not self.air:
+            return None
+        return min(frame.deliverAt for frame in self.air)
+
+    # The next frame that made it through by now, or None
+    def pop(self, now):
+        while self.air:
+            frame = min(self.air, key=lambda f: f.deliverAt)
+            if frame.deliverAt > now:
+                return None
+            self.air.remove(frame)
+            if not frame.accepted:
+                continue
+            if frame.collided:
+                self.collided += 1
+                continue
+            link = self.links.get(frame.src)
+            if link is None:
+                link = self.links[frame.src] = self.model.linkLoss(frame.src, self.dst)
+            if link.lost(self.rng):
+                self.lost += 1
+                continue
+            self.received += 1
+            return frame.payload
+        return None
+
+    def clear(self):
+        del self.air[:]
+
+    def stats(self):
+        return {'received': self.received, 'collided': self.collided, 'lost': self.lost}
@@ -0,0 +1,143 @@
+import threading
+
+from radio import monotonic, RX_POLL_INTERVAL
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class _TxRequest(object):
+    # One frame waiting in the TX queue. wait() blocks until the TX loop has sent
+    # it and returns what Radio.write() returned
+    __slots__ = ('buf', 'dest', 'done', 'result')
+
+    def __init__(self, buf, dest):
+        self.buf = buf
+        self.dest = dest
+        self.done = threading.Event()
+        self.result = None
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.result
+
+
+class DuplexEngine(object):
+    # Runs the two radios of a team at the same time: the RX radio's receiver
+    # thread (see Radio.startReceiver()) keeps it listening, one thread here
+    # moves its frames into a queue and the other takes frames from a queue and
+    # sends them on the TX radio. Frames that come in while we transmit are no
+    # longer lost.
+    #
+    # Both radios sit on the same channel, so the RX radio hears our own
+    # broadcasts as well. It can only hear them while the TX radio is on air:
+    # the first frame equal to the one sent, received from the start of its
+    # write to echoWindow seconds after it returned (the time for the receiver
+    # thread to poll and drain the RX radio), is dropped as our echo. There is
+    # one echo per write at most. ACKs are copies of the control frame too, but
+    # they come a few ms later and get through. The UDP and shared memory
+    # emulations do not hear themselves, there is no filter.
+
+    def __init__(self, radioTX, radioRX, rxQueueSize=64, txQueueSize=64, pollTimeout=0.01,
+                 echoWindow=2*RX_POLL_INTERVAL):
+        self.radioTX = radioTX
+        self.radioRX = radioRX
+        self.pollTimeout = pollTimeout
+        self.echoWindow = echoWindow
+        self.echoFilter = not radioRX.UDP
+
+        self.rxQueue = queue.Queue(rxQueueSize)
+        self.txQueue = queue.Queue(txQueueSize)
+        self.stopping = threading.Event()
+        self.threads = []
+        self.ownsReceiver = False
+
+        # Last frame sent and when its write started and returned, for the
+        # echo check
+        self.lastSent = None
+        self.lastSentStart = 0
+        self.lastSentAt = 0
+        self.sending = False
+
+        self.rxFrames = 0
+        self.rxOverflows = 0
+        self.rxEchoes = 0
+        self.txFrames = 0
+
+    def start(self):
+        self.stopping.clear()
+        self.ownsReceiver = self.radioRX.receiver is None
+        self.radioRX.startReceiver(self.rxQueue.maxsize)
+        self.threads = [threading.Thread(target=self._rxLoop, name="duplex-rx"),
+                        threading.Thread(target=self._txLoop, name="duplex-tx")]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.ownsReceiver:
+            self.radioRX.stopReceiver()
+
+    # Same contract as Radio.read(): (1, frame) or (0, None) after timeout seconds
+    def receive(self, timeout):
+        try:
+            return 1, self.rxQueue.get(True, max(0, timeout))
+        except queue.Empty:
+            return 0, None
+
+    # Queues buf for the TX loop. Call wait() on the result to block until it
+    # has been sent and get what Radio.write() returned
+    def send(self, buf, dest=None):
+        request = _TxRequest(buf, dest)
+        self.txQueue.put(request)
+        return request
+
+    # Blocks until every queued frame has been sent
+    def flush(self):
+        self.txQueue.join()
+
+    def stats(self):
+        return {'rxFrames': self.rxFrames, 'rxOverflows': self.rxOverflows, 'rxEchoes': self.rxEchoes,
+                'rxQueued': self.rxQueue.qsize(), 'txFrames': self.txFrames, 'txQueued': self.txQueue.qsize()}
+
+    def _deliver(self, timestamp, buf):
+        if self.echoFilter and self.lastSent is not None and self.lastSentStart <= timestamp \
+                and (self.sending or timestamp <= self.lastSentAt + self.echoWindow) and list(buf) == self.lastSent:
+            self.rxEchoes += 1
+            self.lastSent = None
+            return
+        try:
+            self.rxQueue.put_nowait(buf)
+            self.rxFrames += 1
+        except queue.Full:
+            self.rxOverflows += 1
+
+    def _rxLoop(self):
+        while not self.stopping.is_set():
+            frame = self.radioRX.readFrame(self.pollTimeout)
+            if frame is not None:
+                self._deliver(frame.timestamp, list(bytearray(frame.payload)))
+
+    def _txLoop(self):
+        while not self.stopping.is_set():
+            try:
+                request = self.txQueue.get(True, self.pollTimeout)
+            except queue.Empty:
+                continue
+            self.lastSent = list(request.buf)
+            self.lastSentStart = monotonic()
+            self.sending = True
+            try:
+                request.result = self.radioTX.write(request.buf, request.dest)
+                self.txFrames += 1
+            finally:
+                self.lastSentAt = monotonic()
+                self.sending = False
+                request.done.set()
+                self.txQueue.task_done()
@@ -0,0 +1,232 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import random
+import argparse
+import multiprocessing
+import time
+
+import log
+import main
+import radio
+from channel import ChannelModel, Bernoulli
+from team import Team
+
+# Runs a whole network mode session without a single prompt: every node is a
+# Team on the UDP emulation, in a process of its own, running the main.py loop.
+# When they are all done it prints a JSON report with the completion time,
+# goodput and frame counts of every node and of the network. This is the end to
+# end benchmark for protocol changes.
+#
+#   python launcher.py --teams 3 --backend shm
+#   python launcher.py --config session.json --output report.json
+#
+# The config file is a JSON object with any of the keys of DEFAULTS. "options"
+# are Team arguments for every node, "nodes" a list of {"team": id, ...} with
+# Team arguments for that node only (all teams of the network by default).
+# "channel" is a dict of ChannelModel arguments, with "loss" as the frame loss
+# probability of every link. Command line options win over the file.
+#
+# Nodes read ./sendFiles<id> and write ./savingFiles<id> under workdir, as
+# main.py does in its own folder.
+
+DEFAULTS = {
+    'networkSize': 3,
+    'dilationFactor': 5,
+    'maxTime': 120,
+    'backend': radio.UDP_UNICAST,
+    'channel': None,
+    'options': {},
+    'nodes': None,
+    'seed': None,
+    'logLevel': "WARNING",
+    'workdir': os.path.dirname(os.path.abspath(__file__)),
+}
+
+# How long the launcher waits for the nodes to come up and to wrap up after
+# maxTime, in seconds
+SETUP_TIMEOUT = 30
+CLOSE_TIMEOUT = 30
+
+
+def _channel(settings):
+    if settings is None:
+        return None
+    settings = dict(settings)
+    loss = settings.pop('loss', None)
+    if loss is not None:
+        settings['loss'] = Bernoulli(loss)
+    return ChannelModel(**settings)
+
+
+def _sentFile(sender, receiver):
+    folder = os.path.join("./sendFiles" + str(sender), "team" + str(receiver))
+    return os.path.join(folder, os.listdir(folder)[0])
+
+
+# What one team received from every other, checked against what was sent
+def _files(team):
+    files = []
+    for i in range(team.networkSize):
+        if i == team.teamID:
+            continue
+        with open(team.savingFiles[i].path, 'rb') as f:
+            received = f.read()
+        with open(_sentFile(i, team.teamID), 'rb') as f:
+            sent = f.read()
+        files.append({'from': i, 'bytes': len(received), 'expected': len(sent), 'intact': received == sent})
+    return files
+
+
+# One node, in its own process. Reports to results once the session is over
+def _node(node, config, ready, go, results):
+    teamID = node['team']
+    report = {'team': teamID}
+    team = None
+    started = False
+    try:
+        random.seed(config['seed'] + teamID if config['seed'] is not None else None)
+        log.setup(config['logLevel'])
+        kwargs = dict(config['options'])
+        kwargs.update((k, v) for k, v in node.items() if k != 'team')
+        team = Team(teamID, UDP=True, dilationFactor=config['dilationFactor'], networkSize=config['networkSize'],
+                    udpBackend=config['backend'], channel=_channel(config['channel']), **kwargs)
+        ready.put(teamID)
+        started = True
+        go.wait()
+
+        startTime = time.time()
+        timePassed = main.run(team, config['maxTime'])
+        report['time'] = timePassed
+        report['completed'] = team.completedAt is not None
+        # Time until every file was through, without the rounds main.run()
+        # waits after that
+        report['completionTime'] = team.completedAt - startTime if team.completedAt is not None else None
+        report['framesSent'] = team.framesSent
+        report['framesReceived'] = team.framesReceived
+        report['files'] = _files(team)
+        received = sum(f['bytes'] for f in report['files'])
+        report['bytesReceived'] = received
+        report['goodput'] = received / (report['completionTime'] or timePassed)
+    except Exception as e:
+        report['completed'] = False
+        report['error'] = "{}: {}".format(type(e).__name__, e)
+        if not started:
+            ready.put(teamID)
+    finally:
+        if team is not None:
+            team.close()
+        log.flush()
+    results.put(report)
+
+
+def _overall(reports):
+    done = [r for r in reports if 'error' not in r]
+    completed = len(done) == len(reports) and all(r['completed'] for r in done)
+    overall = {
+        'completed': completed,
+        'intact': completed and all(f['intact'] for r in done for f in r['files']),
+        'time': max([r['time'] for r in done] or [None]),
+        'completionTime': max(r['completionTime'] for r in done) if completed else None,
+        'bytesReceived': sum(r['bytesReceived'] for r in done),
+        'framesSent': sum(r['framesSent'] for r in done),
+        'framesReceived': sum(r['framesReceived'] for r in done),
+    }
+    span = overall['completionTime'] or overall['time']
+    overall['goodput'] = overall['bytesReceived'] / span if span else 0.0
+    return overall
+
+
+# Runs the session of config (see DEFAULTS) and returns the report
+def launch(config):
+    settings = dict(DEFAULTS)
+    settings.update(config)
+    config = settings
+    nodes = config['nodes']
+    if nodes is None:
+        nodes = [{'team': i} for i in range(config['networkSize'])]
+    os.chdir(config['workdir'])
+
+    ready = multiprocessing.Queue()
+    go = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_node, args=(node, config, ready, go, results)) for node in nodes]
+    for process in processes:
+        process.start()
+
+    # Every node is set up before the first one starts its timer
+    for _ in processes:
+        ready.get(True, SETUP_TIMEOUT)
+    go.set()
+
+    reports = {}
+    for _ in processes:
+        report = results.get(True, config['maxTime'] + CLOSE_TIMEOUT)
+        reports[report['team']] = report
+    for process in processes:
+        process.join(CLOSE_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+
+    reports = [reports[node['team']] for node in nodes]
+    return {
+        'config': dict((k, v) for k, v in config.items() if k != 'workdir'),
+        'nodes': reports,
+        'overall': _overall(reports),
+    }
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Runs a network mode session on the UDP emulation, one process "
+                                                 "per team, and reports it as JSON")
+    parser.add_argument('--config', help="JSON file with the session, see DEFAULTS")
+    parser.add_argument('--teams', type=int, dest='networkSize', help="number of teams (network size)")
+    parser.add_argument('--backend', choices=[radio.UDP_UNICAST, radio.UDP_MULTICAST, radio.UDP_SHM])
+    parser.add_argument('--dilation', type=float, dest='dilationFactor')
+    parser.add_argument('--max-time', type=float, dest='maxTime')
+    parser.add_argument('--seed', type=int, help="seed of node i is seed + i")
+    parser.add_argument('--window', type=int, help="data frames per receiver and turn (Team option window)")
+    parser.add_argument('--loss', type=float, help="use the channel model with this frame loss per link")
+    parser.add_argument('--log-level', dest='logLevel', help="log level of the nodes (stderr)")
+    parser.add_argument('--workdir', help="folder with the sendFiles and savingFiles folders")
+    parser.add_argument('--output', help="write the report here instead of stdout")
+    for flag, option in (('--addressing', 'addressing'), ('--duplex', 'duplex'), ('--csma', 'csma'),
+                         ('--rx-thread', 'rxThread')):
+        parser.add_argument(flag, action='store_true', dest=option, help="Team option {}".format(option))
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config is not None:
+        with open(args.config) as f:
+            config = json.load(f)
+    for key in ('networkSize', 'backend', 'dilationFactor', 'maxTime', 'seed', 'logLevel', 'workdir'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    if args.loss is not None:
+        config['channel'] = dict(config.get('channel') or {}, loss=args.loss)
+    options = dict(config.get('options', {}))
+    for option in ('addressing', 'duplex', 'csma', 'rxThread'):
+        if getattr(args, option):
+            options[option] = True
+    if args.window is not None:
+        options['window'] = args.window
+    config['options'] = options
+    return config, args.output
+
+
+def run(argv=None):
+    config, output = parseArgs(argv)
+    report = launch(config)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output is not None:
+        with open(output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    # A session that finished with a file that is not what was sent failed too
+    return 0 if report['overall']['intact'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run())
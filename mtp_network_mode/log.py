@@ -0,0 +1,85 @@
+import logging
+import sys
+from collections import deque
+
+# Logging for the network mode. Every module logs to a child of the "mtp"
+# logger with %-style arguments, which are only formatted if the message is
+# emitted. Below the level a call costs a level check, so the default level
+# (WARNING) does no formatting at all on the frame path. Per-frame messages are
+# DEBUG, protocol steps INFO.
+#
+# Writing to a terminal (over SSH on the Pis) takes milliseconds. With
+# ring=True, setup() keeps the records in memory instead and nothing is
+# formatted or written until flush(), which main.py calls between rounds.
+
+ROOT = "mtp"
+DEFAULT_LEVEL = logging.WARNING
+RING_SIZE = 4096
+FORMAT = "%(relativeCreated)10.1f %(name)-10s %(levelname)-7s %(message)s"
+
+logging.getLogger(ROOT).setLevel(DEFAULT_LEVEL)
+
+
+def getLogger(name):
+    return logging.getLogger(ROOT + "." + name)
+
+
+class RingBufferHandler(logging.Handler):
+    # Keeps the last capacity records and hands them to target on flush(). When
+    # it is full the oldest records go, flush() reports how many
+
+    def __init__(self, target, capacity=RING_SIZE):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.records = deque(maxlen=capacity)
+        self.dropped = 0
+
+    def emit(self, record):
+        if len(self.records) == self.records.maxlen:
+            self.dropped += 1
+        self.records.append(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            records = list(self.records)
+            self.records.clear()
+            dropped = self.dropped
+            self.dropped = 0
+        finally:
+            self.release()
+        if dropped:
+            self.target.handle(logging.makeLogRecord({
+                'name': ROOT, 'levelno': logging.WARNING, 'levelname': "WARNING",
+                'msg': "Log ring buffer full, %d records dropped", 'args': (dropped,)}))
+        for record in records:
+            self.target.handle(record)
+        self.target.flush()
+
+    def close(self):
+        self.flush()
+        logging.Handler.close(self)
+
+
+# Sends the "mtp" logs at level to stream (stderr by default), through a ring
+# buffer of capacity records if ring is set. Returns the handler
+def setup(level=DEFAULT_LEVEL, ring=False, capacity=RING_SIZE, stream=None):
+    logger = logging.getLogger(ROOT)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    if ring:
+        handler = RingBufferHandler(handler, capacity)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return handler
+
+
+# Writes out what the ring buffer holds. Call it where a few ms do not matter
+def flush():
+    for handler in logging.getLogger(ROOT).handlers:
+        handler.flush()
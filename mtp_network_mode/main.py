@@ -1,37 +1,82 @@
 from __future__ import print_function
-import random
 from team import Team
+from radio import UDP_UNICAST
+import log
 import time
 
+logger = log.getLogger("main")
 
-def main():
-    # Network variables
-    dilationFactor = 5
-    networkSize = 3
 
-    print("Hello from the Network Mode")
+# The network mode loop of one team, until every file is through or maxTime
+# seconds passed. Returns the seconds it took, more than maxTime on a timeout
+def run(team, maxTime=120):
     transmission_init = True
-    teamNumber = int(raw_input("What team are you?"))
-    team = Team(teamNumber, UDP=False, dilationFactor=dilationFactor, networkSize=networkSize)
-    timeout = random.uniform(5, 10)
+    timeout = team.firstTimeout()
     startTime = time.time()
     timePassed = 0
-    while not team.checkFinished() and timePassed < 120:
+    while not team.checkFinished() and timePassed < maxTime:
         result, controlPacket = team.waitControl(timeout)
         # If result is 0 it means that timeout passed
         if result == 1:
             transmission_init = False
             team.receiver(controlPacket)
-            timeout = (0.05 + random.uniform(0, 0.01))*dilationFactor
+            timeout = team.receiverTimeout()
         if team.nextPlayer:
-            print("I am the next player, sender mode...")
-            if transmission_init:
-                transmission_init = False
-                team.sender(0)
-            else:
-                team.sender(0.001*dilationFactor)
-            timeout = (0.1 + random.uniform(0, 0.02))*dilationFactor
+            logger.info("I am the next player, sender mode")
+            team.sender(team.senderWait(transmission_init))
+            transmission_init = False
+            timeout = team.senderTimeout()
+        team.dumpProfile()
+        log.flush()
         timePassed = time.time() - startTime
+    return timePassed
+
+
+def main():
+    # Network variables
+    dilationFactor = 5
+    networkSize = 3
+    # Per-team RX addresses, so radios drop data for other teams in hardware
+    addressing = False
+    # Hardware ACKs for data frames (implies addressing, radios only)
+    esb = False
+    # Keep the RX radio listening while the TX radio sends
+    duplex = False
+    # Keep the RX radio receiving between reads, on a thread of its own
+    rxThread = False
+    # Keep the RX radio in RX and the TX radio in TX for the whole run, instead
+    # of switching (and flushing both FIFOs) around every read and write
+    persistent = False
+    # Data frames to every receiver per turn, acknowledged selectively in the
+    # next control frames. Up to packet.WINDOW_MAX, the same on every team
+    window = 1
+    # Sense the channel before sending and back off while it is busy
+    csma = False
+    # How the TX radio waits for each frame to go out: "poll" its STATUS, or
+    # "airtime" to sleep through the computed airtime first (fewer SPI calls)
+    txWait = "poll"
+    # UDP emulation only: UDP_MULTICAST reaches every node with one datagram,
+    # UDP_SHM goes through shared memory instead of sockets (Python 3.8+)
+    udpBackend = UDP_UNICAST
+    # UDP emulation only: a channel.ChannelModel with airtime, collisions and
+    # burst loss, instead of the plain 1 in 21 frame loss
+    channel = None
+    # log.DEFAULT_LEVEL (WARNING) formats nothing on the frame path, INFO shows
+    # the protocol steps and DEBUG every frame. With logRing the records are
+    # kept in memory and only written out between rounds
+    logLevel = log.DEFAULT_LEVEL
+    logRing = False
+
+    log.setup(logLevel, ring=logRing)
+    print("Hello from the Network Mode")
+    teamNumber = int(raw_input("What team are you?"))
+    team = Team(teamNumber, UDP=False, dilationFactor=dilationFactor, networkSize=networkSize,
+                addressing=addressing, esb=esb, duplex=duplex, csma=csma, udpBackend=udpBackend,
+                channel=channel, rxThread=rxThread, persistent=persistent, window=window,
+                txWait=txWait)
+    timePassed = run(team)
+    team.close()
+    log.flush()
 
     if timePassed > 120:
         print("Timeout!")
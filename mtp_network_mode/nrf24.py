@@ -49,6 +49,8 @@ except ImportError:
 import time
 import sys
 
+from lib_nrf24 import SpiProfiler, TxWaitStats
+
 if sys.version > '3':
     long = int
 
@@ -171,6 +173,26 @@ class NRF24:
     RF_PWR_LOW = 0x02
     RF_PWR_HIGH = 0x04
 
+    # Single byte configuration registers mirrored by the shadow copy. STATUS,
+    # OBSERVE_TX, RPD and FIFO_STATUS change on their own and are never cached.
+    SHADOW_REGISTERS = frozenset([CONFIG, EN_AA, EN_RXADDR, SETUP_AW, SETUP_RETR, RF_CH, RF_SETUP,
+                                  RX_PW_P0, RX_PW_P1, RX_PW_P2, RX_PW_P3, RX_PW_P4, RX_PW_P5, DYNPD, FEATURE])
+
+    # TX completion wait strategies, see setTxWait()
+    TX_WAIT_POLL = 'poll'
+    TX_WAIT_AIRTIME = 'airtime'
+    TX_SETTLE = 130e-6          # Standby -> TX (and TX -> RX for the ACK)
+    RX_SETTLE = 130e-6          # Standby -> RX, PLL lock on a new channel
+    RPD_SETTLE = 170e-6         # Standby -> RX plus the 40 us RPD filter delay
+    PD2STBY = 1.5e-3            # Power down -> standby, crystal oscillator start-up
+    TX_WAIT_GUARD = 100e-6      # Wake up this early to absorb sleep overshoot
+    TX_WAIT_SPIN = 500e-6       # Then spin on STATUS at most this long past the airtime
+
+    # Driver methods that get their own entry in the SPI profile
+    PROFILED_METHODS = ('write', 'startWrite', 'startFastWrite', 'write_payload', 'available', 'irqWait', 'read',
+                        'read_payload', 'startListening', 'stopListening', 'powerUp', 'powerDown', 'hop', 'senseCarrier',
+                        'get_status', 'whatHappened', 'clear_irq_flags', 'flush_rx', 'flush_tx', 'sync_registers')
+
     datarate_e_str_P = ["1MBPS", "2MBPS", "250KBPS"]
     model_e_str_P = ["nRF24L01", "nRF24l01+"]
     crclength_e_str_P = ["Disabled", "", "8 bits", "", "16 bits"]
@@ -214,6 +236,17 @@ class NRF24:
         self.auto_ack = 0x3F
         self.address_length = 5
 
+        # Shadow copy of the configuration registers, see read_register_cached()
+        self.shadow = {}
+        self.verify_registers = False
+
+        # SpiProfiler while profiling is enabled, see enable_profiling()
+        self.profiler = None
+
+        # How write() waits for the frame to go out, see setTxWait()
+        self.tx_wait = NRF24.TX_WAIT_POLL
+        self.tx_wait_stats = TxWaitStats()
+
         # If all parameters are available, lets start the radio!
         if major is not None and minor is not None and irq_pin is not None:
             self.begin(major, minor, ce_pin, irq_pin)
@@ -245,6 +278,10 @@ class NRF24:
         self.spidev.lsbfirst = False
         self.spidev.threewire = False
 
+        # Keep profiling across a new begin()
+        if self.profiler is not None:
+            self.profiler.spidev, self.spidev = self.spidev, self.profiler
+
         self.ce_pin = ce_pin
         self.irq_pin = irq_pin
 
@@ -256,6 +293,7 @@ class NRF24:
         time.sleep(5 / 1000000.0)
 
         # Reset radio configuration
+        self.shadow = {}
         self.reset()
 
         # Set 1500uS (minimum for 32B payload in ESB@250KBPS) timeouts, to make testing a little easier
@@ -305,7 +343,7 @@ class NRF24:
             self.spidev = None
 
     def startListening(self):
-        self.write_register(NRF24.CONFIG, self.read_register(NRF24.CONFIG) | NRF24.PWR_UP | NRF24.PRIM_RX)
+        self.update_register(NRF24.CONFIG, self.read_register_cached(NRF24.CONFIG) | NRF24.PWR_UP | NRF24.PRIM_RX)
         self.write_register(NRF24.STATUS, NRF24.RX_DR | NRF24.TX_DS | NRF24.MAX_RT)
 
         self.flush_tx()
@@ -345,6 +383,8 @@ class NRF24:
 
         resp = self.spidev.xfer2(buf)
         if length == 1:
+            if reg in NRF24.SHADOW_REGISTERS:
+                self.shadow[reg] = resp[1]
             return resp[1]
 
         return resp[1:]
@@ -353,8 +393,57 @@ class NRF24:
         """ Write register value """
         buf = [NRF24.W_REGISTER | (NRF24.REGISTER_MASK & reg)]
         buf += self._to_8b_list(value)
+        if len(buf) == 2 and reg in NRF24.SHADOW_REGISTERS:
+            self.shadow[reg] = buf[1]
         self.spidev.xfer2(buf)
 
+    def read_register_cached(self, reg):
+        """ Read a configuration register from the shadow copy, falling back
+            to SPI the first time or when verify_registers is set. """
+        if not self.verify_registers:
+            value = self.shadow.get(reg)
+            if value is not None:
+                return value
+        return self.read_register(reg)
+
+    def update_register(self, reg, value):
+        """ Write a configuration register only if its value changes.
+            Returns True if an SPI write was issued. """
+        if not self.verify_registers and self.shadow.get(reg) == value:
+            return False
+        self.write_register(reg, value)
+        return True
+
+    def sync_registers(self):
+        """ Re-read all shadowed registers from the radio. Returns the
+            registers whose cached value was stale. """
+        stale = []
+        for reg in sorted(NRF24.SHADOW_REGISTERS):
+            cached = self.shadow.get(reg)
+            if self.read_register(reg) != cached and cached is not None:
+                stale.append(reg)
+        return stale
+
+    def enable_profiling(self):
+        """ Route SPI traffic through a lib_nrf24.SpiProfiler and return it. """
+        if self.profiler is None:
+            self.profiler = SpiProfiler()
+            if self.spidev is not None:
+                self.profiler.attach(self, NRF24.PROFILED_METHODS)
+            else:
+                # Not begun yet: begin() slides the profiler in front of the device
+                for name in NRF24.PROFILED_METHODS:
+                    setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+        return self.profiler
+
+    def disable_profiling(self):
+        """ Back to the bare spidev object. Returns the profiler. """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.detach(self, NRF24.PROFILED_METHODS)
+            self.profiler = None
+        return profiler
+
     def write_payload(self, buf):
         """ Writes data to the payload register, automatically padding it
             to match the required length. Returns the number of bytes
@@ -442,10 +531,18 @@ class NRF24:
         if channel < 0 or channel > self.MAX_CHANNEL:
             raise RuntimeError("Channel number out of range")
         self.channel = channel
-        self.write_register(NRF24.RF_CH, channel)
+        self.update_register(NRF24.RF_CH, channel)
+
+    def hop(self, channel):
+        """ Retune a listening radio without flushing the RX FIFO: CE low,
+            one RF_CH write, CE high and the PLL settling time. """
+        self.ce(0)
+        self.setChannel(channel)
+        self.ce(1)
+        time.sleep(NRF24.RX_SETTLE)
 
     def getChannel(self):
-        return self.read_register(NRF24.RF_CH)
+        return self.read_register_cached(NRF24.RF_CH)
 
     def setPayloadSize(self, size):
         self.payload_size = min(max(size, 1), NRF24.MAX_PAYLOAD_SIZE)
@@ -483,18 +580,18 @@ class NRF24:
         self.clear_irq_flags()
 
         # Enable TX
-        self.write_register(NRF24.CONFIG,
-                            (self.read_register(NRF24.CONFIG) | NRF24.PWR_UP) & ~NRF24.PRIM_RX)
+        self.update_register(NRF24.CONFIG,
+                             (self.read_register_cached(NRF24.CONFIG) | NRF24.PWR_UP) & ~NRF24.PRIM_RX)
 
         # Enable pipe 0 for auto-ack
-        self.write_register(NRF24.EN_RXADDR, self.read_register(NRF24.EN_RXADDR) | 1)
+        self.update_register(NRF24.EN_RXADDR, self.read_register_cached(NRF24.EN_RXADDR) | 1)
 
     def powerDown(self):
-        self.write_register(NRF24.CONFIG, self.read_register(NRF24.CONFIG) & ~ NRF24.PWR_UP)
+        self.update_register(NRF24.CONFIG, self.read_register_cached(NRF24.CONFIG) & ~ NRF24.PWR_UP)
 
     def powerUp(self):
-        self.write_register(NRF24.CONFIG, self.read_register(NRF24.CONFIG) | NRF24.PWR_UP)
-        time.sleep(150e-6)
+        if self.update_register(NRF24.CONFIG, self.read_register_cached(NRF24.CONFIG) | NRF24.PWR_UP):
+            time.sleep(150e-6)
 
     def write(self, buf):
         self.last_error = None
@@ -518,17 +615,48 @@ class NRF24:
         #print monotonic() - sent_at
         #print packet_time
 
-        while monotonic() < timeout:
-            time.sleep(packet_time)
-            status = self.get_status()
+        if self.tx_wait == NRF24.TX_WAIT_AIRTIME:
+            # Sleep through the exact airtime, then spin on STATUS
+            expected = sent_at + self.getAirtime(length)
+            timeout = max(timeout, expected + NRF24.TX_WAIT_SPIN)
+            delay = expected - NRF24.TX_WAIT_GUARD - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            polls = 0
+            while True:
+                status = self.get_status()
+                polls += 1
+                now = monotonic()
+                if status & (NRF24.TX_DS | NRF24.MAX_RT) or now >= timeout:
+                    break
+                if now > expected + NRF24.TX_WAIT_SPIN:
+                    time.sleep(packet_time)  # Retransmits, back to the usual pace
+
+            if status & (NRF24.TX_DS | NRF24.MAX_RT):
+                self.tx_wait_stats.add(now - expected, polls)
+            else:
+                self.tx_wait_stats.timeouts += 1
+                self.tx_wait_stats.polls += polls
+
             if status & NRF24.TX_DS:
                 self.ce(0)
                 return True
 
             if status & NRF24.MAX_RT:
                 self.last_error = 'MAX_RT'
-                self.ce(0)
-                break
+        else:
+            while monotonic() < timeout:
+                time.sleep(packet_time)
+                status = self.get_status()
+                if status & NRF24.TX_DS:
+                    self.ce(0)
+                    return True
+
+                if status & NRF24.MAX_RT:
+                    self.last_error = 'MAX_RT'
+                    self.ce(0)
+                    break
 
         self.ce(0)
         if self.last_error is None:
@@ -537,6 +665,25 @@ class NRF24:
         self.flush_tx()  # Avoid leaving the payload in tx fifo
         return False
 
+    def setTxWait(self, strategy):
+        """ Select how write() waits for the frame to go out.
+            TX_WAIT_POLL sleeps packet_time between STATUS polls (default),
+            TX_WAIT_AIRTIME sleeps through the computed airtime and then spins
+            on STATUS. Its jitter is collected in tx_wait_stats. """
+        self.tx_wait = strategy
+        self.tx_wait_stats.reset()
+
+    def getAirtime(self, length):
+        """ Seconds from CE high until TX_DS is expected for a payload of
+            length bytes, ACK round trip included if pipe 0 is auto-acked. """
+        preamble = 2 if self.data_rate_bits == 2000 else 1
+        overhead = (preamble + self.address_length + self.crc_length) * 8 + 9
+        rate = self.data_rate_bits * 1000.
+        airtime = NRF24.TX_SETTLE + (overhead + length * 8) / rate
+        if self.auto_ack & 0x01:
+            airtime += NRF24.TX_SETTLE + overhead / rate
+        return airtime
+
     def startFastWrite(self, buf):
         """
             Do not wait for CE HIGH->LOW
@@ -635,11 +782,11 @@ class NRF24:
         # pipes at once.  However, I thought it would make the calling code
         # more simple to do it this way.
         self.write_register(NRF24.EN_RXADDR,
-                            self.read_register(NRF24.EN_RXADDR) | (1 << pipe))
+                            self.read_register_cached(NRF24.EN_RXADDR) | (1 << pipe))
 
     def closeReadingPipe(self, pipe):
         self.write_register(NRF24.EN_RXADDR,
-                            self.read_register(NRF24.EN_RXADDR) & ~(1 << pipe))
+                            self.read_register_cached(NRF24.EN_RXADDR) & ~(1 << pipe))
 
     def toggle_features(self):
         buf = [NRF24.ACTIVATE, 0x73]
@@ -647,36 +794,36 @@ class NRF24:
 
     def enableDynamicPayloads(self):
         # Enable dynamic payload throughout the system
-        self.write_register(NRF24.FEATURE, self.read_register(NRF24.FEATURE) | NRF24.EN_DPL)
+        self.write_register(NRF24.FEATURE, self.read_register_cached(NRF24.FEATURE) | NRF24.EN_DPL)
 
         # If it didn't work, the features are not enabled
         if not self.read_register(NRF24.FEATURE):
             # So enable them and try again
             self.toggle_features()
-            self.write_register(NRF24.FEATURE, self.read_register(NRF24.FEATURE) | NRF24.EN_DPL)
+            self.write_register(NRF24.FEATURE, self.read_register_cached(NRF24.FEATURE) | NRF24.EN_DPL)
 
         # Enable dynamic payload on all pipes
 
         # Not sure the use case of only having dynamic payload on certain
         # pipes, so the library does not support it.
-        self.write_register(NRF24.DYNPD, self.read_register(NRF24.DYNPD) | 0b00111111)
+        self.write_register(NRF24.DYNPD, self.read_register_cached(NRF24.DYNPD) | 0b00111111)
 
         self.dynamic_payloads_enabled = True
 
     def enableAckPayload(self):
         # enable ack payload and dynamic payload features
         self.write_register(NRF24.FEATURE,
-                            self.read_register(NRF24.FEATURE) | NRF24.EN_ACK_PAY | NRF24.EN_DPL)
+                            self.read_register_cached(NRF24.FEATURE) | NRF24.EN_ACK_PAY | NRF24.EN_DPL)
 
         # If it didn't work, the features are not enabled
         if not self.read_register(NRF24.FEATURE):
             # So enable them and try again
             self.toggle_features()
             self.write_register(NRF24.FEATURE,
-                                self.read_register(NRF24.FEATURE) | NRF24.EN_ACK_PAY | NRF24.EN_DPL)
+                                self.read_register_cached(NRF24.FEATURE) | NRF24.EN_ACK_PAY | NRF24.EN_DPL)
 
         # Enable dynamic payload on pipes 0 & 1
-        self.write_register(NRF24.DYNPD, self.read_register(NRF24.DYNPD) | NRF24.DPL_P1 | NRF24.DPL_P0)
+        self.write_register(NRF24.DYNPD, self.read_register_cached(NRF24.DYNPD) | NRF24.DPL_P1 | NRF24.DPL_P0)
 
     def writeAckPayload(self, pipe, buf, buf_len):
         txbuffer = [NRF24.W_ACK_PAYLOAD | (pipe & 0x7)]
@@ -697,17 +844,17 @@ class NRF24:
 
     def setAutoAck(self, enable):
         if enable:
-            self.write_register(NRF24.EN_AA, 0x3F)
+            self.update_register(NRF24.EN_AA, 0x3F)
             self.auto_ack = 0x3f
             if self.crc_length == 0:
                 self.setCRCLength(NRF24.CRC_8)  # Enhanced Shockburst requires at least 1 byte CRC
         else:
             self.auto_ack = 0
-            self.write_register(NRF24.EN_AA, 0)
+            self.update_register(NRF24.EN_AA, 0)
 
     def setAutoAckPipe(self, pipe, enable):
         if pipe <= 6:
-            en_aa = self.read_register(NRF24.EN_AA)
+            en_aa = self.read_register_cached(NRF24.EN_AA)
             if enable:
                 self.setCRCLength(NRF24.CRC_8)  # Enhanced Shockburst requires at least 1 byte CRC
                 en_aa |= 1 << pipe
@@ -726,8 +873,28 @@ class NRF24:
     def testCarrier(self):
         return self.read_register(NRF24.RPD) & 1
 
+    def senseCarrier(self):
+        """ Clear channel assessment: True if something above -64 dBm is on the
+            channel right now. RPD keeps its value from the last packet or CE low,
+            so RX is restarted for the settling time first. A radio in TX mode is
+            put back there afterwards, powered up. """
+        config = self.read_register_cached(NRF24.CONFIG)
+        listening = config & NRF24.PRIM_RX
+        if not listening:
+            self.update_register(NRF24.CONFIG, config | NRF24.PWR_UP | NRF24.PRIM_RX)
+            if not config & NRF24.PWR_UP:
+                time.sleep(NRF24.PD2STBY)
+        self.ce(0)
+        self.ce(1)
+        time.sleep(NRF24.RPD_SETTLE)
+        busy = self.testCarrier()
+        if not listening:
+            self.ce(0)
+            self.update_register(NRF24.CONFIG, config | NRF24.PWR_UP)
+        return busy == 1
+
     def setPALevel(self, level):
-        setup = self.read_register(NRF24.RF_SETUP)
+        setup = self.read_register_cached(NRF24.RF_SETUP)
         setup &= ~(NRF24.RF_PWR_LOW | NRF24.RF_PWR_HIGH)
 
         if level == NRF24.PA_MAX:
@@ -745,7 +912,7 @@ class NRF24:
         self.write_register(NRF24.RF_SETUP, setup)
 
     def getPALevel(self):
-        power = self.read_register(NRF24.RF_SETUP) & (NRF24.RF_PWR_LOW | NRF24.RF_PWR_HIGH)
+        power = self.read_register_cached(NRF24.RF_SETUP) & (NRF24.RF_PWR_LOW | NRF24.RF_PWR_HIGH)
         if power == (NRF24.RF_PWR_LOW | NRF24.RF_PWR_HIGH):
             return NRF24.PA_MAX
         elif power == NRF24.RF_PWR_HIGH:
@@ -756,7 +923,7 @@ class NRF24:
             return NRF24.PA_MIN
 
     def setDataRate(self, speed):
-        setup = self.read_register(NRF24.RF_SETUP)
+        setup = self.read_register_cached(NRF24.RF_SETUP)
         setup &= ~(NRF24.RF_DR_LOW | NRF24.RF_DR_HIGH)
 
         if speed == NRF24.BR_250KBPS:
@@ -782,7 +949,7 @@ class NRF24:
         return self.read_register(NRF24.RF_SETUP) == setup
 
     def getDataRate(self):
-        dr = self.read_register(NRF24.RF_SETUP) & (NRF24.RF_DR_LOW | NRF24.RF_DR_HIGH)
+        dr = self.read_register_cached(NRF24.RF_SETUP) & (NRF24.RF_DR_LOW | NRF24.RF_DR_HIGH)
         # Order matters in our case below
         if dr == NRF24.RF_DR_LOW:
             # '10' = 250KBPS
@@ -795,7 +962,7 @@ class NRF24:
             return NRF24.BR_1MBPS
 
     def setCRCLength(self, length):
-        config = self.read_register(NRF24.CONFIG) & ~(NRF24.EN_CRC | NRF24.CRCO)
+        config = self.read_register_cached(NRF24.CONFIG) & ~(NRF24.EN_CRC | NRF24.CRCO)
 
         if length == NRF24.CRC_DISABLED:
             self.crc_length = 0
@@ -812,7 +979,7 @@ class NRF24:
 
     def getCRCLength(self):
         result = NRF24.CRC_DISABLED
-        config = self.read_register(NRF24.CONFIG) & (NRF24.CRCO | NRF24.EN_CRC)
+        config = self.read_register_cached(NRF24.CONFIG) & (NRF24.CRCO | NRF24.EN_CRC)
 
         if config & NRF24.EN_CRC:
             if config & NRF24.CRCO:
@@ -823,7 +990,7 @@ class NRF24:
         return result
 
     def disableCRC(self):
-        disable = self.read_register(NRF24.CONFIG) & ~NRF24.EN_CRC
+        disable = self.read_register_cached(NRF24.CONFIG) & ~NRF24.EN_CRC
         self.write_register(NRF24.CONFIG, disable)
 
     def setRetries(self, delay, count):
@@ -834,7 +1001,7 @@ class NRF24:
         self.timeout = (self.payload_size / float(self.data_rate_bits) + self.delay)
 
     def getRetries(self):
-        return self.read_register(NRF24.SETUP_RETR)
+        return self.read_register_cached(NRF24.SETUP_RETR)
 
     def getMaxTimeout(self):
         return self.max_timeout
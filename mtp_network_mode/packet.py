@@ -1,9 +1,19 @@
+import log
+
 MY_TEAM = 2
 NEXT = 3
 TX_ACK = [0, 0, 0, 0]
 RX_ACK = [0, 0, 0, 0]
 PAYLOAD_SIZE = 32
 HEADER_SIZE = 1
+# Selective ACKs (data windows of more than one frame): after the header a
+# control frame carries, for every team but its sender in order, the next
+# packet counter it expects from that team and a bitmap of the packets after
+# that one it already has (bit j is counter + 1 + j)
+SACK_BITS = 8
+WINDOW_MAX = SACK_BITS + 1
+
+logger = log.getLogger("packet")
 
 
 def printBinary(byte):
@@ -31,22 +41,40 @@ def getSender(header):
     return binaryStrToInt(header[1:3])
 
 
-def generateControl(myteam, next_team, saving_files, networkSize):
+def generateControl(myteam, next_team, saving_files, networkSize, sack=False):
     header = int((myteam << 5) + (next_team << 3))
     count = 0
     for i in range(networkSize):
         if i != myteam:
             header += saving_files[i].send_ack << 2 - count
             count += 1
-    return [header]
+    control = [header]
+    if sack:
+        for i in range(networkSize):
+            if i != myteam:
+                control.extend(saving_files[i].sackState())
+    return control
+
+
+# The selective ACK of a control frame for teamID, as (next counter, bitmap).
+# None if the frame has none or is teamID's own
+def getSACK(buf, teamID, networkSize):
+    sender = getSender(buf[0])
+    if sender == teamID or teamID >= networkSize:
+        return None
+    offset = HEADER_SIZE + 2 * (teamID if teamID < sender else teamID - 1)
+    if len(buf) < offset + 2:
+        return None
+    return buf[offset], buf[offset + 1]
 
 
 # Generate control packet
 def generateDataPacket(payload, rx_id, numPacket):
     header = (rx_id << 5) + numPacket
     # The first bit is 1 in data header
-    header = [set_bit(header, 7, 1)]
-    frameData = header + payload
+    # Built as a bytearray so the radio driver can copy it in one go
+    frameData = bytearray([set_bit(header, 7, 1)])
+    frameData.extend(payload)
     return frameData
 
 
@@ -59,7 +87,6 @@ def isControl(buf, teamID, networkSize):
     sender = binaryStrToInt(header[1:3])
     next_sender = binaryStrToInt(header[3:5])
 
-    print("Acks are: {}".format(header[5:8]))
     # ACKs start at bit 5
     count = 5
     acks = [0, 0, 0, 0]
@@ -68,7 +95,7 @@ def isControl(buf, teamID, networkSize):
             acks[i] = int(header[count])
             count += 1
     ack = acks[teamID]
-    print("ACKS: {}".format(acks))
+    logger.debug("ACKs: %s", acks)
     return packet_type, sender, ack, next_sender
 
 
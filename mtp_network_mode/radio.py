@@ -2,28 +2,198 @@ import time
 import socket
 import select
 import random
+import struct
+import logging
+import threading
+from collections import deque
+
+# Use a monotonic clock if available for the receive timestamps
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+import log
+
+logger = log.getLogger("radio")
+
+# Addressing mode: every team reads its own address on pipe 1 and the shared
+# broadcast address on pipe 2, so the nRF24 drops data meant for other teams
+# before it reaches the RX FIFO. Pipes 2-5 only have their own last byte and
+# take the rest from pipe 1, hence the common first four bytes. The broadcast
+# address is the one every team used before, so control frames still reach
+# radios that are not in addressing mode.
+ADDRESS_BASE = [0xe7, 0xe7, 0xe7, 0xe7]
+BROADCAST_ADDRESS = ADDRESS_BASE + [0xe7]
+
+
+def teamAddress(teamID):
+    return ADDRESS_BASE + [0xa0 + teamID]
+
+
+# Enhanced ShockBurst retransmits: 1500 us apart, which leaves room for a full
+# ACK payload at 250 kbps, and up to 5 times
+ESB_RETRIES = (0b0101, 5)
+
+# CSMA, see Radio.enableCSMA(): on a busy channel wait a random number of slots
+# out of a contention window that doubles every time, up to CSMA_MAX_WINDOW.
+# After CSMA_MAX_BACKOFFS the frame goes out anyway. A slot is about the
+# airtime of a full frame at 250 kbps
+CSMA_SLOT = 0.0015
+CSMA_MIN_WINDOW = 4
+CSMA_MAX_WINDOW = 32
+CSMA_MAX_BACKOFFS = 5
+
+# UDP emulation: kernel receive buffer of the RX socket, room for a few dozen
+# frames, and the largest frame (an nRF24 payload)
+UDP_RCVBUF = 16384
+UDP_FRAME_SIZE = 32
+
+# UDP emulation backends. UDP_UNICAST sends a copy of every frame to each other
+# team's port. UDP_MULTICAST sends it once to a group that every emulated radio
+# joins, so all nodes get it at the same time, as on air, and the cost of a
+# write does not grow with the network. Multicast frames start with a
+# [source team, last address byte] header. Receivers drop their own frames and
+# the addresses their pipes would not accept.
+UDP_UNICAST = "unicast"
+UDP_MULTICAST = "multicast"
+# UDP_SHM leaves the network stack out: nodes on the host exchange frames
+# through shared memory rings, see shm.py (Python 3.8+). Fast enough to run the
+# protocol well beyond real time
+UDP_SHM = "shm"
+UDP_MCAST_GROUP = "239.255.50.5"
+UDP_MCAST_PORT = 5100
+UDP_HEADER_SIZE = 2
+# With a channel model (see channel.py) frames also carry the source team and
+# the time they went on air, after the multicast header
+CHANNEL_HEADER = struct.Struct("<Bd")
+
+# Receiver thread, see Radio.startReceiver(): frames it keeps before the oldest
+# are dropped, how long it blocks on the radio before checking for stop(), and
+# its sleep between polls of a radio without IRQ line. A frame takes 1.3 ms at
+# 250 kbps, so the 3-deep RX FIFO does not fill up in between
+RX_QUEUE_SIZE = 64
+RX_POLL_TIMEOUT = 0.01
+RX_POLL_INTERVAL = 0.0005
+
+
+class Frame(object):
+    # A received frame, see Radio.readFrame(). timestamp is the monotonic time
+    # it was taken off the radio, pipe the pipe it came in on, rpd whether it
+    # was received above -64 dBm and fifoDepth how many frames were still in the
+    # RX FIFO behind it. The UDP emulation has no pipes, RPD or FIFO, those are
+    # None there. payload is bytes (a str on Python 2)
+    #
+    # The radio keeps neither for each frame in its FIFO, so timestamp and rpd
+    # are read once per Radio.drain(), after the FIFO is empty: frames drained
+    # together share both. timestamp can be a few frame times after a frame
+    # came in, and rpd is the level of the last frame received, which may be a
+    # later one than this
+    __slots__ = ('timestamp', 'pipe', 'rpd', 'fifoDepth', 'payload')
+
+    def __init__(self, timestamp, pipe, rpd, fifoDepth, payload):
+        self.timestamp = timestamp
+        self.pipe = pipe
+        self.rpd = rpd
+        self.fifoDepth = fifoDepth
+        self.payload = payload
+
 
 class Radio(object):
 
-    def __init__(self, pipes, rx, pins, teamID, UDP=False):
+    def __init__(self, pipes, rx, pins, teamID, UDP=False, irqPin=None, txWait="poll", addressing=False,
+                 esb=False, udpBackend=UDP_UNICAST, networkSize=4, channel=None, persistent=False):
         # ### Radio interfaces ####
         self.UDP = UDP
+        self.rx = rx
         self.teamID = teamID
+        # With addressing, write() sends frames with a destination to that team only
+        self.addressing = addressing
+        # Enhanced ShockBurst: frames with a destination are acknowledged and
+        # retransmitted by the radios, the rest go out with NO_ACK. Needs
+        # addressing, as several receivers would ACK the same frame otherwise
+        self.esb = esb and not UDP
+        # Loaded as the ACK payload for frames on the own address, see setAckPayload()
+        self.ackPayload = None
+        # The one in the radio's TX FIFO, None once a frame took it
+        self.armedAckPayload = None
+        # Persistent listening: an RX radio stays in PRX and a TX radio in PTX
+        # for the whole run. They are separate chips, so there is no need to
+        # switch roles (and flush both FIFOs) around every read and write
+        self.persistent = persistent and not UDP
+        # Radio that senses the channel before each write, see enableCSMA()
+        self.senseRadio = None
+        # Held for every SPI and CE sequence that can run on two threads at once:
+        # the receiver thread and carrier sense, which the TX side runs on this
+        # radio (see channelBusy())
+        self.lock = threading.RLock()
+        # RPD holds its value once a frame came in, until RX is restarted
+        self.rpdLatched = False
+        self.csmaStats = {'writes': 0, 'busy': 0, 'forced': 0, 'backoff': 0.0}
+        # With the IRQ line wired, read() sleeps on it instead of polling over SPI
+        self.irqPin = irqPin
+        # Frames drained from the RX FIFO but not yet handed to the caller
+        self.pending = deque()
+        # Receiver thread and its queue of Frames, see startReceiver()
+        self.receiver = None
+        self.receiverStop = threading.Event()
+        self.rxQueue = deque()
+        self.rxQueueSize = RX_QUEUE_SIZE
+        self.rxReady = threading.Condition()
+        self.rxStats = {'frames': 0, 'overflows': 0, 'maxDepth': 0}
         if UDP:
             self.UDP_IP = "127.0.0.1"
-            if rx:
-                self.rx_UPD_port = 5005 + teamID
+            self.udpBackend = udpBackend
+            # Airtime, collisions, loss and delay of the emulated channel
+            self.channel = channel
+            self.channelRX = channel.receiver(teamID) if channel is not None and rx else None
+            # Frames dropped by the plain 1 in 21 loss, see readUDP()
+            self.udpLost = 0
+            multicast = udpBackend == UDP_MULTICAST
+            # The pipes of the hardware radio, for the backends that see every frame
+            self.rxAddresses = [BROADCAST_ADDRESS[-1]]
+            if addressing:
+                self.rxAddresses.append(teamAddress(teamID)[-1])
+            self.shm = None
+            if udpBackend == UDP_SHM:
+                import shm
+
+                if rx:
+                    self.shm = shm.ShmReceiver(teamID, networkSize, self.rxAddresses)
+                else:
+                    self.shm = shm.ShmTransmitter(teamID, networkSize)
+            elif rx:
+                self.rx_UPD_port = UDP_MCAST_PORT if multicast else 5005 + teamID
+                # Bound once for the whole run, so frames that come in between two
+                # read() calls wait in the kernel instead of being dropped
+                self.rx_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.rx_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
+                if multicast:
+                    # Every radio on the host binds the same port
+                    self.rx_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    self.rx_socket.bind((UDP_MCAST_GROUP, self.rx_UPD_port))
+                    membership = struct.pack("4s4s", socket.inet_aton(UDP_MCAST_GROUP), socket.inet_aton(self.UDP_IP))
+                    self.rx_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+                else:
+                    self.rx_socket.bind((self.UDP_IP, self.rx_UPD_port))
+                self.rx_socket.setblocking(0)
+                self.rx_buffer = bytearray(UDP_HEADER_SIZE + CHANNEL_HEADER.size + UDP_FRAME_SIZE)
 
             else:
-                self.tx_UDP_ports = [5005 + i for i in range(4)]
-                self.tx_UDP_ports.remove(5005 + teamID)
+                self.tx_UDP_ports = [5005 + i for i in range(networkSize) if i != teamID]
                 self.tx_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                if multicast:
+                    # Stay on this host
+                    self.tx_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                              socket.inet_aton(self.UDP_IP))
+                    self.tx_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 0)
+                    self.tx_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
         else:
             # from nrf24 import NRF24
             # import RPi.GPIO as GPIO
             import spidev
             import RPi.GPIO as GPIO
-            from lib_nrf24 import NRF24
+            from lib_nrf24 import NRF24, RadioProfile
 
             GPIO.setmode(GPIO.BCM)
 
@@ -64,94 +234,519 @@ class Radio(object):
             # self.radio.begin(1, 27)
 
 
-            GPIO.setup(pins[1], GPIO.OUT, initial=GPIO.LOW)
-            self.radio.begin(pins[0],pins[1])
-            
-            time.sleep(1)
-
-            # self.radio.setRetries(15, 15)
-            self.radio.setPayloadSize(PLOAD_SIZE)
-            self.radio.setChannel(RF_CH[0])
-            
-            self.radio.setDataRate(BRATE)
-            self.radio.setPALevel(PWR_LVL)
-            self.radio.setCRCLength(NRF24.CRC_8)
-
-            self.radio.setAutoAck(False)
-            self.radio.enableDynamicPayloads()
-            self.radio.enableAckPayload()
-            
+            # The whole configuration goes to begin(), which waits for the chip to
+            # answer and then writes only the registers that need to change
+            profile = RadioProfile(payload_size=PLOAD_SIZE, channel=RF_CH[0], data_rate=BRATE, pa_level=PWR_LVL,
+                                   crc_length=NRF24.CRC_8, auto_ack=False, dynamic_payloads=True, ack_payloads=True)
+            if self.esb:
+                profile = profile.merged(RadioProfile(auto_ack=True, retries=ESB_RETRIES, dynamic_ack=True))
             # self.radio.openWritingPipe(pipes[0])
-            # Open the writing and reading pipe
+            # Open the writing and reading pipe. pipes is a single address, or a
+            # dict of pipe number to address for several reading pipes
             if rx:
-                self.radio.openReadingPipe(0, self.pipes)
+                profile.rx_pipes = self.pipes if isinstance(self.pipes, dict) else {0: self.pipes}
             else:
-                self.radio.openWritingPipe(self.pipes)
+                profile.tx_address = self.pipes
+                self.txAddress = self.pipes
+
+            GPIO.setup(pins[1], GPIO.OUT, initial=GPIO.LOW)
+            if not self.radio.begin(pins[0], pins[1], irqPin, profile):
+                # Nothing answered on SPI, see NRF24.waitReady()
+                logger.error("NRF24L01+ not responding.")
+                return
+
+            # How write() waits for the frame to go out: "poll" STATUS every 10 us,
+            # or sleep through the computed "airtime" first (NRF24.setTxWait())
+            self.radio.setTxWait(txWait)
             
             if not self.radio.isPVariant():
                 # If self.radio configures correctly, we confirmed a "plus" (ie "variant") nrf24l01+
                 # Else print diagnostic stuff & exit.
                 self.radio.printDetails()
                 # (or we could always just print details anyway, even on good setup, for debugging)
-                print ("NRF24L01+ not found.")
+                logger.error("NRF24L01+ not found.")
                 return
 
             self.radio.printDetails()
 
+            if self.persistent and rx:
+                # Receiving from now on, not just from the first read()
+                self.radio.startListening()
+
             timeout = time.time() + 0.1
 
     # Returns 0 if timer passed and 1 if something received
     def read(self, timeOut):
-        buf = []
+        if self.UDP and self.receiver is None:
+            return self.readUDP(timeOut)
+        frame = self.readFrame(timeOut)
+        if frame is None:
+            return 0, None
+        return 1, list(bytearray(frame.payload))
+
+    # Like read(), but returns the Frame with its timestamp, pipe, RPD and FIFO
+    # depth, or None after timeOut seconds
+    def readFrame(self, timeOut):
+        if self.receiver is not None:
+            deadline = time.time() + timeOut
+            with self.rxReady:
+                while not self.rxQueue:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.rxReady.wait(remaining)
+                return self.rxQueue.popleft()
         if self.UDP:
-            rx_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            rx_socket.bind((self.UDP_IP, self.rx_UPD_port))
-            rx_socket.setblocking(0)
-
-            # print("Reading from socket...")
-            ready = select.select([rx_socket], [], [], timeOut)
-            if len(ready[0]) > 0:
-                data, _ = rx_socket.recvfrom(1024)
-                data = [ord(byte) for byte in data]
-                # print("Received packet of len {} with header {:08b}".format(len(data), data[0]))
-                rx_socket.close()
-
-                # Emulate error probability
-                error = random.randint(0, 20)
-                if error == 1:
-                    return 0, None
-                return 1, data
-            else:
-                rx_socket.close()
-                return 0, None
-        else:
+            result, data = self.readUDP(timeOut)
+            if result == 0:
+                return None
+            return Frame(monotonic(), None, None, None, bytes(bytearray(data)))
 
-            startTime = time.time()
+        # Frames left over from the last drain of the RX FIFO go first
+        if self.pending:
+            return self.pending.popleft()
+
+        if self.persistent:
+            return self.readListening(timeOut)
+
+        self.radio.startListening()
+        # stopListening() flushed the last one
+        self.armedAckPayload = None
+        self.armAckPayload()
+        if self.waitFrame(timeOut):
+            # Drain the whole RX FIFO before stopListening() flushes it
+            self.pending.extend(self.drain())
+        self.radio.stopListening()
+        if not self.pending:
+            return None
+        return self.pending.popleft()
+
+    # read() in persistent listening mode: only the first call starts listening,
+    # and the FIFOs (with frames and the ACK payload) survive between calls
+    def readListening(self, timeOut):
+        if not self.radio.listening:
             self.radio.startListening()
-            # TODO: check if this is correct
-            while (time.time() - startTime) < timeOut and not self.radio.available([0]):
-                pass
+        self.armAckPayload()
+        if self.waitFrame(timeOut):
+            self.pending.extend(self.drain())
+        if not self.pending:
+            return None
+        return self.pending.popleft()
 
-            if not self.radio.available([0]):
-                # Return 0 if timeout reached
-                self.radio.stopListening()
+    # Takes every frame off the RX FIFO as Frames. RPD is latched by the last
+    # frame received and the FIFO has no arrival times, so the frames drained
+    # together share the timestamp and RPD read here (see Frame). One more SPI
+    # transaction per drain
+    def drain(self):
+        frames = self.radio.read_all()
+        if not frames:
+            return []
+        timestamp = monotonic()
+        rpd = self.radio.testRPD() == 1
+        self.rpdLatched = True
+        drained = []
+        for i, (pipe, buf, status) in enumerate(frames):
+            logger.debug("Received on pipe %d: %s", pipe, buf)
+            drained.append(Frame(timestamp, pipe, rpd, len(frames) - i - 1, bytes(bytearray(buf))))
+            if pipe == 1:
+                # The ACK of a frame on our own address took the ACK payload
+                self.armedAckPayload = None
+        return drained
+
+    # Waits up to timeOut seconds for a frame in the RX FIFO of a listening radio
+    def waitFrame(self, timeOut):
+        startTime = time.time()
+        if self.irqPin is not None:
+            received = False
+            timePassed = 0
+            # Loop in case the IRQ fires for something other than a received frame
+            while not received and timePassed < timeOut:
+                received = self.radio.available([0], irq_wait=True, irq_timeout=timeOut - timePassed)
+                timePassed = time.time() - startTime
+            return received
+        # TODO: check if this is correct
+        while (time.time() - startTime) < timeOut and not self.radio.available([0]):
+            pass
+        return self.radio.available([0])
+
+    # ESB: loads the ACK payload unless it is still in the TX FIFO. A new one
+    # replaces the old one
+    def armAckPayload(self):
+        if self.ackPayload is self.armedAckPayload:
+            return
+        if self.armedAckPayload is not None:
+            self.radio.flush_tx()
+        self.armedAckPayload = self.ackPayload
+        if self.ackPayload is not None:
+            self.radio.writeAckPayload(1, self.ackPayload, len(self.ackPayload))
+
+    def readUDP(self, timeOut):
+        # print("Reading from socket...")
+        deadline = time.time() + timeOut
+        while True:
+            due = None
+            if self.channelRX is not None:
+                # Frames held by the channel model go first, once their airtime is
+                # over. Whatever is still queued goes into the model before, as it
+                # may have collided with them
+                self.feedChannel()
+                data = self.channelRX.pop(time.time())
+                if data is not None:
+                    return 1, data
+                due = self.channelRX.due()
+                if due is not None and due >= deadline:
+                    due = None
+
+            if self.shm is not None:
+                frame = self.shm.receive(max(0, (due or deadline) - time.time()))
+                if frame is None:
+                    if due is None and time.time() >= deadline:
+                        return 0, None
+                    continue
+            else:
+                ready = select.select([self.rx_socket], [], [], max(0, (due or deadline) - time.time()))
+                if len(ready[0]) == 0:
+                    if due is not None:
+                        continue
+                    return 0, None
+                frame = self.recvUDP()
+                if frame is None:
+                    continue
+            src, start, data, accepted = frame
+            if self.channelRX is not None:
+                self.channelRX.push(src, start, data, accepted)
+                continue
+            if not accepted:
+                continue
+            # print("Received packet of len {} with header {:08b}".format(len(data), data[0]))
+
+            # Emulate error probability
+            error = random.randint(0, 20)
+            if error == 1:
+                self.udpLost += 1
                 return 0, None
+            return 1, data
+
+    # Moves every frame waiting in the RX socket or ring into the channel model
+    def feedChannel(self):
+        while True:
+            if self.shm is not None:
+                frame = self.shm.poll()
+                if frame is None:
+                    return
             else:
-                # Read the buffer and return in if something arrived
-                self.radio.read(buf, self.radio.getDynamicPayloadSize())
-                print("\n-Receiving-\n")
-                print(buf)
-                self.radio.stopListening()
-                return 1, buf
+                if not select.select([self.rx_socket], [], [], 0)[0]:
+                    return
+                frame = self.recvUDP()
+                if frame is None:
+                    continue
+            src, start, data, accepted = frame
+            self.channelRX.push(src, start, data, accepted)
+
+    # Takes one datagram off the RX socket. Returns (source team, time on air,
+    # payload, accepted), where accepted is False for addresses this radio does
+    # not listen on, or None for our own frames. The source and time are None
+    # when the frame does not carry them
+    def recvUDP(self):
+        length = self.rx_socket.recv_into(self.rx_buffer)
+        offset = 0
+        src = start = None
+        accepted = True
+        if self.udpBackend == UDP_MULTICAST:
+            if length <= UDP_HEADER_SIZE or self.rx_buffer[0] == self.teamID:
+                return None
+            src = self.rx_buffer[0]
+            accepted = self.rx_buffer[1] in self.rxAddresses
+            offset = UDP_HEADER_SIZE
+        if self.channel is not None:
+            src, start = CHANNEL_HEADER.unpack_from(self.rx_buffer, offset)
+            offset += CHANNEL_HEADER.size
+        return src, start, list(self.rx_buffer[offset:length]), accepted
+
+    # Throws away the frames received but not read yet. Returns how many
+    def discardPending(self):
+        discarded = len(self.pending)
+        self.pending.clear()
+        if self.receiver is not None:
+            with self.rxReady:
+                discarded += len(self.rxQueue)
+                self.rxQueue.clear()
+            return discarded
+        if self.UDP:
+            if self.shm is not None:
+                discarded += self.shm.discard()
+            else:
+                while select.select([self.rx_socket], [], [], 0)[0]:
+                    self.rx_socket.recv_into(self.rx_buffer)
+                    discarded += 1
+            if self.channelRX is not None:
+                discarded += len(self.channelRX.air)
+                self.channelRX.clear()
+        else:
+            for pipe, buf, status in self.radio.read_all():
+                discarded += 1
+        return discarded
+
+    def close(self):
+        self.stopReceiver()
+        if not self.UDP:
+            self.radio.end()
+        elif self.shm is not None:
+            self.shm.close()
+        elif self.rx:
+            self.rx_socket.close()
+        else:
+            self.tx_socket.close()
+
+    # Keeps the radio receiving on a thread of its own, so frames that come in
+    # while nobody is in read() (writing to disk, sleeping) are not lost. The
+    # thread drains the radio into a queue of up to queueSize frames, dropping
+    # the oldest when it is full, and read() and readFrame() take them from
+    # there. In ESB mode it keeps the ACK payload loaded
+    def startReceiver(self, queueSize=RX_QUEUE_SIZE):
+        if self.receiver is not None:
+            return
+        self.rxQueueSize = queueSize
+        self.receiverStop.clear()
+        self.receiver = threading.Thread(target=self._receiveLoop, name="radio-rx-{}".format(self.teamID))
+        self.receiver.daemon = True
+        self.receiver.start()
 
-    def write(self, buf):
-        print("Sending packet of len {} with header {:08b}".format(len(buf), buf[0]))
+    def stopReceiver(self):
+        if self.receiver is None:
+            return
+        self.receiverStop.set()
+        self.receiver.join()
+        self.receiver = None
+
+    # Queue depth, frames received and dropped on overflow by the receiver thread
+    def receiverReport(self, reset=True):
+        with self.rxReady:
+            report = dict(self.rxStats, depth=len(self.rxQueue))
+            if reset:
+                self.rxStats = {'frames': 0, 'overflows': 0, 'maxDepth': len(self.rxQueue)}
+        return report
+
+    def _queueFrame(self, frame):
+        with self.rxReady:
+            if len(self.rxQueue) >= self.rxQueueSize:
+                self.rxQueue.popleft()
+                self.rxStats['overflows'] += 1
+            self.rxQueue.append(frame)
+            self.rxStats['frames'] += 1
+            self.rxStats['maxDepth'] = max(self.rxStats['maxDepth'], len(self.rxQueue))
+            self.rxReady.notify()
+
+    def _receiveLoop(self):
         if self.UDP:
-            buf = [chr(item) for item in buf]
+            while not self.receiverStop.is_set():
+                result, buf = self.readUDP(RX_POLL_TIMEOUT)
+                if result == 1:
+                    self._queueFrame(Frame(monotonic(), None, None, None, bytes(bytearray(buf))))
+            return
+
+        # Listen once for the whole run, as stopListening() flushes the RX FIFO
+        nrf = self.radio
+        with self.lock:
+            if not nrf.listening:
+                nrf.startListening()
+        try:
+            while not self.receiverStop.is_set():
+                with self.lock:
+                    self.armAckPayload()
+                if self.irqPin is not None:
+                    # The IRQ line is no SPI, sleep on it without the lock
+                    nrf.irqWait(RX_POLL_TIMEOUT)
+                with self.lock:
+                    received = nrf.available([0])
+                    frames = self.drain() if received else []
+                if not received:
+                    if self.irqPin is None:
+                        time.sleep(RX_POLL_INTERVAL)
+                    continue
+
+                for frame in frames:
+                    self._queueFrame(frame)
+        finally:
+            if not self.persistent:
+                with self.lock:
+                    nrf.stopListening()
+                self.armedAckPayload = None
+
+    # dest is the team the frame is for, None broadcasts it. It only matters in
+    # addressing mode, otherwise every frame goes to everybody.
+    # In ESB mode returns the ACK payload (a list, empty for a bare ACK) once
+    # dest's radio acknowledged the frame. Otherwise, or if it did not, None
+    def write(self, buf, dest=None):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending packet of len %d with header %s: %s", len(buf), format(buf[0], "08b"), list(buf))
+        if self.UDP:
+            remaining = self.sendUDP(buf, dest)
+            if remaining > 0:
+                time.sleep(remaining)
+        else:
+            if not self.persistent:
+                self.radio.stopListening()
+            if self.addressing:
+                self.setDestination(dest)
+            if self.senseRadio is not None:
+                self.waitClearChannel()
+            sent = self.radio.write(buf, no_ack=self.esb and dest is None)
+            if not sent and self.persistent:
+                # Nothing flushes the TX FIFO before the next frame, so do not
+                # leave one that never went out in it
+                self.radio.flush_tx()
+            if not self.esb or dest is None or not sent:
+                return None
+            ack = []
+            if self.radio.isAckPayloadAvailable():
+                frames = self.radio.read_all()
+                if frames:
+                    ack = list(frames[-1][1])
+            return ack
+
+    # Puts buf on the UDP "air" without waiting. Returns how many seconds the
+    # channel model keeps the radio busy with it, 0 without one
+    def sendUDP(self, buf, dest=None):
+        if self.shm is not None:
+            startTime = time.time()
+            address = teamAddress(dest) if self.addressing and dest is not None else BROADCAST_ADDRESS
+            self.shm.send(address[-1], startTime if self.channel is not None else None, buf)
+            if self.channel is None:
+                return 0
+            return startTime + self.channel.airtime(len(buf)) - time.time()
+
+        frame = bytearray()
+        if self.udpBackend == UDP_MULTICAST:
+            address = teamAddress(dest) if self.addressing and dest is not None else BROADCAST_ADDRESS
+            frame.extend((self.teamID, address[-1]))
+        if self.channel is not None:
+            startTime = time.time()
+            frame.extend(CHANNEL_HEADER.pack(self.teamID, startTime))
+        frame.extend(buf)
+
+        if self.udpBackend == UDP_MULTICAST:
+            self.tx_socket.sendto(frame, (UDP_MCAST_GROUP, UDP_MCAST_PORT))
+        elif self.addressing and dest is not None:
+            self.tx_socket.sendto(frame, (self.UDP_IP, 5005 + dest))
+        else:
             for tx_port in self.tx_UDP_ports:
-                self.tx_socket.sendto("".join(buf), (self.UDP_IP, tx_port))
+                self.tx_socket.sendto(frame, (self.UDP_IP, tx_port))
+
+        if self.channel is None:
+            return 0
+        # Like the radio, busy until the frame is out
+        return startTime + self.channel.airtime(len(buf)) - time.time()
+
+    # ESB mode: buf goes back to the next sender with the ACK of its frame
+    def setAckPayload(self, buf):
+        self.ackPayload = list(buf)
+
+    # Points the TX address at dest (None for broadcast). Only the address
+    # registers that change are written, so this costs nothing while the
+    # destination stays the same
+    def setDestination(self, dest):
+        from lib_nrf24 import RadioProfile
+
+        address = BROADCAST_ADDRESS if dest is None else teamAddress(dest)
+        if address != self.txAddress:
+            self.radio.apply(RadioProfile(tx_address=address))
+            self.txAddress = address
+
+    # Sends several frames back to back. Returns a list with True for every frame
+    # the radio reported as sent. All frames go to the same dest, see write()
+    def writeBurst(self, frames, dest=None):
+        if self.UDP:
+            for buf in frames:
+                self.write(buf, dest)
+            return [True] * len(frames)
         else:
-            self.radio.stopListening()
-            print("\n-Sending-\n")            
-            print(buf)
-            self.radio.write(buf)
+            if not self.persistent:
+                self.radio.stopListening()
+            if self.addressing:
+                self.setDestination(dest)
+            logger.debug("Sending burst of %d frames", len(frames))
+            if self.senseRadio is not None:
+                self.waitClearChannel()
+            return self.radio.write_burst(frames, no_ack=self.esb and dest is None)
+
+    # Listen before talk: before every write, sense the channel on senseRadio
+    # (the RX radio, this one cannot listen while it is in TX mode) and back off
+    # while it is busy. Nothing to sense in UDP mode
+    def enableCSMA(self, senseRadio, slot=CSMA_SLOT, minWindow=CSMA_MIN_WINDOW, maxWindow=CSMA_MAX_WINDOW,
+                   maxBackoffs=CSMA_MAX_BACKOFFS):
+        if self.UDP or senseRadio.UDP:
+            return
+        self.senseRadio = senseRadio
+        self.csmaSlot = slot
+        self.csmaWindow = (minWindow, maxWindow)
+        self.csmaMaxBackoffs = maxBackoffs
+
+    def disableCSMA(self):
+        self.senseRadio = None
+
+    # True while something above -64 dBm is on the channel (RPD)
+    # A listening radio has a live RPD until a frame comes in, so it is read as
+    # it is. senseCarrier() restarts RX (CE low and high), which drops a frame
+    # that is coming in, so only when a received frame may have latched RPD
+    def channelBusy(self):
+        if self.UDP:
+            return False
+        with self.lock:
+            if self.radio.listening and not self.rpdLatched:
+                return self.radio.testRPD() == 1
+            self.rpdLatched = False
+            return self.radio.senseCarrier()
+
+    # Returns True once the channel is clear, False if it gave up after
+    # csmaMaxBackoffs and the frame has to go out on a busy channel
+    def waitClearChannel(self):
+        stats = self.csmaStats
+        stats['writes'] += 1
+        window, maxWindow = self.csmaWindow
+        backoffs = 0
+        while self.senseRadio.channelBusy():
+            stats['busy'] += 1
+            if backoffs == self.csmaMaxBackoffs:
+                stats['forced'] += 1
+                return False
+            delay = random.randint(1, window) * self.csmaSlot
+            time.sleep(delay)
+            stats['backoff'] += delay
+            window = min(window * 2, maxWindow)
+            backoffs += 1
+        return True
+
+    # Busy channel statistics since the last call, None without CSMA
+    def csmaReport(self, reset=True):
+        if self.senseRadio is None:
+            return None
+        report = dict(self.csmaStats)
+        if reset:
+            self.csmaStats = {'writes': 0, 'busy': 0, 'forced': 0, 'backoff': 0.0}
+        return report
+
+    # SPI profiling of the nRF24 driver, see lib_nrf24.SpiProfiler.
+    # There is no SPI in UDP mode, so these do nothing there.
+    def enableProfiling(self):
+        if not self.UDP:
+            return self.radio.enable_profiling()
+
+    def disableProfiling(self):
+        if not self.UDP:
+            return self.radio.disable_profiling()
+
+    # Returns the counters gathered since the last reset, or None if profiling is off
+    def profileSnapshot(self, reset=True):
+        if not self.UDP and self.radio.profiler is not None:
+            return self.radio.profiler.snapshot(reset)
+        return None
+
+    # Jitter of the airtime TX wait since the last call (None in UDP mode)
+    def txWaitReport(self, reset=True):
+        if self.UDP:
+            return None
+        report = self.radio.tx_wait_stats.report()
+        if reset:
+            self.radio.tx_wait_stats.reset()
+        return report
@@ -0,0 +1,279 @@
+import os
+import errno
+import select
+import struct
+import tempfile
+import time
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+# Shared memory backend of the radio emulation (radio.UDP_SHM, Python 3.8+).
+# Every node (team) on the host writes its frames to a ring of its own, as a
+# radio puts them on air. Every receiver follows every other ring with its own
+# cursor and drops the addresses its pipes would not take, so a write costs the
+# same for 4 or 32 nodes and nothing goes through the network stack.
+#
+# Rings are seqlocked: a slot holds 2n + 1 while frame n is written into it and
+# 2n + 2 once it is done, and the head only moves on after that. A receiver that
+# falls behind by more than a ring finds a newer sequence in the slot, counts
+# the frames as overrun and carries on from the oldest one still there.
+#
+# A receiver that has nothing to read raises its waiting flag (in a segment of
+# its own) and sleeps on a named pipe, its doorbell. Writers only ring the
+# doorbells of nodes that are waiting, like a futex wake, so a busy network
+# costs no system calls on the write side.
+#
+# Segments are named after the team, so one emulation runs per host at a time.
+# Restart all nodes together: a node that comes back gets a fresh ring, which
+# the others do not see.
+
+SHM_PREFIX = "mtp_radio"
+# Frames per ring. 1024 frames take 1.3 s of air at 250 kbps
+SHM_SLOTS = 1024
+# How often a receiver looks for rings of nodes that were not up yet
+SHM_ATTACH_INTERVAL = 0.5
+
+_HEAD = struct.Struct("<Q")
+_WAITING = struct.Struct("<I")
+_SEQ = struct.Struct("<Q")
+# Time on air (for the channel model), last address byte, length, payload
+_BODY = struct.Struct("<dBB32s")
+_SLOT_SIZE = _SEQ.size + _BODY.size
+
+# Segments created by this process (several nodes can share one)
+_created = set()
+
+
+def _ringName(teamID):
+    return "{}_tx_{}".format(SHM_PREFIX, teamID)
+
+
+def _waitingName(teamID):
+    return "{}_rx_{}".format(SHM_PREFIX, teamID)
+
+
+def _doorbellPath(teamID):
+    return os.path.join(tempfile.gettempdir(), "{}_{}.bell".format(SHM_PREFIX, teamID))
+
+
+def _create(name, size):
+    try:
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # Left over from a run that did not close
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _created.add(name)
+    return segment
+
+
+def _unlink(segment, name):
+    segment.close()
+    segment.unlink()
+    _created.discard(name)
+
+
+# Maps a segment of another node, or returns None if it does not exist yet
+def _attach(name):
+    try:
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+    # Before Python 3.13 every process that maps a segment unlinks it at exit,
+    # only its creator should
+    if name not in _created:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def _check():
+    if shared_memory is None:
+        raise RuntimeError("The shared memory backend needs Python 3.8 or newer")
+
+
+class ShmTransmitter(object):
+
+    def __init__(self, teamID, networkSize, slots=SHM_SLOTS):
+        _check()
+        self.teamID = teamID
+        self.networkSize = networkSize
+        self.slots = slots
+        self.segment = _create(_ringName(teamID), _HEAD.size + slots * _SLOT_SIZE)
+        self.buf = self.segment.buf
+        self.head = 0
+        _HEAD.pack_into(self.buf, 0, 0)
+        # Waiting flag and doorbell of every other node, once they are up
+        self.waiting = {}
+        self.doorbells = {}
+        self.attachedAt = 0
+
+    def send(self, address, start, payload):
+        n = self.head
+        offset = _HEAD.size + (n % self.slots) * _SLOT_SIZE
+        _SEQ.pack_into(self.buf, offset, 2 * n + 1)
+        _BODY.pack_into(self.buf, offset + _SEQ.size, start or 0.0, address, len(payload), bytes(bytearray(payload)))
+        _SEQ.pack_into(self.buf, offset, 2 * n + 2)
+        self.head = n + 1
+        _HEAD.pack_into(self.buf, 0, self.head)
+        self.wake()
+
+    # Rings the doorbell of every node that waits for a frame
+    def wake(self):
+        if len(self.waiting) < self.networkSize - 1 and time.time() - self.attachedAt > SHM_ATTACH_INTERVAL:
+            self.attach()
+        for teamID, segment in self.waiting.items():
+            if not _WAITING.unpack_from(segment.buf, 0)[0]:
+                continue
+            fd = self.doorbells.get(teamID)
+            if fd is None:
+                try:
+                    fd = self.doorbells[teamID] = os.open(_doorbellPath(teamID), os.O_WRONLY | os.O_NONBLOCK)
+                except OSError:
+                    continue
+            try:
+                os.write(fd, b"\0")
+            except OSError as e:
+                # A full doorbell is rung already
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def attach(self):
+        self.attachedAt = time.time()
+        for teamID in range(self.networkSize):
+            if teamID != self.teamID and teamID not in self.waiting:
+                segment = _attach(_waitingName(teamID))
+                if segment is not None:
+                    self.waiting[teamID] = segment
+
+    def close(self):
+        for fd in self.doorbells.values():
+            os.close(fd)
+        for segment in self.waiting.values():
+            segment.close()
+        self.doorbells = {}
+        self.waiting = {}
+        self.buf = None
+        _unlink(self.segment, _ringName(self.teamID))
+
+
+class ShmReceiver(object):
+    # addresses are the last address bytes this node takes, see radio.Radio
+
+    def __init__(self, teamID, networkSize, addresses, slots=SHM_SLOTS):
+        _check()
+        self.teamID = teamID
+        self.networkSize = networkSize
+        self.addresses = addresses
+        self.slots = slots
+        self.waiting = _create(_waitingName(teamID), _WAITING.size)
+        _WAITING.pack_into(self.waiting.buf, 0, 0)
+
+        self.doorbellPath = _doorbellPath(teamID)
+        if os.path.exists(self.doorbellPath):
+            os.unlink(self.doorbellPath)
+        os.mkfifo(self.doorbellPath)
+        # Read and write, so the pipe never sees all writers gone (which would
+        # keep it readable for good)
+        self.doorbell = os.open(self.doorbellPath, os.O_RDWR | os.O_NONBLOCK)
+
+        # Rings of the other nodes, as [segment, cursor], once they are up
+        self.rings = {}
+        self.order = []
+        self.next = 0
+        self.attachedAt = 0
+        self.overruns = 0
+        self.attach()
+
+    def attach(self):
+        self.attachedAt = time.time()
+        for teamID in range(self.networkSize):
+            if teamID != self.teamID and teamID not in self.rings:
+                segment = _attach(_ringName(teamID))
+                if segment is not None:
+                    # Frames sent before we came up are not ours
+                    self.rings[teamID] = [segment, _HEAD.unpack_from(segment.buf, 0)[0]]
+        self.order = sorted(self.rings)
+
+    # The next frame from any ring, taking the rings in turn, as
+    # (source team, time on air, payload, accepted). None if there is none
+    def poll(self):
+        if len(self.rings) < self.networkSize - 1 and time.time() - self.attachedAt > SHM_ATTACH_INTERVAL:
+            self.attach()
+        for i in range(len(self.order)):
+            teamID = self.order[(self.next + i) % len(self.order)]
+            frame = self.take(teamID)
+            if frame is not None:
+                self.next = (self.next + i + 1) % len(self.order)
+                return frame
+        return None
+
+    def take(self, teamID):
+        ring = self.rings[teamID]
+        buf = ring[0].buf
+        while True:
+            head = _HEAD.unpack_from(buf, 0)[0]
+            cursor = ring[1]
+            if cursor >= head:
+                return None
+            if head - cursor > self.slots:
+                # Lapped: the oldest frames are gone already
+                self.overruns += head - self.slots - cursor
+                ring[1] = cursor = head - self.slots
+            offset = _HEAD.size + (cursor % self.slots) * _SLOT_SIZE
+            expected = 2 * cursor + 2
+            if _SEQ.unpack_from(buf, offset)[0] == expected:
+                start, address, length, payload = _BODY.unpack_from(buf, offset + _SEQ.size)
+                if _SEQ.unpack_from(buf, offset)[0] == expected:
+                    ring[1] = cursor + 1
+                    return teamID, start or None, list(bytearray(payload[:length])), address in self.addresses
+            # Overwritten while we looked, try again from the new head
+            self.overruns += 1
+            ring[1] = cursor + 1
+
+    # Like poll(), but waits up to timeout seconds for a frame. Can return None
+    # before that
+    def receive(self, timeout):
+        frame = self.poll()
+        if frame is not None or timeout <= 0:
+            return frame
+        _WAITING.pack_into(self.waiting.buf, 0, 1)
+        try:
+            # A frame written before the flag was up rang no doorbell
+            frame = self.poll()
+            if frame is not None:
+                return frame
+            if select.select([self.doorbell], [], [], timeout)[0]:
+                try:
+                    os.read(self.doorbell, 4096)
+                except OSError as e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+        finally:
+            _WAITING.pack_into(self.waiting.buf, 0, 0)
+        return self.poll()
+
+    # Skips every frame not read yet. Returns how many
+    def discard(self):
+        discarded = 0
+        for ring in self.rings.values():
+            head = _HEAD.unpack_from(ring[0].buf, 0)[0]
+            discarded += head - ring[1]
+            ring[1] = head
+        return discarded
+
+    def close(self):
+        for ring in self.rings.values():
+            ring[0].close()
+        self.rings = {}
+        self.order = []
+        os.close(self.doorbell)
+        os.unlink(self.doorbellPath)
+        _unlink(self.waiting, _waitingName(self.teamID))
@@ -1,22 +1,70 @@
 import radio
 import packet
+import log
+from lib_nrf24 import SpiProfiler
+from duplex import DuplexEngine
 from FileClass import FileClass
+import random
 import time
 import os
 
+try:
+    input = raw_input
+except NameError:
+    pass
+
+# Pause before the data for each receiver (before the dilation factor)
+DATA_GAP = 0.005
+# Time to send one more data frame (before the dilation factor). The data
+# phase grows by this for every frame of a window after the first
+WINDOW_FRAME_TIME = 0.002
+
 
 class Team(object):
 
-    def __init__(self, teamID, UDP=False, dilationFactor=1, networkSize=4):
+    def __init__(self, teamID, UDP=False, dilationFactor=1, networkSize=4, irqPinRX=None, profile=False,
+                 addressing=False, esb=False, duplex=False, csma=False, udpBackend=radio.UDP_UNICAST,
+                 channel=None, pins=None, rxThread=False, persistent=False, window=1, txWait="poll"):
         self.teamID = teamID
+        self.logger = log.getLogger("team.{}".format(teamID))
+        # ESB data frames are acknowledged by the radios, with the receiver's
+        # counters in the ACK payload. UDP has no radios and keeps the ACK bits in
+        # the control frames. ESB relies on the per-team addresses
+        self.esb = esb and not UDP
+        addressing = addressing or self.esb
         self.nextPlayer = False
         self.waitingControl = True
         self.finishedCounter = 0
+        # When every file was through, see checkFinished()
+        self.completedAt = None
+        # Frames through read() and write(), for the launcher's report
+        self.framesSent = 0
+        self.framesReceived = 0
 
         self.networkSize = networkSize
         self.dilationFactor = dilationFactor
-        self.tData = (0.005*3 + 0.005)*self.dilationFactor
+        # Data frames per receiver and turn. With more than one the receivers
+        # acknowledge them selectively in their control frames (ESB has its
+        # hardware ACKs for every frame instead). Every team needs the same
+        # window, it sets how long the data phase lasts
+        if not 1 <= window <= packet.WINDOW_MAX:
+            raise ValueError("window must be between 1 and {}".format(packet.WINDOW_MAX))
+        self.window = window
+        self.sack = window > 1 and not self.esb
+        if window == 1:
+            # One frame per receiver keeps the data phase it always had
+            self.tData = (DATA_GAP*3 + 0.005)*self.dilationFactor
+        else:
+            receivers = self.networkSize - 1
+            self.tData = (DATA_GAP*receivers + 0.005 + WINDOW_FRAME_TIME*(window - 1)*receivers)*self.dilationFactor
         self.tACK = 0.04*self.dilationFactor
+        # Receivers answer a control frame after ackDelay, later the higher their
+        # ID so their ACKs do not collide, and listen for data from tListen on
+        self.ackDelay = float(self.teamID)/100 + 0.001*self.dilationFactor
+        self.tListen = self.tACK - 0.00025*self.dilationFactor
+        # The control frame that started the last turn of each team and when,
+        # see newTurn()
+        self.lastControl = {}
 
         self.savingFiles = [0]*self.networkSize
         self.senderFiles = [0]*self.networkSize
@@ -28,130 +76,339 @@ class Team(object):
                 senderFilePath = os.path.join(senderFolder, os.listdir(senderFolder)[0])
                 self.senderFiles[i] = FileClass(reader=True, path=senderFilePath)
 
-        self.pipeRX = [0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
-        self.pipeTX = [0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
+        if addressing:
+            # Own address on pipe 1 and broadcast on pipe 2. Pipe 0 is open after
+            # reset and would take broadcast frames as well, so close it
+            self.pipeRX = {0: None, 1: radio.teamAddress(self.teamID), 2: radio.BROADCAST_ADDRESS}
+            self.pipeTX = radio.BROADCAST_ADDRESS
+        else:
+            self.pipeRX = [0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
+            self.pipeTX = [0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
+
+        # pins is ([CS TX, CE TX], [CS RX, CE RX]). The UDP emulation has no
+        # pins, so it does not ask and several teams can share one process
+        if pins is None:
+            if UDP:
+                pins = ([0, 0], [0, 0])
+            else:
+                pinTX = int(input("In which GPIO port did you connect the CE TX?"))
+                pinValTx = int(input("Value to set CS TX?"))
+                pinRX = int(input("In which GPIO port did you connect the CE RX?"))
+                pinValRx = int(input("Value to set CS RX?"))
+                pins = ([pinValTx, pinTX], [pinValRx, pinRX])
+
+        # pins = ([0, 27], [1, 17])
+
+        # Only the TX radio writes, so only it takes the TX wait (see radio.Radio)
+        self.radioTX = radio.Radio(self.pipeTX, rx=False, pins=list(pins[0]), teamID=self.teamID, UDP=UDP,
+                                   txWait=txWait, addressing=addressing, esb=self.esb, udpBackend=udpBackend,
+                                   networkSize=self.networkSize, channel=channel, persistent=persistent)
+        self.radioRX = radio.Radio(self.pipeRX, rx=True, pins=list(pins[1]), teamID=self.teamID, UDP=UDP,
+                                   irqPin=irqPinRX, addressing=addressing, esb=self.esb, udpBackend=udpBackend,
+                                   networkSize=self.networkSize, channel=channel, persistent=persistent)
+        if csma:
+            # Sense the channel on the RX radio before sending
+            self.radioTX.enableCSMA(self.radioRX)
+
+        self.profile = profile
+        if profile:
+            self.radioTX.enableProfiling()
+            self.radioRX.enableProfiling()
+
+        if rxThread:
+            # Keep receiving between reads, see Radio.startReceiver()
+            self.radioRX.startReceiver()
+
+        # Keeps the RX radio listening while we transmit, see DuplexEngine
+        self.engine = None
+        if duplex:
+            self.engine = DuplexEngine(self.radioTX, self.radioRX)
+            self.engine.start()
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+        self.radioTX.close()
+        self.radioRX.close()
+
+    # Reads and writes go through the duplex engine when there is one
+    def read(self, timeout):
+        if self.engine is not None:
+            result = self.engine.receive(timeout)
+        else:
+            result = self.radioRX.read(timeout)
+        self.framesReceived += result[0]
+        return result
+
+    def write(self, buf, dest=None):
+        self.framesSent += 1
+        if self.engine is not None:
+            return self.engine.send(buf, dest).wait()
+        return self.radioTX.write(buf, dest)
+
+    # Several frames to the same dest, back to back, see Radio.writeBurst()
+    def writeBurst(self, frames, dest=None):
+        self.framesSent += len(frames)
+        if self.engine is not None:
+            requests = [self.engine.send(buf, dest) for buf in frames]
+            for request in requests:
+                request.wait()
+            return [True] * len(frames)
+        return self.radioTX.writeBurst(frames, dest)
 
-        pinTX = int(raw_input("In which GPIO port did you connect the CE TX?"))
-        pinValTx = int(raw_input("Value to set CS TX?"))
-        pinRX = int(raw_input("In which GPIO port did you connect the CE RX?"))
-        pinValRx = int(raw_input("Value to set CS RX?"))
+    # ACKs for our data in the control frame of sender: the ACK bit, or the
+    # selective ACK with windows
+    def controlACK(self, controlPacket, sender, ack):
+        if self.sack:
+            sack = packet.getSACK(controlPacket, self.teamID, self.networkSize)
+            if sack is not None:
+                self.senderFiles[sender].receivedSACK(*sack)
+        elif ack == 1 and not self.esb:
+            self.senderFiles[sender].receivedACK()
 
-        # pinTX = 27
-        # pinRX = 17
+    # The frames of one turn for team i, as (payload, counter): the window of
+    # packets it does not have yet. ESB moves on with every hardware ACK, so
+    # there this is the next one only
+    def nextFrames(self, i):
+        if self.sack:
+            return self.senderFiles[i].getWindow(self.window)
+        return [self.senderFiles[i].getNextPayload()]
 
-        self.radioTX = radio.Radio(self.pipeTX, rx=False, pins=[pinValTx, pinTX], teamID=self.teamID, UDP=UDP)
-        self.radioRX = radio.Radio(self.pipeRX, rx=True, pins=[pinValRx, pinRX], teamID=self.teamID, UDP=UDP)
+    # The protocol decisions, shared with aio.AsyncTeam: the methods below only
+    # add the waits around them
+
+    # waitControl() timeouts of the main loop: long before the first turn, so
+    # that somebody starts, and after a turn as receiver or as sender
+    def firstTimeout(self):
+        return random.uniform(5, 10)
+
+    def receiverTimeout(self):
+        return (0.05 + random.uniform(0, 0.01))*self.dilationFactor
+
+    def senderTimeout(self):
+        return (0.1 + random.uniform(0, 0.02))*self.dilationFactor
+
+    # Wait before sending our control frame, so the data of others is through
+    def senderWait(self, first):
+        return 0 if first else 0.001*self.dilationFactor
+
+    # Whether the control frame of sender starts a turn. The other receivers
+    # send it back as their ACK, and those copies are not a new turn: their ACKs
+    # for our data were taken with the first one. A team starts its next turn a
+    # whole turn later at the earliest
+    def newTurn(self, sender, controlPacket):
+        now = time.time()
+        last = self.lastControl.get(sender)
+        if last is not None and last[0] == list(controlPacket) and now - last[1] < self.tACK + self.tData:
+            return False
+        self.lastControl[sender] = (list(controlPacket), now)
+        return True
+
+    # A frame read while waiting for control: True if it is the control frame of
+    # another team's turn. Takes our ACKs from it and the turn if we are next
+    def takeControl(self, packet_read):
+        typ, sender, ack, nextOne = packet.isControl(packet_read, self.teamID, self.networkSize)
+        # Echoes of our own control frame (late ACKs) are not the next turn
+        if typ != 0 or sender == self.teamID or not self.newTurn(sender, packet_read):
+            return False
+        self.logger.info("Received control from team %d, next is %d", sender, nextOne)
+        if self.teamID == nextOne:
+            self.nextPlayer = True
+        self.controlACK(packet_read, sender, ack)
+        return True
+
+    def controlTimedOut(self):
+        self.logger.info("Timeout finished, sending control")
+        self.nextPlayer = True
+
+    # Our control frame, with the ACK bits of the data received since the last one
+    def nextControl(self):
+        self.logger.info("Sending control")
+        controlPacket = packet.generateControl(self.teamID, (self.teamID + 1) % self.networkSize, self.savingFiles,
+                                               self.networkSize, sack=self.sack)
+        for i in range(len(self.savingFiles)):
+            if self.savingFiles[i] != 0:
+                self.savingFiles[i].send_ack = 0
+        # When I send the control packet I am not longer the next one
+        self.nextPlayer = False
+        return controlPacket
+
+    # Receivers ACK a control frame by sending it back
+    def isACK(self, packet_read, sentPacket):
+        if packet_read[0] == sentPacket[0]:
+            self.logger.debug("ACK received")
+            return True
+        self.logger.debug("Not an ACK, still waiting")
+        return False
+
+    def acksReceived(self, ackCounter):
+        if ackCounter > 0:
+            self.logger.info("ACK OK, %d received", ackCounter)
+            return 1
+        self.logger.info("ACK KO")
+        return 0
+
+    # nextFrames() as data frames for team i, (frame, counter)
+    def dataFrames(self, i):
+        return [(packet.generateDataPacket(payload, i, counter), counter) for payload, counter in self.nextFrames(i)
+                if len(payload) > 0]
+
+    # The ESB ACK of the data frame with counter to team i. False when the turn
+    # for i is over: no ACK, or the last packet
+    def dataACK(self, i, counter, ack):
+        if ack is None or counter == 0b11111:
+            return False
+        expected = ack[self.teamID] if self.teamID < len(ack) else None
+        self.senderFiles[i].receivedHardwareACK(counter, expected)
+        return True
+
+    # ESB ACK payload: the next packet counter this team expects from each team
+    def ackState(self):
+        return [self.savingFiles[i].counter & 0xff if i != self.teamID else 0 for i in range(self.networkSize)]
+
+    def dataStarted(self):
+        if self.esb:
+            self.radioRX.setAckPayload(self.ackState())
+
+    # A frame read in the data phase: (payload, counter) if it is data for us,
+    # (None, None) otherwise
+    def takeData(self, packet_received):
+        return packet.isData(packet_received, self.teamID)
+
+    # Whether a frame read in the turn of sender ends it. Data frames do not say
+    # who sent them, so once another team sent its control frame (its turn
+    # started while we were still in this one) the data could be its own. ACKs
+    # of sender's control frame carry sender as well. The ACKs for our data in
+    # the other control frame are still taken
+    def turnOver(self, sender, packet_received):
+        typ, other, ack, _ = packet.isControl(packet_received, self.teamID, self.networkSize)
+        if typ != 0 or other == sender or other == self.teamID or not self.newTurn(other, packet_received):
+            return False
+        self.logger.info("Control from team %d, turn of team %d over", other, sender)
+        self.controlACK(packet_received, other, ack)
+        return True
+
+    def storeData(self, sender, payload, packet_counter):
+        self.savingFiles[sender].writePayload(payload, packet_counter)
+        if self.esb:
+            self.radioRX.setAckPayload(self.ackState())
+
+    def dataFinished(self, myDataReceived):
+        if myDataReceived:
+            self.logger.info("Receiving time finished, data OK")
+        else:
+            self.logger.info("Receiving time finished, data not received")
 
     def waitControl(self, timeout=None):
         startTime = time.time()
         timePassed = 0
-        print(" +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+- Waiting for control for {} seconds "
-              "+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-".format(timeout))
+        self.logger.info("Waiting for control for %.3f seconds", timeout)
         while timeout > timePassed:
-            result, packet_read = self.radioRX.read(timeout)
+            result, packet_read = self.read(timeout - timePassed)
             if result == 0:
-                print("Timeout finished, sending control")
-                self.nextPlayer = True
+                self.controlTimedOut()
                 return 0, None
-            else:
-                typ, sender, ack, nextOne = packet.isControl(packet_read, self.teamID, self.networkSize)
-                if typ == 0:
-                    print("Received control")
-                    if self.teamID == nextOne:
-                        self.nextPlayer = True
-                    if ack == 1:
-                        self.senderFiles[sender].receivedACK()
-                    return 1, packet_read
+            if self.takeControl(packet_read):
+                return 1, packet_read
             timePassed = time.time() - startTime
         return 0, None
 
     def sendControl(self):
-        print("Sending control...")
-        controlPacket = packet.generateControl(self.teamID, (self.teamID + 1) % self.networkSize, self.savingFiles,
-                                               self.networkSize)
-        self.radioTX.write(controlPacket)
-        for i in range(len(self.savingFiles)):
-            if self.savingFiles[i] != 0:
-                self.savingFiles[i].send_ack = 0
+        controlPacket = self.nextControl()
+        self.write(controlPacket)
         return controlPacket
 
     def sender(self, waitOthersData):
-        print("----------------- Now on sender mode waiting for {} seconds "
-              "----------------------------------".format(waitOthersData))
+        self.logger.info("Sender mode, waiting %.3f seconds", waitOthersData)
         time.sleep(waitOthersData)
         # Wait for ack + send data
         sentPacket = self.sendControl()
-        # When I send the control packet I am not longer the next one
-        self.nextPlayer = False
         startTime = time.time()
         if self.waitACKs(self.tACK, sentPacket) == 1:
-            print("Received ack, sending data")
+            self.logger.info("Received ACK, sending data")
             self.sendData()
         while time.time() - startTime < self.tData:
             pass
 
     def receiver(self, controlPacket):
-        print("+++++++++++++++++++++++++ Now on receiver mode ++++++++++++++++++++++++++++++++++++++++++")
+        self.logger.info("Receiver mode")
         # Send the ACK (same as control) but using a random timer beacuse of possible collisions
         startTime = time.time()
-        time.sleep(float(self.teamID)/100 + 0.001*self.dilationFactor)
-        self.radioTX.write(controlPacket)
+        time.sleep(self.ackDelay)
+        self.write(controlPacket)
         sender = packet.getSender(controlPacket[0])
-        # Wait for all the ACK time (wait tACK)
-        while time.time() - startTime < self.tACK - 0.00025*self.dilationFactor:
-            pass
-        self.receiveData(self.tData, sender)
+        # Listen through the ACK time (wait tACK) and the data phase. sender sends
+        # its data after the ACK time, but if we only got its control frame from
+        # the ACK of another receiver, the data comes in before ours is over
+        self.receiveData(self.tListen - (time.time() - startTime) + self.tData, sender)
 
     def waitACKs(self, timeout, sentPacket):
         startTime = time.time()
         ackCounter = 0
         timePassed = 0
-        print("Now waiting for ACKs.")
         while True:
-            print("Reading socket waiting for ACK...")
-            result, packet_read = self.radioRX.read(timeout - timePassed)
+            result, packet_read = self.read(timeout - timePassed)
             if result == 0:
-                if ackCounter > 0:
-                    print("ACK OK")
-                    return 1
-                print("ACK KO")
-                return 0
-            else:
-                if packet_read[0] == sentPacket[0]:
-                    ackCounter += 1
-                    print("ACK received")
-                else:
-                    print("Not ACK, continue to listen until ACKs arrive or time expires.")
+                return self.acksReceived(ackCounter)
+            if self.isACK(packet_read, sentPacket):
+                ackCounter += 1
             timePassed = time.time() - startTime
 
     def sendData(self):
-        print("Sending data...")
+        self.logger.info("Sending data")
         for i in range(self.networkSize):
             if i != self.teamID:
-                time.sleep(0.005*self.dilationFactor)
-                payload, counter = self.senderFiles[i].getNextPayload()
-                # Send the data if there is something to send
-                if len(payload) > 0:
-                    data = packet.generateDataPacket(payload, i, counter)
-                    self.radioTX.write(data)
+                time.sleep(DATA_GAP*self.dilationFactor)
+                if self.sack:
+                    self.writeBurst([data for data, _ in self.dataFrames(i)], dest=i)
+                    continue
+                for _ in range(self.window):
+                    # Send the data if there is something to send
+                    frames = self.dataFrames(i)
+                    if not frames:
+                        break
+                    data, counter = frames[0]
+                    if not self.dataACK(i, counter, self.write(data, dest=i)):
+                        break
 
     def receiveData(self, timeout, sender):
         startTime = time.time()
         timePassed = 0
         myDataReceived = False
+        self.dataStarted()
         while timeout > timePassed:
-            result, packet_received = self.radioRX.read(timeout - timePassed)
-            if result == 0:
-                if myDataReceived:
-                    print("Receiving time finished, data OK")
-                else:
-                    print("Receiving time finished, data not received!!")
-            else:
-                payload, packet_counter = packet.isData(packet_received, self.teamID)
+            result, packet_received = self.read(timeout - timePassed)
+            if result == 1:
+                if self.turnOver(sender, packet_received):
+                    break
+                payload, packet_counter = self.takeData(packet_received)
                 if payload is not None and packet_counter is not None:
                     myDataReceived = True
-                    self.savingFiles[sender].writePayload(payload, packet_counter)
+                    self.storeData(sender, payload, packet_counter)
             timePassed = time.time() - startTime
+        self.dataFinished(myDataReceived)
+
+    # Prints the SPI profile of both radios since the last call, once per round
+    def dumpProfile(self):
+        if not self.profile:
+            return
+        for name, radioObj in (("TX", self.radioTX), ("RX", self.radioRX)):
+            snap = radioObj.profileSnapshot()
+            if snap is not None:
+                print("{} radio {}".format(name, SpiProfiler.format(snap)))
+        tx = self.radioTX.txWaitReport()
+        if tx is not None and tx['frames']:
+            print("TX wait: {} frames, {} timeouts, jitter {:.1f} +- {:.1f} us, {:.1f} polls/frame".format(
+                tx['frames'], tx['timeouts'], tx['mean'] * 1e6, tx['stdev'] * 1e6, tx['polls_per_frame']))
+        if self.radioRX.receiver is not None:
+            rx = self.radioRX.receiverReport()
+            print("RX queue: {} frames, {} dropped, depth {} (max {})".format(
+                rx['frames'], rx['overflows'], rx['depth'], rx['maxDepth']))
+        csma = self.radioTX.csmaReport()
+        if csma is not None and csma['writes']:
+            print("CSMA: {} writes, channel busy {} times, {} sent anyway, {:.1f} ms backing off".format(
+                csma['writes'], csma['busy'], csma['forced'], csma['backoff'] * 1e3))
 
     def checkFinished(self):
         finished = True
@@ -162,10 +419,12 @@ class Team(object):
                 if not self.senderFiles[i].finished:
                     finished = False
         if finished:
-            print("Everybody is finished!!!! counter is: {}".format(self.finishedCounter))
+            if self.completedAt is None:
+                self.completedAt = time.time()
+            self.logger.info("Everybody is finished, counter is: %d", self.finishedCounter)
             self.finishedCounter += 1
             if self.finishedCounter > 4:
                 return True
             else:
-                print("Waiting in network for more rounds to make sure.")
+                self.logger.info("Waiting in network for more rounds to make sure")
         return False
@@ -16,7 +16,7 @@
 import sys
 import time
 import random
-from lib_nrf24 import NRF24
+from lib_nrf24 import NRF24, RadioProfile
 import RPi.GPIO as GPIO
 import spidev
 from math import *
@@ -74,41 +74,16 @@ def init_comms():
     GPIO.setup(GPIO_TX, GPIO.OUT)
     GPIO.output(GPIO_TX,1)
 
-    # Enable transceivers with CE connected to GPIO_TX (22) and GPIO_RX (23)
-    radio_Tx.begin(0, GPIO_TX)
-    radio_Rx.begin(1, GPIO_RX)
+    # Common configuration: payload size, transmission rate, power level,
+    # auto acknowledgement disabled, 16b CRC and dynamic payload size.
+    # begin() writes only the registers that differ from its defaults.
+    common = dict(payload_size=PLOAD_SIZE, data_rate=BRATE, pa_level=PWR_LVL, auto_ack=False,
+                  crc_length=NRF24.CRC_16, dynamic_payloads=True)
 
-    # Payload Size set to defined value
-    radio_Tx.setPayloadSize(PLOAD_SIZE)
-    radio_Rx.setPayloadSize(PLOAD_SIZE)
-
-    # We choose the channels to be used for one and the other transceiver
-    radio_Tx.setChannel(RF_CH)
-    radio_Rx.setChannel(RF_CH)
-
-    # Transmission Rate
-    radio_Tx.setDataRate(BRATE)
-    radio_Rx.setDataRate(BRATE)
-
-    # Configuration of the power level to be used by the transceiver
-    radio_Tx.setPALevel(PWR_LVL)
-    radio_Rx.setPALevel(PWR_LVL)
-
-    # Disabled Auto Acknowledgement
-    radio_Tx.setAutoAck(False)
-    radio_Rx.setAutoAck(False)
-
-    # Enable CRC 16b
-    radio_Tx.setCRCLength(NRF24.CRC_16)
-    radio_Tx.setCRCLength(NRF24.CRC_16)
-
-    # Dynamic payload size
-    radio_Tx.enableDynamicPayloads()
-    radio_Rx.enableDynamicPayloads()
-
-    # Open the writing and reading pipe
-    radio_Tx.openWritingPipe(PIPE_TX)
-    radio_Rx.openReadingPipe(0, PIPE_RX)
+    # Enable transceivers with CE connected to GPIO_TX (22) and GPIO_RX (23),
+    # on the channels chosen for one and the other, with the writing and reading pipe open
+    radio_Tx.begin(0, GPIO_TX, profile=RadioProfile(channel=RF_CH, tx_address=PIPE_TX, **common))
+    radio_Rx.begin(1, GPIO_RX, profile=RadioProfile(channel=RF_CH, rx_pipes={0: PIPE_RX}, **common))
 
     print("Transmitter Details #################################################################################")
     radio_Tx.printDetails()
@@ -0,0 +1,838 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Software model of the nRF24L01+ so that the radio drivers and the network
+# mode code can run (and be benchmarked) on any Linux box, without a Pi.
+#
+# The model works at the same level as the real chip: SPI commands, the
+# register map, 3-deep TX and RX FIFOs, dynamic payloads, auto-ack with
+# retransmits and ACK payloads, CRC and address matching, and CE / IRQ timing.
+# All radios attached to the same Ether share the air. A transmission takes
+# its real airtime at 250 kbps / 1 Mbps / 2 Mbps, and two transmissions that
+# overlap on the same channel destroy each other.
+#
+# Usage, with the drivers unmodified:
+#
+#     ether = Ether()
+#     pi = VirtualPi(ether)
+#     pi.attach(csn=0, ce_pin=17, irq_pin=24)
+#     radio = NRF24(pi.GPIO, pi.SpiDev())       # lib_nrf24
+#     radio.begin(0, 17, 24)
+#
+# Scripts that do "import RPi.GPIO as GPIO" / "import spidev" themselves
+# (nrf24.py, nw_mode_lib, the alternative protocol scripts) can be pointed at
+# a virtual Pi with pi.install() before they are imported.
+#
+# Simplifications: time is the host's monotonic clock, ACKs never collide,
+# packet IDs / duplicate suppression are not modelled and the chip is a "+"
+# variant: ACTIVATE is accepted and ignored, unless the radio is attached with
+# needs_activate=True, like the older chips that take no writes to FEATURE and
+# DYNPD before it.
+#
+# Run it as a script for a driver throughput benchmark over the virtual air,
+# or with --hop for the channel hop latency.
+
+import sys
+import time
+import types
+import random
+import threading
+from collections import deque
+
+# Use a monotonic clock if available to avoid unwanted side effects from clock
+# changes
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+
+# Registers
+CONFIG = 0x00
+EN_AA = 0x01
+EN_RXADDR = 0x02
+SETUP_AW = 0x03
+SETUP_RETR = 0x04
+RF_CH = 0x05
+RF_SETUP = 0x06
+STATUS = 0x07
+OBSERVE_TX = 0x08
+RPD = 0x09
+RX_ADDR_P0 = 0x0A
+RX_ADDR_P1 = 0x0B
+TX_ADDR = 0x10
+RX_PW_P0 = 0x11
+FIFO_STATUS = 0x17
+DYNPD = 0x1C
+FEATURE = 0x1D
+
+# Bits
+PWR_UP = 0x02
+PRIM_RX = 0x01
+EN_CRC = 0x08
+CRCO = 0x04
+RX_DR = 0x40
+TX_DS = 0x20
+MAX_RT = 0x10
+IRQ_FLAGS = RX_DR | TX_DS | MAX_RT
+RF_DR_LOW = 0x20
+RF_DR_HIGH = 0x08
+EN_DPL = 0x04
+EN_ACK_PAY = 0x02
+EN_DYN_ACK = 0x01
+
+# Commands
+R_REGISTER = 0x00
+W_REGISTER = 0x20
+ACTIVATE = 0x50
+R_RX_PL_WID = 0x60
+R_RX_PAYLOAD = 0x61
+W_TX_PAYLOAD = 0xA0
+W_ACK_PAYLOAD = 0xA8
+W_TX_PAYLOAD_NOACK = 0xB0
+FLUSH_TX = 0xE1
+FLUSH_RX = 0xE2
+REUSE_TX_PL = 0xE3
+NOP = 0xFF
+
+# Timing (datasheet)
+T_SETTLE = 130e-6     # Standby -> TX / RX settling (PLL lock)
+T_PD2STBY = 1.5e-3    # Power down -> standby
+ARD_STEP = 250e-6     # Auto retransmit delay step
+
+DATA_RATES = {250: 250e3, 1000: 1e6, 2000: 2e6}
+
+RESET_VALUES = {CONFIG: 0x08, EN_AA: 0x3F, EN_RXADDR: 0x03, SETUP_AW: 0x03, SETUP_RETR: 0x03,
+                RF_CH: 0x02, RF_SETUP: 0x0E, 0x0C: 0xC3, 0x0D: 0xC4, 0x0E: 0xC5, 0x0F: 0xC6,
+                0x11: 0, 0x12: 0, 0x13: 0, 0x14: 0, 0x15: 0, 0x16: 0, DYNPD: 0, FEATURE: 0}
+
+
+def airtime(payload_len, address_width=5, crc_length=2, rate_kbps=1000):
+    """ Seconds a packet spends on air: preamble, address, 9 bit packet control
+        field, payload and CRC. """
+    preamble = 2 if rate_kbps == 2000 else 1
+    bits = 8 * (preamble + address_width + payload_len + crc_length) + 9
+    return bits / DATA_RATES[rate_kbps]
+
+
+class Transmission(object):
+    """ One packet in the air. """
+    __slots__ = ('sender', 'entry', 'channel', 'rate', 'address', 'payload', 'crc', 'dpl', 'no_ack',
+                 'start', 'end', 'collided')
+
+    def __init__(self, sender, entry, start):
+        self.sender = sender
+        self.entry = entry
+        self.channel = sender.regs[RF_CH]
+        self.rate = sender.data_rate()
+        self.address = sender.tx_addr[:sender.address_width()]
+        self.payload = entry.payload
+        self.crc = sender.crc_length()
+        self.dpl = sender.dynamic_payload(0)
+        self.no_ack = entry.no_ack
+        self.start = start
+        self.end = start + airtime(len(self.payload), len(self.address), self.crc, self.rate)
+        self.collided = False
+
+
+class TxEntry(object):
+    """ One slot of the TX FIFO. ack_pipe is set for W_ACK_PAYLOAD entries. """
+    __slots__ = ('payload', 'no_ack', 'ack_pipe')
+
+    def __init__(self, payload, no_ack=False, ack_pipe=None):
+        self.payload = payload
+        self.no_ack = no_ack
+        self.ack_pipe = ack_pipe
+
+
+class Ether(object):
+    """ The shared medium. Every VirtualRadio attached to it hears every other
+        one on the same channel and data rate.
+
+        loss is an extra independent drop probability per received packet. """
+
+    def __init__(self, loss=0.0, seed=None):
+        self.radios = []
+        self.air = []
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+
+    def attach(self, radio):
+        with self.lock:
+            self.radios.append(radio)
+
+    def advance(self, now=None):
+        """ Run every radio's state machine up to now, in time order. """
+        with self.lock:
+            if now is None:
+                now = monotonic()
+            while True:
+                when, handler = None, None
+                for radio in self.radios:
+                    if radio.tx_start is not None and (when is None or radio.tx_start < when):
+                        when, handler = radio.tx_start, radio._begin_tx
+                    if radio.tx_done_at is not None and (when is None or radio.tx_done_at < when):
+                        when, handler = radio.tx_done_at, radio._end_tx
+                if when is None or when > now:
+                    break
+                handler(when)
+
+            # Anything that ended a while ago can no longer collide with anything
+            if self.air and self.air[0].end < now - 0.01:
+                self.air = [t for t in self.air if t.end >= now - 0.01]
+            return now
+
+    def transmit(self, transmission):
+        for other in self.air:
+            if other.channel == transmission.channel and other.end > transmission.start:
+                other.collided = True
+                transmission.collided = True
+        self.air.append(transmission)
+
+    def deliver(self, transmission):
+        """ Hand a finished transmission to every listening radio. Returns the
+            ACK payload (possibly empty) if some receiver acknowledged it, or
+            None if nobody did. """
+        ack = None
+        for radio in self.radios:
+            if radio is not transmission.sender:
+                result = radio._receive(transmission)
+                if result is not None:
+                    ack = result
+        return ack
+
+    def busy(self, channel, now, exclude=None):
+        """ True if something other than exclude is on air on this channel """
+        for t in self.air:
+            if t.channel == channel and t.sender is not exclude and t.start <= now <= t.end:
+                return True
+        return False
+
+
+class VirtualRadio(object):
+    """ Register level model of one nRF24L01+. """
+
+    def __init__(self, ether, name=None, needs_activate=False):
+        self.ether = ether
+        self.name = name
+        self.regs = dict(RESET_VALUES)
+        self.features_active = not needs_activate
+        self.rx_addr = [[0xE7] * 5, [0xC2] * 5]    # Pipes 0 and 1, LSB first
+        self.tx_addr = [0xE7] * 5
+        self.rx_fifo = deque()                      # (pipe, payload)
+        self.tx_fifo = deque()                      # TxEntry
+        self.flags = 0
+        self.plos = 0
+        self.arc_cnt = 0
+        self.ce = False
+        self.powered_at = None      # When the radio reached standby after PWR_UP
+        self.rx_since = None        # When the receiver became ready, None if not listening
+        self.rpd = 0
+        self.tx_armed = False       # A CE pulse was seen and one packet is owed
+        self.tx_start = None        # When the next transmission starts
+        self.tx_done_at = None      # When the transmission in progress resolves
+        self.in_flight = None       # That transmission
+        self.awaiting_ack = False   # It left the air and the ACK is still due
+        self.acked = None           # Its ACK payload, None when no ACK came back
+        self.retrying = False       # The next transmission repeats in_flight
+        self.spi_transactions = 0
+        ether.attach(self)
+
+    # Derived configuration
+    def address_width(self):
+        return max(3, (self.regs[SETUP_AW] & 0x03) + 2)
+
+    def crc_length(self):
+        config = self.regs[CONFIG]
+        if not config & EN_CRC:
+            return 0
+        return 2 if config & CRCO else 1
+
+    def data_rate(self):
+        setup = self.regs[RF_SETUP]
+        if setup & RF_DR_LOW:
+            return 250
+        if setup & RF_DR_HIGH:
+            return 2000
+        return 1000
+
+    def dynamic_payload(self, pipe):
+        return bool(self.regs[FEATURE] & EN_DPL and self.regs[DYNPD] & (1 << pipe))
+
+    def pipe_address(self, pipe):
+        width = self.address_width()
+        if pipe < 2:
+            return self.rx_addr[pipe][:width]
+        return [self.regs[RX_ADDR_P0 + pipe]] + self.rx_addr[1][1:width]
+
+    def status(self):
+        pipe = self.rx_fifo[0][0] if self.rx_fifo else 0b111
+        return self.flags | (pipe << 1) | (1 if len(self.tx_fifo) >= 3 else 0)
+
+    def fifo_status(self):
+        return ((0x20 if len(self.tx_fifo) >= 3 else 0) | (0x10 if not self.tx_fifo else 0) |
+                (0x02 if len(self.rx_fifo) >= 3 else 0) | (0x01 if not self.rx_fifo else 0))
+
+    def irq_level(self):
+        """ Level of the active low IRQ pin """
+        self.ether.advance()
+        masked = self.regs[CONFIG] & IRQ_FLAGS
+        return 0 if self.flags & IRQ_FLAGS & ~masked else 1
+
+    def set_ce(self, level):
+        with self.ether.lock:
+            now = self.ether.advance()
+            level = bool(level)
+            if level and not self.ce:
+                self.tx_armed = True
+            self.ce = level
+            self._mode_changed(now)
+
+    # SPI
+    def spi(self, data):
+        with self.ether.lock:
+            now = self.ether.advance()
+            self.spi_transactions += 1
+            data = list(data)
+            cmd = data[0]
+            out = [self.status()] + [0] * (len(data) - 1)
+
+            if cmd < W_REGISTER:
+                value = self._read_register(cmd & 0x1F, now)
+                value = value if isinstance(value, list) else [value]
+                for i in range(min(len(value), len(out) - 1)):
+                    out[i + 1] = value[i]
+            elif cmd < ACTIVATE:
+                self._write_register(cmd & 0x1F, data[1:], now)
+            elif cmd == R_RX_PL_WID:
+                if len(out) > 1:
+                    out[1] = len(self.rx_fifo[0][1]) if self.rx_fifo else 0
+            elif cmd == R_RX_PAYLOAD:
+                if self.rx_fifo:
+                    payload = self.rx_fifo.popleft()[1]
+                    for i in range(min(len(payload), len(out) - 1)):
+                        out[i + 1] = payload[i]
+            elif cmd == W_TX_PAYLOAD or (cmd == W_TX_PAYLOAD_NOACK and self.regs[FEATURE] & EN_DYN_ACK):
+                if len(self.tx_fifo) < 3:
+                    self.tx_fifo.append(TxEntry(data[1:33], no_ack=cmd == W_TX_PAYLOAD_NOACK))
+                    self._schedule_tx(now)
+            elif cmd & 0xF8 == W_ACK_PAYLOAD:
+                if len(self.tx_fifo) < 3 and self.regs[FEATURE] & EN_ACK_PAY:
+                    self.tx_fifo.append(TxEntry(data[1:33], ack_pipe=cmd & 0x07))
+            elif cmd == FLUSH_TX:
+                self.tx_fifo.clear()
+            elif cmd == FLUSH_RX:
+                self.rx_fifo.clear()
+            elif cmd == ACTIVATE:
+                if len(data) > 1 and data[1] == 0x73:
+                    self.features_active = not self.features_active
+            # REUSE_TX_PL and NOP have no modelled effect
+
+            return out
+
+    def _read_register(self, reg, now):
+        if reg == STATUS:
+            return self.status()
+        if reg == OBSERVE_TX:
+            return (self.plos << 4) | self.arc_cnt
+        if reg == RPD:
+            # Live carrier detect while listening, latched once a packet came in
+            if not self.rpd and self.rx_since is not None and now >= self.rx_since:
+                return 1 if self.ether.busy(self.regs[RF_CH], now, exclude=self) else 0
+            return self.rpd
+        if reg in (RX_ADDR_P0, RX_ADDR_P1):
+            return self.rx_addr[reg - RX_ADDR_P0][:self.address_width()]
+        if reg == TX_ADDR:
+            return self.tx_addr[:self.address_width()]
+        if reg == FIFO_STATUS:
+            return self.fifo_status()
+        return self.regs.get(reg, 0)
+
+    def _write_register(self, reg, data, now):
+        if not data:
+            return
+        if reg == STATUS:
+            self.flags &= ~(data[0] & IRQ_FLAGS)
+            self._schedule_tx(now)
+        elif reg in (RX_ADDR_P0, RX_ADDR_P1, TX_ADDR):
+            address = self.tx_addr if reg == TX_ADDR else self.rx_addr[reg - RX_ADDR_P0]
+            address[:min(len(data), 5)] = data[:5]
+        elif reg == CONFIG:
+            old = self.regs[CONFIG]
+            self.regs[CONFIG] = data[0]
+            if data[0] & PWR_UP and not old & PWR_UP:
+                self.powered_at = now + T_PD2STBY
+            elif not data[0] & PWR_UP:
+                self.powered_at = None
+                self.tx_start = None
+            self._mode_changed(now)
+        elif reg == RF_CH:
+            self.regs[RF_CH] = data[0] & 0x7F
+            self.plos = 0   # Writing RF_CH resets the lost packet counter
+            if self.rx_since is not None:
+                # The PLL has to lock on the new frequency again
+                self.rx_since = now + T_SETTLE
+        elif reg in (FEATURE, DYNPD) and not self.features_active:
+            return
+        elif reg in self.regs:
+            self.regs[reg] = data[0]
+
+    # Mode and TX state machine
+    def _mode_changed(self, now):
+        config = self.regs[CONFIG]
+        listening = self.ce and config & (PWR_UP | PRIM_RX) == (PWR_UP | PRIM_RX)
+        if listening and self.rx_since is None:
+            self.rx_since = max(now, self.powered_at) + T_SETTLE
+        elif not listening:
+            self.rx_since = None
+            self.rpd = 0
+        self._schedule_tx(now)
+
+    def _next_tx_entry(self):
+        for entry in self.tx_fifo:
+            if entry.ack_pipe is None:
+                return entry
+        return None
+
+    def _schedule_tx(self, now):
+        if self.tx_start is not None or self.tx_done_at is not None:
+            return
+        config = self.regs[CONFIG]
+        if not config & PWR_UP or config & PRIM_RX or self.flags & MAX_RT:
+            return
+        if not (self.ce or self.tx_armed) or self._next_tx_entry() is None:
+            return
+        self.tx_start = max(now, self.powered_at) + T_SETTLE
+
+    def _begin_tx(self, now):
+        self.tx_start = None
+        self.tx_armed = False
+        entry = self.in_flight.entry if self.retrying else self._next_tx_entry()
+        if not self.retrying:
+            self.arc_cnt = 0
+        self.retrying = False
+        if entry is None or entry not in self.tx_fifo:
+            self.in_flight = None
+            return
+        transmission = Transmission(self, entry, now)
+        self.ether.transmit(transmission)
+        self.in_flight = transmission
+        self.tx_done_at = transmission.end
+
+    def _expects_ack(self, transmission):
+        return self.regs[EN_AA] & 0x01 and not transmission.no_ack
+
+    def _end_tx(self, now):
+        transmission = self.in_flight
+        if not self.awaiting_ack:
+            ack = self.ether.deliver(transmission)
+            if self._expects_ack(transmission):
+                # Wait for the ACK (or for ARD to run out) before deciding
+                self.awaiting_ack = True
+                self.acked = ack
+                if ack is not None:
+                    self.tx_done_at = now + T_SETTLE + airtime(len(ack), len(transmission.address),
+                                                               transmission.crc, transmission.rate)
+                else:
+                    self.tx_done_at = now + ARD_STEP * ((self.regs[SETUP_RETR] >> 4) + 1)
+                return
+            self.acked = []
+
+        acked = self.acked
+        self.awaiting_ack = False
+        self.acked = None
+        self.tx_done_at = None
+        self.in_flight = None
+        if acked is not None:
+            if transmission.entry in self.tx_fifo:
+                self.tx_fifo.remove(transmission.entry)
+            self.flags |= TX_DS
+            if acked and len(self.rx_fifo) < 3:
+                self.rx_fifo.append((0, acked))
+                self.flags |= RX_DR
+        elif self.arc_cnt < self.regs[SETUP_RETR] & 0x0F:
+            if transmission.entry in self.tx_fifo:
+                self.arc_cnt += 1
+                self.retrying = True
+                self.in_flight = transmission
+                self.tx_start = now
+                return
+        else:
+            self.flags |= MAX_RT
+            self.plos = min(15, self.plos + 1)
+        self._schedule_tx(now)
+
+    # Receiver
+    def _receive(self, transmission):
+        """ Called by the ether when a transmission ends. Returns the ACK payload
+            if this radio acknowledges the packet, else None. """
+        if self.rx_since is None or self.rx_since > transmission.start:
+            return None
+        if self.regs[RF_CH] != transmission.channel or self.data_rate() != transmission.rate:
+            return None
+        self.rpd = 1
+        if transmission.collided or self.crc_length() != transmission.crc:
+            return None
+        if self.ether.loss and self.ether.random.random() < self.ether.loss:
+            return None
+
+        pipe = None
+        for p in range(6):
+            if self.regs[EN_RXADDR] & (1 << p) and self.pipe_address(p) == transmission.address:
+                pipe = p
+                break
+        if pipe is None:
+            return None
+
+        if self.dynamic_payload(pipe) != transmission.dpl:
+            return None
+        if not transmission.dpl and self.regs[RX_PW_P0 + pipe] != len(transmission.payload):
+            return None
+        if len(self.rx_fifo) >= 3:
+            return None    # Dropped, and not acknowledged so the sender retries
+
+        self.rx_fifo.append((pipe, list(transmission.payload)))
+        self.flags |= RX_DR
+
+        if not self.regs[EN_AA] & (1 << pipe) or transmission.no_ack:
+            return None
+        for entry in self.tx_fifo:
+            if entry.ack_pipe == pipe:
+                self.tx_fifo.remove(entry)
+                return entry.payload
+        return []
+
+
+class VirtualSpiDev(object):
+    """ Stand-in for spidev.SpiDev, talking to the radios of one VirtualPi """
+
+    def __init__(self, pi, bus=None, device=None):
+        self.pi = pi
+        self.radio = None
+        self.mode = 0
+        self.bits_per_word = 8
+        self.max_speed_hz = 10000000
+        self.cshigh = False
+        self.loop = False
+        self.lsbfirst = False
+        self.threewire = False
+        self.no_cs = False
+        self.transactions = 0
+        self.bytes = 0
+        if bus is not None:
+            self.open(bus, device)
+
+    def open(self, bus, device):
+        self.radio = self.pi.radios.get((bus, device))
+        if self.radio is None:
+            raise IOError(2, "No such file or directory: '/dev/spidev%d.%d'" % (bus, device))
+
+    def close(self):
+        self.radio = None
+
+    def xfer2(self, values, *args):
+        self.transactions += 1
+        self.bytes += len(values)
+        return self.radio.spi(values)
+
+    xfer = xfer2
+
+    def writebytes(self, values):
+        self.xfer2(values)
+
+
+class VirtualGPIO(object):
+    """ Stand-in for the RPi.GPIO module of one VirtualPi """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    RPI_REVISION = 3
+    VERSION = "virtual"
+
+    POLL_INTERVAL = 50e-6
+
+    def __init__(self, pi):
+        self.pi = pi
+        self.mode = None
+        self.levels = {}
+        self.directions = {}
+        self.pulls = {}
+        self.detectors = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def getmode(self):
+        return self.mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        for pin in channel if isinstance(channel, (list, tuple)) else [channel]:
+            self.directions[pin] = direction
+            self.pulls[pin] = pull_up_down
+            if direction == VirtualGPIO.OUT:
+                self.output(pin, self.levels.get(pin, VirtualGPIO.LOW) if initial is None else initial)
+
+    def output(self, channel, value):
+        for pin in channel if isinstance(channel, (list, tuple)) else [channel]:
+            self.levels[pin] = 1 if value else 0
+            radio = self.pi.ce_pins.get(pin)
+            if radio is not None:
+                radio.set_ce(self.levels[pin])
+
+    def input(self, channel):
+        radio = self.pi.irq_pins.get(channel)
+        if radio is not None:
+            return radio.irq_level()
+        if self.directions.get(channel) == VirtualGPIO.OUT:
+            return self.levels.get(channel, 0)
+        if channel in self.pi.inputs:
+            return self.pi.inputs[channel]
+        return 1 if self.pulls.get(channel) == VirtualGPIO.PUD_UP else 0
+
+    def _edge(self, edge, previous, level):
+        if previous == level:
+            return False
+        return edge == VirtualGPIO.BOTH or (edge == VirtualGPIO.FALLING) == (level == 0)
+
+    def wait_for_edge(self, channel, edge, bouncetime=None, timeout=None):
+        deadline = None if timeout is None else monotonic() + timeout / 1000.0
+        previous = self.input(channel)
+        while deadline is None or monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            level = self.input(channel)
+            if self._edge(edge, previous, level):
+                return channel
+            previous = level
+        return None
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        detector = {'edge': edge, 'callbacks': [callback] if callback else [], 'detected': False,
+                    'running': True}
+        self.detectors[channel] = detector
+
+        def watch():
+            previous = self.input(channel)
+            while detector['running']:
+                time.sleep(self.POLL_INTERVAL)
+                level = self.input(channel)
+                if self._edge(edge, previous, level):
+                    detector['detected'] = True
+                    for cb in list(detector['callbacks']):
+                        cb(channel)
+                previous = level
+
+        thread = threading.Thread(target=watch)
+        thread.daemon = True
+        thread.start()
+
+    def add_event_callback(self, channel, callback):
+        self.detectors[channel]['callbacks'].append(callback)
+
+    def event_detected(self, channel):
+        detector = self.detectors.get(channel)
+        if detector is None or not detector['detected']:
+            return False
+        detector['detected'] = False
+        return True
+
+    def remove_event_detect(self, channel):
+        detector = self.detectors.pop(channel, None)
+        if detector is not None:
+            detector['running'] = False
+
+    def cleanup(self, channel=None):
+        for pin in list(self.detectors) if channel is None else [channel]:
+            self.remove_event_detect(pin)
+
+
+class VirtualPi(object):
+    """ One host with its own GPIO header and SPI bus, carrying any number of
+        virtual radios. """
+
+    def __init__(self, ether, name=None):
+        self.ether = ether
+        self.name = name
+        self.radios = {}
+        self.ce_pins = {}
+        self.irq_pins = {}
+        self.inputs = {}
+        self.GPIO = VirtualGPIO(self)
+
+    def attach(self, csn, ce_pin=None, irq_pin=None, bus=0, name=None, needs_activate=False):
+        """ Wire a new radio to /dev/spidev<bus>.<csn>. Without a CE pin, CE is
+            tied high. needs_activate models a chip that ignores FEATURE and
+            DYNPD until ACTIVATE. """
+        radio = VirtualRadio(self.ether, name or "%s/spi%d.%d" % (self.name, bus, csn), needs_activate)
+        self.radios[(bus, csn)] = radio
+        if ce_pin is None:
+            radio.set_ce(1)
+        else:
+            self.ce_pins[ce_pin] = radio
+        if irq_pin is not None:
+            self.irq_pins[irq_pin] = radio
+        return radio
+
+    def set_input(self, pin, level):
+        """ Drive an input pin that is not connected to a radio (buttons...) """
+        self.inputs[pin] = level
+
+    def SpiDev(self, bus=None, device=None):
+        return VirtualSpiDev(self, bus, device)
+
+    def install(self):
+        """ Make "import RPi.GPIO" and "import spidev" resolve to this Pi """
+        rpi = types.ModuleType("RPi")
+        rpi.GPIO = self.GPIO
+        spidev = types.ModuleType("spidev")
+        spidev.SpiDev = self.SpiDev
+        sys.modules["RPi"] = rpi
+        sys.modules["RPi.GPIO"] = self.GPIO
+        sys.modules["spidev"] = spidev
+
+
+def bench(frames=1000, rate_kbps=250, burst=False):
+    """ Push frames from one lib_nrf24 radio to another over the virtual air
+        and report throughput and SPI load. """
+    from lib_nrf24 import NRF24
+
+    rates = {250: NRF24.BR_250KBPS, 1000: NRF24.BR_1MBPS, 2000: NRF24.BR_2MBPS}
+    ether = Ether()
+    tx_pi, rx_pi = VirtualPi(ether, "tx"), VirtualPi(ether, "rx")
+    tx_pi.attach(0, ce_pin=17)
+    rx_pi.attach(0, ce_pin=27)
+    pipe = [0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
+
+    radios = []
+    for pi, ce_pin in ((tx_pi, 17), (rx_pi, 27)):
+        radio = NRF24(pi.GPIO, pi.SpiDev())
+        radio.begin(0, ce_pin)
+        radio.setPayloadSize(32)
+        radio.setChannel(0x50)
+        radio.setDataRate(rates[rate_kbps])
+        radio.setPALevel(NRF24.PA_MIN)
+        radio.setCRCLength(NRF24.CRC_8)
+        radio.setAutoAck(False)
+        radio.enableDynamicPayloads()
+        radios.append(radio)
+    tx, rx = radios
+    tx.openWritingPipe(pipe)
+    rx.openReadingPipe(1, pipe)
+    rx.startListening()
+    time.sleep(T_PD2STBY + T_SETTLE)
+
+    received = [0]
+    done = threading.Event()
+
+    def receiver():
+        while not done.is_set():
+            if rx.available([0]):
+                received[0] += len(rx.read_all())
+            else:
+                time.sleep(50e-6)
+
+    thread = threading.Thread(target=receiver)
+    thread.daemon = True
+    thread.start()
+
+    payload = bytearray(range(32))
+    start = monotonic()
+    if burst:
+        sent = sum(tx.write_burst([payload] * frames))
+    else:
+        sent = sum(1 for i in range(frames) if tx.write(payload))
+    elapsed = monotonic() - start
+    time.sleep(0.01)
+    done.set()
+    thread.join()
+
+    print("%d frames of 32 B at %d kbps (%s)" % (frames, rate_kbps, "write_burst" if burst else "write"))
+    print("  sent %d, received %d in %.3f s" % (sent, received[0], elapsed))
+    print("  %.0f frames/s, goodput %.1f kbps (air limit %.1f kbps)" % (
+        sent / elapsed, sent * 32 * 8 / elapsed / 1000.0,
+        32 * 8 / (airtime(32, 5, 1, rate_kbps) + T_SETTLE) / 1000.0))
+    print("  SPI transactions per frame: tx %.1f, rx %.1f" % (
+        tx.spidev.transactions / float(frames), rx.spidev.transactions / float(frames)))
+    return sent, received[0], elapsed
+
+
+def hop_bench(hops=200):
+    """ Compare NRF24.hop() with the stopListening() / setChannel() /
+        startListening() sequence, and check that the RX FIFO survives it. """
+    from lib_nrf24 import NRF24
+
+    ether = Ether()
+    tx_pi, rx_pi = VirtualPi(ether, "tx"), VirtualPi(ether, "rx")
+    tx_pi.attach(0, ce_pin=17)
+    rx_pi.attach(0, ce_pin=27)
+    pipe = [0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
+
+    tx, rx = NRF24(tx_pi.GPIO, tx_pi.SpiDev()), NRF24(rx_pi.GPIO, rx_pi.SpiDev())
+    tx.begin(0, 17)
+    rx.begin(0, 27)
+    for radio in (tx, rx):
+        radio.setPayloadSize(32)
+        radio.setAutoAck(False)
+        radio.enableDynamicPayloads()
+        radio.setChannel(0x20)
+    tx.openWritingPipe(pipe)
+    rx.openReadingPipe(1, pipe)
+    rx.startListening()
+    time.sleep(T_PD2STBY + T_SETTLE)
+
+    def retune(name, channel):
+        if name == "hop":
+            rx.hop(channel)
+        else:
+            rx.stopListening()
+            rx.setChannel(channel)
+            rx.startListening()
+
+    channels = [0x20, 0x40, 0x60]
+    results = {}
+    for name in ("hop", "stop/start"):
+        elapsed = []
+        for i in range(hops):
+            start = monotonic()
+            retune(name, channels[(i + 1) % len(channels)])
+            elapsed.append(monotonic() - start)
+        results[name] = elapsed
+
+        # Frames received before the hop should still be readable after it
+        retune(name, 0x20)
+        tx.setChannel(0x20)
+        sent = sum(1 for i in range(2) if tx.write(bytearray([i] * 8)))
+        retune(name, 0x40)
+        kept = len(rx.read_all())
+
+        print("%-10s mean %7.1f us, max %7.1f us per hop (%d hops), RX FIFO kept %d of %d frames" % (
+            name, sum(elapsed) / len(elapsed) * 1e6, max(elapsed) * 1e6, hops, kept, sent))
+    print("(the alternative protocol scripts slept another 2 x 100 ms around stop/start)")
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="nRF24L01+ driver benchmark over the virtual air")
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--rate", type=int, default=250, choices=sorted(DATA_RATES))
+    parser.add_argument("--burst", action="store_true", help="use write_burst() instead of write()")
+    parser.add_argument("--hop", action="store_true", help="benchmark channel hops instead")
+    args = parser.parse_args()
+    if args.hop:
+        hop_bench()
+    else:
+        bench(args.frames, args.rate, args.burst)
@@ -0,0 +1,419 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Regression scenarios for the radio code of mtp_network_mode, run over the
+# virtual nRF24L01+ of virtual_nrf24.py, so no Pi is needed:
+#
+#     python virtual_scenarios.py             # all of them
+#     python virtual_scenarios.py irq_read    # some of them
+#
+# Each scenario sets up its own Ether and radios, prints one PASS / FAIL line
+# with what it measured, and the script exits with 1 if any failed. They run
+# on the host clock, so a very busy machine can make the timing ones fail.
+# The *_session ones run a whole launcher session on the UDP emulation
+# instead, and check every delivered file against the one sent.
+
+import os
+import sys
+import time
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# radio.py goes with the lib_nrf24 copy next to it
+sys.path.insert(0, os.path.join(HERE, "mtp_network_mode"))
+
+from virtual_nrf24 import Ether, VirtualPi
+
+# The radio threads poll in short sleeps, give them the GIL often enough
+if hasattr(sys, "setswitchinterval"):
+    sys.setswitchinterval(0.0002)
+
+PIPE = [0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
+# The RX radio of a team with addressing, as team.Team sets it up
+TEAM = 1
+
+
+def new_radio(pi, csn, ce_pin, rx, teamID, pipes=PIPE, **kwargs):
+    """ A radio.Radio on the chip attached to pi at csn. Its register dump
+        goes nowhere. """
+    # radio.Radio imports RPi.GPIO and spidev when it is created
+    pi.install()
+    import radio
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return radio.Radio(pipes, rx=rx, pins=[csn, ce_pin], teamID=teamID, **kwargs)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def make_radio(ether, name, rx, irq_pin=None, **kwargs):
+    """ A radio.Radio on a virtual Pi of its own, CSN 0 and CE 17. """
+    pi = VirtualPi(ether, name)
+    pi.attach(0, ce_pin=17, irq_pin=irq_pin)
+    return new_radio(pi, 0, 17, rx, TEAM if rx else 0, irqPin=irq_pin, **kwargs)
+
+
+def frame(i, size=20):
+    return bytearray([0x80 | i % 32] + [i % 256] * (size - 1))
+
+
+def send_later(tx, frames, gap, delay=0.02, dest=None, acks=None):
+    """ Writes frames gap seconds apart on a thread, after delay. With acks,
+        the write() results go there. """
+    def run():
+        time.sleep(delay)
+        for buf in frames:
+            ack = tx.write(buf, dest)
+            if acks is not None:
+                acks.append(ack)
+            time.sleep(gap)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def read_for(rx, seconds, busy=0.0):
+    """ Frames read from rx in seconds, spending busy seconds elsewhere after
+        each read() call. """
+    received = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        result, buf = rx.read(0.002)
+        if result == 1:
+            received.append(buf)
+        time.sleep(busy)
+    return received
+
+
+def rxPipes():
+    import radio
+
+    return {0: None, 1: radio.teamAddress(TEAM), 2: radio.BROADCAST_ADDRESS}
+
+
+def session(**options):
+    """ A launcher session of 3 teams on the UDP emulation, with these Team
+        options, in a scratch copy of the send files. Returns the overall
+        report, where intact means every delivered file is the one sent. """
+    import shutil
+    import tempfile
+    import launcher
+
+    source = os.path.join(HERE, "mtp_network_mode")
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        for team in range(3):
+            shutil.copytree(os.path.join(source, "sendFiles%d" % team), os.path.join(workdir, "sendFiles%d" % team))
+            for other in range(3):
+                if other != team:
+                    os.makedirs(os.path.join(workdir, "savingFiles%d" % team, "team%d" % other))
+        report = launcher.launch({'networkSize': 3, 'dilationFactor': 1, 'maxTime': 60, 'seed': 1,
+                                  'options': options, 'workdir': workdir})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+    return report['overall']
+
+
+def describe(overall):
+    return "completed %s, every file intact %s, %d B delivered" % (
+        overall['completed'], overall['intact'], overall['bytesReceived'])
+
+
+def irq_read():
+    """ read() sleeps on the IRQ edge and still gets every frame. """
+    ether = Ether()
+    rx = make_radio(ether, "rx", True, irq_pin=24)
+    tx = make_radio(ether, "tx", False)
+    sent = [frame(i) for i in range(20)]
+    thread = send_later(tx, sent, 0.003)
+    received = []
+    deadline = time.time() + 0.5
+    while len(received) < len(sent) and time.time() < deadline:
+        frameObj = rx.readFrame(0.05)
+        if frameObj is not None:
+            received.append(bytearray(frameObj.payload))
+    thread.join()
+    ok = received == sent
+    return ok, "%d/%d frames in order on the IRQ line" % (len(received), len(sent))
+
+
+def burst():
+    """ Radio.writeBurst() keeps the TX FIFO full and every frame gets through,
+        in order. """
+    ether = Ether()
+    rx = make_radio(ether, "rx", True)
+    tx = make_radio(ether, "tx", False)
+    rx.startReceiver()
+    time.sleep(0.01)
+    sent = [frame(i, 32) for i in range(30)]
+    start = time.time()
+    results = tx.writeBurst(sent)
+    elapsed = time.time() - start
+    received = []
+    while True:
+        frameObj = rx.readFrame(0.02)
+        if frameObj is None:
+            break
+        received.append(bytearray(frameObj.payload))
+    rx.stopReceiver()
+    ok = all(results) and received == sent
+    return ok, "%d/%d frames sent, %d received in order, %.1f ms" % (
+        sum(1 for r in results if r), len(sent), len(received), elapsed * 1e3)
+
+
+def activate():
+    """ NRF24.apply() writes FEATURE first, so a chip that needs ACTIVATE
+        takes DYNPD on the retry. """
+    from lib_nrf24 import NRF24, RadioProfile
+    from virtual_nrf24 import DYNPD
+
+    pi = VirtualPi(Ether(), "old")
+    chip = pi.attach(0, ce_pin=17, needs_activate=True)
+    nrf = NRF24(pi.GPIO, pi.SpiDev())
+    nrf.begin(0, 17)
+    nrf.apply(RadioProfile(dynamic_payloads=True, ack_payloads=True))
+    dynpd = chip.regs[DYNPD]
+    ok = dynpd == nrf.read_register_cached(NRF24.DYNPD) == 0x3f
+    return ok, "chip DYNPD %#x, cached %#x" % (dynpd, nrf.read_register_cached(NRF24.DYNPD))
+
+
+def esb():
+    """ ESB: write() to a team returns the ACK payload its RX radio holds, and
+        broadcast frames are not acknowledged. """
+    ether = Ether()
+    rx = make_radio(ether, "rx", True, pipes=rxPipes(), addressing=True, esb=True)
+    tx = make_radio(ether, "tx", False, pipes=rxPipes()[2], addressing=True, esb=True)
+    state = [0, 7, 0, 3]
+    rx.setAckPayload(state)
+    rx.startReceiver()
+    time.sleep(0.01)
+    acks = [tx.write(frame(i), dest=TEAM) for i in range(5)]
+    broadcast = tx.write(frame(5))
+    time.sleep(0.01)
+    received = []
+    while True:
+        frameObj = rx.readFrame(0.02)
+        if frameObj is None:
+            break
+        received.append(frameObj.pipe)
+    rx.stopReceiver()
+    ok = all(ack is not None and list(ack)[:len(state)] == state for ack in acks) and broadcast is None \
+        and received == [1] * 5 + [2]
+    return ok, "%d/5 ACK payloads, broadcast ACK %r, pipes %s" % (
+        sum(1 for ack in acks if ack is not None and list(ack)[:len(state)] == state), broadcast, received)
+
+
+def duplex_echo():
+    """ DuplexEngine drops the echo of its own frame from the RX radio, but not
+        the same frame from another team right after it. """
+    from duplex import DuplexEngine
+
+    ether = Ether()
+    pi = VirtualPi(ether, "a")
+    pi.attach(0, ce_pin=17)
+    pi.attach(1, ce_pin=27)
+    txA = new_radio(pi, 0, 17, False, 0)
+    rxA = new_radio(pi, 1, 27, True, 0)
+    txB = make_radio(ether, "b", False)
+    engine = DuplexEngine(txA, rxA)
+    engine.start()
+    time.sleep(0.05)
+    control = [0b00001000]
+    engine.send(control).wait()
+    txB.write(bytearray(control))
+    got = [engine.receive(0.05) for _ in range(2)]
+    engine.stop()
+    stats = engine.stats()
+    ok = got[0][0] == 1 and list(got[0][1]) == control and got[1][0] == 0
+    return ok, "other team's copy %s, then %s, %r" % ("received" if got[0][0] else "lost", got[1], stats)
+
+
+def duplex_session():
+    """ A whole session with the duplex engine delivers every file as sent. """
+    overall = session(duplex=True)
+    return overall['intact'], describe(overall)
+
+
+def csma_receiver():
+    """ Carrier sense on the RX radio does not cost its receiver thread frames. """
+    ether = Ether()
+    pi = VirtualPi(ether, "a")
+    pi.attach(0, ce_pin=17)
+    pi.attach(1, ce_pin=27)
+    txA = new_radio(pi, 0, 17, False, 0)
+    rxA = new_radio(pi, 1, 27, True, 0)
+    txB = make_radio(ether, "b", False)
+    txA.enableCSMA(rxA)
+    rxA.startReceiver()
+    stop = threading.Event()
+
+    def sense():
+        # As the TX side of duplex would, all the time
+        while not stop.is_set():
+            rxA.channelBusy()
+            time.sleep(0.0003)
+
+    thread = threading.Thread(target=sense)
+    thread.daemon = True
+    thread.start()
+    send_later(txB, [frame(i) for i in range(40)], 0.004).join()
+    time.sleep(0.05)
+    stop.set()
+    thread.join()
+    received = 0
+    while rxA.readFrame(0.01) is not None:
+        received += 1
+    rxA.stopReceiver()
+    return received == 40, "%d/40 frames while sensing" % received
+
+
+def receiver_thread():
+    """ The receiver thread keeps receiving while the reader spends 6 ms of
+        every 8 ms elsewhere, and counts the frames a short queue drops. """
+    results = {}
+    for threaded in (False, True):
+        ether = Ether()
+        rx = make_radio(ether, "rx", True)
+        tx = make_radio(ether, "tx", False)
+        if threaded:
+            rx.startReceiver()
+        thread = send_later(tx, [frame(i) for i in range(40)], 0.003)
+        received = read_for(rx, 0.2, busy=0.006)
+        thread.join()
+        received += read_for(rx, 0.01)
+        if threaded:
+            rx.stopReceiver()
+        results[threaded] = len(received)
+
+    # Nobody reads: the oldest frames go
+    ether = Ether()
+    rx = make_radio(ether, "rx", True)
+    tx = make_radio(ether, "tx", False)
+    rx.startReceiver(queueSize=4)
+    send_later(tx, [frame(i) for i in range(10)], 0.002, delay=0.01).join()
+    time.sleep(0.01)
+    report = rx.receiverReport()
+    first = rx.readFrame(0)
+    rx.stopReceiver()
+    ok = results[True] == 40 and report['overflows'] == 6 and report['depth'] == 4 \
+        and first is not None and bytearray(first.payload) == frame(6)
+    return ok, "%d/40 frames with the thread (%d without), queue of 4: %d overflows, depth %d" % (
+        results[True], results[False], report['overflows'], report['depth'])
+
+
+def rx_thread_session():
+    """ A whole session with the receiver thread delivers every file as sent. """
+    overall = session(rxThread=True)
+    return overall['intact'], describe(overall)
+
+
+def _persistent_run(persistent):
+    ether = Ether()
+    rx = make_radio(ether, "rx", True, pipes=rxPipes(), addressing=True, esb=True, persistent=persistent)
+    tx = make_radio(ether, "tx", False, pipes=rxPipes()[2], addressing=True, esb=True, persistent=persistent)
+    rx.setAckPayload([1, 2, 3, 4])
+    switches = [0]
+    startListening = rx.radio.startListening
+
+    def counted():
+        switches[0] += 1
+        startListening()
+
+    rx.radio.startListening = counted
+
+    # 40 frames 3 ms apart, every other one to our address with an ACK payload
+    acks = []
+    done = threading.Event()
+
+    def send():
+        time.sleep(0.02)
+        for i in range(40):
+            acks.append(tx.write(frame(i), dest=TEAM if i % 2 else None))
+            time.sleep(0.003)
+        time.sleep(0.02)
+        done.set()
+
+    thread = threading.Thread(target=send)
+    thread.daemon = True
+    thread.start()
+    received = 0
+    while not done.is_set():
+        result, _ = rx.read(0.001)
+        received += result
+        # The rest of the read cycle goes elsewhere
+        time.sleep(0.004)
+    while rx.read(0.001)[0] == 1:
+        received += 1
+    thread.join()
+    payloads = sum(1 for i, ack in enumerate(acks) if i % 2 and ack is not None)
+    return received, payloads, switches[0]
+
+
+def persistent():
+    """ Persistent listening: a reader that spends 4 ms of each cycle
+        elsewhere gets every frame and every ACK payload, with no role
+        switches after the first startListening(). """
+    before = _persistent_run(False)
+    after = _persistent_run(True)
+    received, payloads, switches = after
+    ok = received == 40 and payloads == 20 and switches <= 1
+    return ok, "%d/40 frames, %d/20 ACK payloads, %d startListening() (per-call listening: %d, %d, %d)" % (
+        after + before)
+
+
+def frames():
+    """ Frames drained together come back as records with their pipe, the
+        FIFO depth behind them and the RPD latched by the newest. """
+    ether = Ether()
+    rx = make_radio(ether, "rx", True, pipes=rxPipes(), addressing=True, persistent=True)
+    tx = make_radio(ether, "tx", False, pipes=rxPipes()[2], addressing=True)
+    time.sleep(0.01)
+    for i, dest in enumerate((TEAM, None, TEAM)):
+        tx.write(frame(i), dest)
+    time.sleep(0.005)
+    records = [rx.readFrame(0.01) for _ in range(3)]
+    if None in records:
+        return False, "%d/3 frames" % (3 - records.count(None))
+    pipes = [f.pipe for f in records]
+    depths = [f.fifoDepth for f in records]
+    rpd = [f.rpd for f in records]
+    stamps = set(f.timestamp for f in records)
+    ok = pipes == [1, 2, 1] and depths == [2, 1, 0] and rpd == [True] * 3 and len(stamps) == 1 \
+        and [bytearray(f.payload) for f in records] == [frame(i) for i in range(3)]
+    return ok, "pipes %s, depth %s, RPD %s" % (pipes, depths, rpd)
+
+
+SCENARIOS = [irq_read, burst, activate, esb, duplex_echo, duplex_session, csma_receiver, receiver_thread,
+             rx_thread_session, persistent, frames]
+
+
+def main(names):
+    scenarios = SCENARIOS
+    if names:
+        byName = dict((f.__name__, f) for f in SCENARIOS)
+        unknown = [name for name in names if name not in byName]
+        if unknown:
+            print("unknown scenario %s, pick from %s" % (", ".join(unknown), ", ".join(sorted(byName))))
+            return 2
+        scenarios = [byName[name] for name in names]
+
+    failed = 0
+    for scenario in scenarios:
+        try:
+            ok, detail = scenario()
+        except Exception as e:
+            ok, detail = False, "%s: %s" % (type(e).__name__, e)
+        print("%s %-18s %s" % ("PASS" if ok else "FAIL", scenario.__name__, detail))
+        failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))